@@ -7,14 +7,23 @@ import json
 import datetime
 import chardet
 import time
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import catalog as media_catalog
+from media_common import journal as render_journal
+from media_common import mezzanine
+from media_common import pipeline
+from media_common import tts_cache
+from media_common import http_client
+from media_common import gemini
 
 
 # Constants
 CHUNK_SIZE = 1024
 XI_API_KEY = "id_key"
 VOICE_ID = "id_key"
+GEMINI_API_KEY = "id_key"
+GEMINI_MODEL = "gemini-1.5-flash"
 
 # Folder paths
 INPUT_TEXT_FOLDER = "input_text"
@@ -27,6 +36,23 @@ FINISHED_VIDEOS_FOLDER = os.path.join(OUTPUT_FOLDER, "Finished Videos")
 PROCESSED_FOLDER = "Processed"
 WORK_TEXT_FOLDER = "work_text"  # New folder for working copies
 
+# Take the stock clips from the normalized mezzanine library (media_common.mezzanine) so they join
+# with a stream copy instead of a scale+concat re-encode. Off by default: clips not yet in the
+# library are transcoded (libx264 CRF 18) on first use.
+USE_MEZZANINE = False
+
+# main() overlaps consecutive text files: the Gemini and ElevenLabs calls for the next files run
+# while the current one renders. Threads per stage, and how many files may wait in front of each
+# stage (this bounds how far the API stages run ahead of the render).
+TEXT_WORKERS = 2
+TTS_WORKERS = 2
+RENDER_WORKERS = 1
+PIPELINE_QUEUE_SIZE = 2
+
+# API endpoints; point them at a local mock server to exercise the pipeline without the real services.
+# Gemini is redirected with GEMINI_API_ENDPOINT (or answered offline with MEDIA_GEMINI_STUB=1), see media_common.gemini.
+ELEVENLABS_API_URL = os.environ.get("ELEVENLABS_API_URL", "https://api.elevenlabs.io")
+
 # Create output folders if they don't exist
 os.makedirs(OUTPUT_TEXT_FOLDER, exist_ok=True)
 os.makedirs(GEN_AUDIO_FOLDER, exist_ok=True)
@@ -40,36 +66,21 @@ os.makedirs(WORK_TEXT_FOLDER, exist_ok=True)
 def generate_text_content(filepath, custom_prompt_file):
     """Generates text content using Gemini and saves it to a file."""
 
-    # Read custom prompt from file
-    with open(custom_prompt_file, "r", encoding='utf-8') as f:
-        custom_prompt = f.read()
-
-    # Gemini processing
-    genai.configure(api_key = "id_key")
-    model = genai.GenerativeModel('gemini-1.5-flash')
-
-    with open(filepath, "r", encoding='utf-8') as f:
-        file_content = f.read()
-    prompt = f"{file_content}\n\n{custom_prompt}"
-    response = model.generate_content(
-        prompt,
-        safety_settings={
-            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-        }
-    )
+    # Custom prompt (re-read only when the file changes) and the Gemini response, which comes
+    # from the shared response cache when this file and prompt were already sent
+    custom_prompt = gemini.read_prompt(custom_prompt_file)
+    response_text = gemini.generate_file(filepath, custom_prompt, GEMINI_MODEL, gemini.block_none())
 
     output_filename = f"[Original]-{os.path.basename(filepath)}"
     output_filepath = os.path.join(OUTPUT_TEXT_FOLDER, output_filename)
 
     with open(output_filepath, "w", encoding='utf-8') as f:
-        f.write(response.text)
+        f.write(response_text)
     print(f"Processed file: {os.path.basename(filepath)}")
 
     # Move processed file to "Processed" folder
     shutil.move(filepath, os.path.join(PROCESSED_FOLDER, output_filename))
+    return output_filepath
 
 
 # --- Audio Content Generation ---
@@ -83,7 +94,7 @@ def generate_audio_content(text_path, gen_audio_folder):
         with open(text_path, "r", encoding=encoding) as f:
             TEXT_TO_SPEAK = f.read()
 
-    tts_url = f"https://api.elevenlabs.io/v1/text-to-speech/{VOICE_ID}/stream"
+    tts_url = f"{ELEVENLABS_API_URL}/v1/text-to-speech/{VOICE_ID}/stream"
     headers = {
         "Accept": "application/json",
         "xi-api-key": XI_API_KEY
@@ -99,73 +110,44 @@ def generate_audio_content(text_path, gen_audio_folder):
         }
     }
 
-    response = requests.post(tts_url, headers=headers, json=data, stream=True)
+    output_filename = f"{os.path.splitext(os.path.basename(text_path))[0]}.mp3"
+    output_path = os.path.join(gen_audio_folder, output_filename)
 
-    if response.ok:
-        output_filename = f"{os.path.splitext(os.path.basename(text_path))[0]}.mp3"
-        output_path = os.path.join(gen_audio_folder, output_filename)
+    def synthesize(path):
+        # Pooled, rate-limited request; 429s and 5xx responses are retried with backoff
+        try:
+            http_client.default_client().download(tts_url, path, method="POST", headers=headers, json=data,
+                                                  chunk_size=CHUNK_SIZE)
+        except requests.HTTPError as e:
+            print(e.response.text)
+            return False
+        return True
 
-        with open(output_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                f.write(chunk)
+    # Text already spoken with this voice and these settings comes from the local TTS cache, unbilled
+    if tts_cache.fetch(output_path, VOICE_ID, TEXT_TO_SPEAK, synthesize, data["model_id"], data["voice_settings"]):
         print(f"Audio stream saved successfully to: {output_path}")
 
         # Move processed file to "Processed" folder
         shutil.move(text_path, os.path.join(PROCESSED_FOLDER, output_filename))
-    else:
-        print(response.text)
+        return output_path
 
 # --- Audio/Video Content Generation ---
 
 def get_file_duration(file_path):
     print(f"Getting duration for: {file_path}")
-    command = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', file_path]
     try:
-        output = subprocess.check_output(command).decode('utf-8').strip()
-        return float(output)
-    except subprocess.CalledProcessError as e:
+        return media_catalog.get_duration(file_path)
+    except (OSError, ValueError) as e:
         print(f"Error getting file duration: {e}")
         return 0.0
 
 def get_audio_stats(file_path):
-    command = ['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_name,sample_rate,channels,bit_rate,duration', '-of', 'json', file_path]
     try:
-        output = subprocess.check_output(command).decode('utf-8')
-        return output
-    except subprocess.CalledProcessError as e:
+        return media_catalog.get_streams_json(file_path)
+    except (OSError, ValueError) as e:
         print(f"Error getting audio stats: {e}")
         return "{}"
 
-def validate_audio_stream(file_path):
-    command = ['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_name,sample_rate,channels,bit_rate,duration', '-of', 'json', file_path]
-    try:
-        output = subprocess.check_output(command).decode('utf-8')
-        audio_info = json.loads(output)
-
-        if 'streams' in audio_info and len(audio_info['streams']) > 0:
-            stream = audio_info['streams'][0]
-            codec = stream['codec_name']
-            sample_rate = int(stream['sample_rate'])
-            channels = stream['channels']
-            bit_rate = stream['bit_rate']
-            duration = stream['duration']
-
-            if codec not in ['aac', 'mp3', 'flac']:
-                print(f"Invalid codec: {codec}")
-                return False
-
-            if sample_rate != 44100:
-                print(f"Invalid sample rate: {sample_rate}")
-                return False
-
-            return True
-        else:
-            print("No audio streams found in the file.")
-            return False
-    except subprocess.CalledProcessError as e:
-        print(f"Error validating audio stream: {e}")
-        return False
-
 def convert_audio_sample_rate(input_file, output_file, target_sample_rate=44100):
     """Converts the sample rate of an audio file using FFmpeg only if necessary."""
     audio_info = get_audio_stats(input_file)  # Get audio stats first
@@ -176,18 +158,19 @@ def convert_audio_sample_rate(input_file, output_file, target_sample_rate=44100)
         if current_sample_rate == target_sample_rate:
             print(f"Skipping conversion: {input_file} already has the desired sample rate.")
             shutil.copyfile(input_file, output_file)  # Copy the file if it's already correct
-            return
+            return output_file
 
     ffmpeg_command = [
         'ffmpeg',
         '-i', input_file,
         '-ar', str(target_sample_rate),
         '-c:a', 'libmp3lame',  # Use libmp3lame encoder
-        output_file
+        '-y', output_file
     ]
     print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
     try:
         subprocess.run(ffmpeg_command, check=True)
+        return output_file
     except subprocess.CalledProcessError as e:
         print(f"Error converting audio sample rate: {e}")
 
@@ -264,39 +247,50 @@ def merge_media(input_videos, input_audios, output_folder, target_duration, targ
         merged_videos = [os.path.join(output_folder, "trimmed_video.mp4")]
         merged_audios = [os.path.join(output_folder, "trimmed_audio.mp3")]
 
-    # Combine videos using ffmpeg
-    inputs = []
-    for video in merged_videos:
-        inputs.extend(['-i', video])
-
-    filter_complex_parts = []
-    for i in range(len(merged_videos)):
-        filter_complex_parts.append(f"[{i}:v]scale={target_resolution[0]}:{target_resolution[1]}[v{i}];")
-
-    concat_filter = f"concat=n={len(merged_videos)}:v=1[outv]"
-    filter_complex_parts.append("".join(f"[v{i}]" for i in range(len(merged_videos))))
-    filter_complex_parts.append(concat_filter)
-    filter_complex = "".join(filter_complex_parts)
-
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     merged_video_path = os.path.join(output_folder, f"merged_video_{timestamp}.mp4")
 
-    ffmpeg_command = [
-        'ffmpeg',
-        *inputs,
-        '-filter_complex', filter_complex,
-        '-map', '[outv]',
-        '-c:v', 'libx264',
-        '-r', str(target_fps),
-        '-t', str(target_duration),  # Trim video to target duration
-        merged_video_path
-    ]
-    print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
-    try:
-        subprocess.run(ffmpeg_command, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error merging videos: {e}")
-        return
+    if USE_MEZZANINE:
+        # Conformed clips share codec, size and fps, so they join with a stream copy
+        target = mezzanine.profile(target_resolution[0], target_resolution[1], target_fps)
+        conformed_videos = mezzanine.conform_all(merged_videos, target)
+        try:
+            mezzanine.concat_copy(conformed_videos, merged_video_path, os.path.join(output_folder, "video_list.txt"),
+                                  duration=target_duration, extra_args=['-an'])
+        except subprocess.CalledProcessError as e:
+            print(f"Error merging videos: {e}")
+            return
+    else:
+        # Combine videos using ffmpeg
+        inputs = []
+        for video in merged_videos:
+            inputs.extend(['-i', video])
+
+        filter_complex_parts = []
+        for i in range(len(merged_videos)):
+            filter_complex_parts.append(f"[{i}:v]scale={target_resolution[0]}:{target_resolution[1]}[v{i}];")
+
+        concat_filter = f"concat=n={len(merged_videos)}:v=1[outv]"
+        filter_complex_parts.append("".join(f"[v{i}]" for i in range(len(merged_videos))))
+        filter_complex_parts.append(concat_filter)
+        filter_complex = "".join(filter_complex_parts)
+
+        ffmpeg_command = [
+            'ffmpeg',
+            *inputs,
+            '-filter_complex', filter_complex,
+            '-map', '[outv]',
+            '-c:v', 'libx264',
+            '-r', str(target_fps),
+            '-t', str(target_duration),  # Trim video to target duration
+            merged_video_path
+        ]
+        print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
+        try:
+            subprocess.run(ffmpeg_command, check=True)
+        except subprocess.CalledProcessError as e:
+            print(f"Error merging videos: {e}")
+            return
 
     # Combine audios using ffmpeg
     inputs = [item for audio in merged_audios for item in ('-i', audio)]
@@ -325,28 +319,136 @@ def merge_media(input_videos, input_audios, output_folder, target_duration, targ
 
     return merged_video_path, merged_audio_path
 
-def main():
-    target_resolution = (1920, 1080)
-    target_fps = 24
-    original_audio_volume = 4.0
-    merged_audio_volume = 0.10
+def merge_video_track(merged_video_path, duration, target_resolution, target_fps):
+    """Concatenates random clips from VIDEO_INPUT_FOLDER into a muted video of the given duration."""
+    video_files = []
+    for root, _, files in os.walk(VIDEO_INPUT_FOLDER):
+        for file in files:
+            if file.lower().endswith(('.mp4', '.mov', '.avi')):
+                video_files.append(os.path.join(root, file))
 
-    # Get text files from input_text folder
-    text_files = [os.path.join(INPUT_TEXT_FOLDER, f) for f in os.listdir(INPUT_TEXT_FOLDER) if f.endswith(".txt")]
-    
-    # Outer loop iterates through each text file
-    for text_file in text_files:
-        print(f"Processing text file: {text_file}")
-        i = 0
-        # Delete temporary files created during this iteration
-        files_to_delete = [
-            f"final_audio_{i+1}.mp3",
-            f"merged_audio_{i+1}.aac",
-            f"merged_video_{i+1}.mp4",
-            f"mixed_audio_{i+1}.aac",
-            f"original_audio_{i+1}.mp3",
-            f"reencoded_original_audio_{i+1}.mp3"
-        ]
+    merged_videos = []
+    total_video_duration = 0
+    while total_video_duration < duration:
+        random_video = random.choice(video_files)
+        merged_videos.append(random_video)
+        total_video_duration += get_file_duration(random_video)
+
+    if USE_MEZZANINE:
+        # Conformed clips share codec, size and fps: concatenate, mute and trim without re-encoding
+        target = mezzanine.profile(target_resolution[0], target_resolution[1], target_fps)
+        conformed_videos = mezzanine.conform_all(merged_videos, target)
+        list_path = os.path.splitext(merged_video_path)[0] + "_list.txt"
+        try:
+            return mezzanine.concat_copy(conformed_videos, merged_video_path, list_path, duration=duration, extra_args=['-an'])
+        except subprocess.CalledProcessError as e:
+            print(f"Error merging videos: {e}")
+            return None
+
+    # Convert to MP4 if necessary and trim
+    for j, video_file in enumerate(merged_videos):
+        if not video_file.lower().endswith(".mp4"):
+            converted_video_path = os.path.splitext(video_file)[0] + ".mp4"
+            convert_video_to_mp4(video_file, converted_video_path)
+            merged_videos[j] = converted_video_path
+    inputs = ['-i', merged_videos[0]]
+    for j in range(1, len(merged_videos)):
+        inputs.extend(['-i', merged_videos[j]])
+
+    filter_complex_parts = []
+    for j in range(len(merged_videos)):
+        filter_complex_parts.append(f"[{j}:v]scale={target_resolution[0]}:{target_resolution[1]}[v{j}];")
+
+    concat_filter = f"concat=n={len(merged_videos)}:v=1[outv]"
+    filter_complex_parts.append("".join(f"[v{j}]" for j in range(len(merged_videos))))
+    filter_complex_parts.append(concat_filter)
+    filter_complex = "".join(filter_complex_parts)
+
+    ffmpeg_command = [
+        'ffmpeg',
+        *inputs,
+        '-filter_complex', filter_complex,
+        '-map', '[outv]',
+        '-c:v', 'libx264',
+        '-r', str(target_fps),
+        '-t', str(duration),  # Trim to original audio duration
+        '-an',  # Mute the video
+        '-y', merged_video_path
+    ]
+    print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
+    try:
+        subprocess.run(ffmpeg_command, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Error merging videos: {e}")
+        return None
+    return merged_video_path
+
+def select_music_tracks(music_library, duration):
+    """Picks random tracks from the prepared music library until they cover the given duration."""
+    music_tracks = []
+    total_audio_duration = 0
+    while total_audio_duration < duration:
+        random_audio, track_duration = random.choice(music_library)
+        music_tracks.append(random_audio)
+        total_audio_duration += track_duration
+    return music_tracks
+
+def mux_final_video(merged_video_path, narration_path, music_tracks, duration, final_video_path,
+                    original_audio_volume, merged_audio_volume):
+    """Mixes the narration over the music bed and muxes it with the video in one ffmpeg run.
+
+    Every audio input is resampled to 44.1 kHz stereo inside the filter graph, the music is
+    concatenated, both get their volume, and the mix is trimmed to the narration and encoded
+    once, straight into the final container next to the stream-copied video.
+    """
+    inputs = ['-i', merged_video_path, '-i', narration_path]
+    for track in music_tracks:
+        inputs.extend(['-i', track])
+
+    resample = "aresample=44100,aformat=sample_fmts=fltp:channel_layouts=stereo"
+    music_inputs = "".join(f"[{j + 2}:a]{resample}[m{j}];" for j in range(len(music_tracks)))
+    music_labels = "".join(f"[m{j}]" for j in range(len(music_tracks)))
+    filter_complex = (
+        f"[1:a]{resample},volume={original_audio_volume}[narration];"
+        f"{music_inputs}{music_labels}concat=n={len(music_tracks)}:v=0:a=1,volume={merged_audio_volume}[music];"
+        f"[narration][music]amix=inputs=2:duration=first[outa]"
+    )
+
+    ffmpeg_command = [
+        'ffmpeg',
+        *inputs,
+        '-filter_complex', filter_complex,
+        '-map', '0:v', '-map', '[outa]',
+        '-c:v', 'copy',
+        '-c:a', 'aac', '-b:a', '192k', '-ar', '44100',
+        '-t', str(duration),  # Trim to the narration
+        '-y', final_video_path
+    ]
+    return run_stage_command(ffmpeg_command, final_video_path, "Error merging final video")
+
+def run_stage_command(ffmpeg_command, output_path, error_message):
+    """Runs one ffmpeg step of the pipeline; returns the output path, or None if it failed."""
+    print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
+    try:
+        subprocess.run(ffmpeg_command, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"{error_message}: {e}")
+        return None
+    return output_path
+
+def open_job(text_file, custom_prompt_file):
+    """Opens the journal for one text file and clears scratch files left by an earlier, finished run."""
+    # The journal records every finished stage for this text file, so a rerun after a crash
+    # skips the paid Gemini/ElevenLabs calls and the encodes that already completed
+    journal = render_journal.open_journal("ai_video_maker", os.path.abspath(text_file))
+    tag = os.path.splitext(os.path.basename(text_file))[0]
+
+    # Delete temporary files of this text file (kept when resuming a crashed run)
+    files_to_delete = [
+        f"merged_video_{tag}.mp4",
+        f"original_audio_{tag}.mp3"
+    ]
+    if not journal.resumed:
         for file_name in files_to_delete:
             file_path = os.path.join(OUTPUT_FOLDER, file_name)
             try:
@@ -356,204 +458,119 @@ def main():
                 # File doesn't exist, so do nothing
                 pass
 
-        start_time = datetime.datetime.now()  # Start timer   
+    return {
+        "text_file": text_file,
+        "custom_prompt_file": custom_prompt_file,
+        "source": [text_file, custom_prompt_file],
+        "journal": journal,
+        "tag": tag,
+        "start_time": datetime.datetime.now(),
+    }
+
+def generate_text_stage(job):
+    """Pipeline stage 1: Gemini text for one input file."""
+    print(f"Processing text file: {job['text_file']}")
+    journal = job["journal"]
+
+    # The generated text is moved away by the audio step, so only run the text step
+    # when the audio has not been generated yet
+    audio_done, _ = journal.completed("elevenlabs_audio", [job["source"], VOICE_ID])
+    if audio_done:
+        return job
 
-        # 0. Copy text files to "work_text" folder
-        shutil.copyfile(text_file, os.path.join(WORK_TEXT_FOLDER, os.path.basename(text_file)))
+    def write_text():
+        # 0. Copy the text file to the "work_text" folder
+        work_path = os.path.join(WORK_TEXT_FOLDER, os.path.basename(job["text_file"]))
+        shutil.copyfile(job["text_file"], work_path)
 
         # 1. Text Content Generation
-        custom_prompt_file = "prompt.txt"  # Path to your prompt file
-        filepath = os.path.join(WORK_TEXT_FOLDER, os.listdir(WORK_TEXT_FOLDER)[0])
-        generate_text_content(filepath, custom_prompt_file)
-
-        # 2. Audio Content Generation (within the same loop as text generation)
-        filepath = os.path.join(OUTPUT_TEXT_FOLDER, os.listdir(OUTPUT_TEXT_FOLDER)[0])
-        generate_audio_content(filepath, GEN_AUDIO_FOLDER)
-
-        # 3. Audio/Video Content Generation (Iterate through audio files)
-        original_audio_files = [os.path.join(GEN_AUDIO_FOLDER, f) for f in os.listdir(GEN_AUDIO_FOLDER) if f.endswith(('.mp3', '.wav', '.ogg'))]
-        for i, original_audio_file in enumerate(original_audio_files):
-            print(f"Processing audio file {i+1}")
-
-            # Get original audio duration
-            original_audio_duration = get_file_duration(original_audio_file)
-            print(f"Original audio duration: {original_audio_duration}")
-
-            # 3.1 Merge videos (mute and trim)
-            video_files = []
-            for root, _, files in os.walk(VIDEO_INPUT_FOLDER):
-                for file in files:
-                    if file.lower().endswith(('.mp4', '.mov', '.avi')):
-                        video_files.append(os.path.join(root, file))
-
-            merged_videos = []
-            total_video_duration = 0
-            while total_video_duration < original_audio_duration:
-                random_video = random.choice(video_files)
-                merged_videos.append(random_video)
-                total_video_duration += get_file_duration(random_video)
-
-            # Convert to MP4 if necessary and trim
-            for j, video_file in enumerate(merged_videos):
-                if not video_file.lower().endswith(".mp4"):
-                    converted_video_path = os.path.splitext(video_file)[0] + ".mp4"
-                    convert_video_to_mp4(video_file, converted_video_path)
-                    merged_videos[j] = converted_video_path
-            merged_video_path = os.path.join(OUTPUT_FOLDER, f"merged_video_{i+1}.mp4")
-            inputs = ['-i', merged_videos[0]]
-            for j in range(1, len(merged_videos)):
-                inputs.extend(['-i', merged_videos[j]])
-
-            filter_complex_parts = []
-            for j in range(len(merged_videos)):
-                filter_complex_parts.append(f"[{j}:v]scale={target_resolution[0]}:{target_resolution[1]}[v{j}];")
-
-            concat_filter = f"concat=n={len(merged_videos)}:v=1[outv]"
-            filter_complex_parts.append("".join(f"[v{j}]" for j in range(len(merged_videos))))
-            filter_complex_parts.append(concat_filter)
-            filter_complex = "".join(filter_complex_parts)
-
-            ffmpeg_command = [
-                'ffmpeg',
-                *inputs,
-                '-filter_complex', filter_complex,
-                '-map', '[outv]',
-                '-c:v', 'libx264',
-                '-r', str(target_fps),
-                '-t', str(original_audio_duration),  # Trim to original audio duration
-                '-an',  # Mute the video
-                merged_video_path
-            ]
-            print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
-            try:
-                subprocess.run(ffmpeg_command, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Error merging videos: {e}")
-                return
-
-            # 3.2 Merge audio (convert to AAC if necessary, then to MP3 if needed, and trim)
-            audio_files = []
-            for root, _, files in os.walk(AUDIO_INPUT_FOLDER):
-                for file in files:
-                    if file.lower().endswith(('.mp3', '.wav', '.ogg')):
-                        audio_files.append(os.path.join(root, file))
-
-            merged_audios = []
-            total_audio_duration = 0
-            while total_audio_duration < original_audio_duration:
-                random_audio = random.choice(audio_files)
-
-                # Convert to AAC if necessary
-                if not validate_audio_stream(random_audio):
-                    converted_audio_path = os.path.join(OUTPUT_FOLDER, f"converted_audio_{i+1}_{len(merged_audios)}.mp3")
-                    convert_audio_sample_rate(random_audio, converted_audio_path)
-                    merged_audios.append(converted_audio_path)
-                else:
-                    merged_audios.append(random_audio)
-                total_audio_duration += get_file_duration(random_audio)
-
-            # Merge audio using AAC codec
-            merged_audio_path = os.path.join(OUTPUT_FOLDER, f"merged_audio_{i+1}.aac")  # Save as AAC first
-            inputs = ['-i', merged_audios[0]]
-            for j in range(1, len(merged_audios)):
-                inputs.extend(['-i', merged_audios[j]])
-
-            filter_complex = "".join(f"[{j}:a]" for j in range(len(merged_audios))) + f"concat=n={len(merged_audios)}:v=0:a=1[outa]"
-
-            ffmpeg_command = [
-                'ffmpeg',
-                *inputs,
-                '-filter_complex', filter_complex,
-                '-map', '[outa]',
-                '-c:a', 'aac',  # Encode to AAC
-                '-ar', '44100',
-                '-t', str(original_audio_duration),
-                merged_audio_path
-            ]
-            print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
-            try:
-                subprocess.run(ffmpeg_command, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Error merging audio: {e}")
-                return
-
-            # 3.3 Re-encode original audio (to the correct sample rate)
-            reencoded_original_audio_path = os.path.join(OUTPUT_FOLDER, f"reencoded_original_audio_{i+1}.mp3")
-            convert_audio_sample_rate(original_audio_file, reencoded_original_audio_path)
-
-            # 3.4 Mix re-encoded merged audio (AAC) with re-encoded original audio (MP3)
-            mixed_audio_path = os.path.join(OUTPUT_FOLDER, f"mixed_audio_{i+1}.aac")
-            ffmpeg_command = [
-                'ffmpeg',
-                '-i', merged_audio_path,  # Use AAC-encoded merged audio
-                '-i', reencoded_original_audio_path,
-                '-filter_complex',
-                f'[0:a]volume={merged_audio_volume}[audio1];'
-                f'[1:a]volume={original_audio_volume}[audio2];'
-                f'[audio1][audio2]amix=inputs=2[outa]',
-                '-map', '[outa]',
-                '-c:a', 'aac',  # Encode to AAC
-                mixed_audio_path
-            ]
-            print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
-            try:
-                subprocess.run(ffmpeg_command, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Error mixing audio: {e}")
-                return
-
-            # Convert the mixed audio to MP3
-            final_audio_path = os.path.join(OUTPUT_FOLDER, f"final_audio_{i+1}.mp3")
-            ffmpeg_command = [
-                'ffmpeg',
-                '-i', mixed_audio_path,
-                '-c:a', 'libmp3lame',  # Encode to MP3
-                '-ar', '44100',
-                final_audio_path
-            ]
-            print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
-            try:
-                subprocess.run(ffmpeg_command, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Error converting final audio to MP3: {e}")
-                return
-
-            # 3.5 Merge final video and audio
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            final_video_path = os.path.join(FINISHED_VIDEOS_FOLDER, f"new_video_{timestamp}_{i+1}.mp4")
-            ffmpeg_command = [
-                'ffmpeg',
-                '-i', os.path.join(OUTPUT_FOLDER, f"merged_video_{i+1}.mp4"),
-                '-i', final_audio_path,
-                '-c:v', 'copy', '-c:a', 'copy',
-                final_video_path
-            ]
-            print(f"Running FFmpeg command: {' '.join(ffmpeg_command)}")
-            try:
-                subprocess.run(ffmpeg_command, check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Error merging final video: {e}")
-                return
-
-            print(f"Final video path: {final_video_path}")
-            shutil.copyfile(original_audio_file, os.path.join(OUTPUT_FOLDER, f"original_audio_{i+1}.mp3"))
-
-            # Move processed files to "Processed" folder
-            for folder in [GEN_AUDIO_FOLDER, OUTPUT_TEXT_FOLDER, WORK_TEXT_FOLDER]:
-                for filename in os.listdir(folder):
-                    if filename.endswith((".txt", ".mp3")):  # Adjust file extensions if needed
-                        shutil.move(os.path.join(folder, filename), os.path.join(PROCESSED_FOLDER, filename))
-
-        # Move processed files to "Processed" folder
-        for folder in [GEN_AUDIO_FOLDER, OUTPUT_TEXT_FOLDER, WORK_TEXT_FOLDER]:
-            for filename in os.listdir(folder):
-                if filename.endswith((".txt", ".mp3")):  # Adjust file extensions if needed
-                    shutil.move(os.path.join(folder, filename), os.path.join(PROCESSED_FOLDER, filename))
-
-        end_time = datetime.datetime.now()
-        total_time = end_time - start_time
-        print(f"Total runtime for this text file: {total_time}")
-        print(f"Original audio duration: {original_audio_duration}")  # This will print the duration of the last processed file
+        return generate_text_content(work_path, job["custom_prompt_file"])
+
+    job["generated_text"] = journal.stage("gemini_text", job["source"], write_text)
+    return job if job["generated_text"] else None
+
+def generate_audio_stage(job):
+    """Pipeline stage 2: ElevenLabs narration for the generated text."""
+    job["audio"] = job["journal"].stage("elevenlabs_audio", [job["source"], VOICE_ID],
+                                        lambda: generate_audio_content(job["generated_text"], GEN_AUDIO_FOLDER))
+    return job if job["audio"] else None
+
+def render_video(job, music_library, target_resolution, target_fps, original_audio_volume, merged_audio_volume):
+    """Pipeline stage 3: stock footage and a music bed under the narration, rendered into the finished video."""
+    journal, original_audio_file, tag = job["journal"], job["audio"], job["tag"]
+    print(f"Rendering {original_audio_file}")
+
+    # Get original audio duration
+    original_audio_duration = get_file_duration(original_audio_file)
+    print(f"Original audio duration: {original_audio_duration}")
+
+    # 3.1 Merge videos (mute and trim)
+    merged_video_path = journal.stage(
+        "merged_video", [original_audio_file, target_resolution, target_fps],
+        lambda: merge_video_track(os.path.join(OUTPUT_FOLDER, f"merged_video_{tag}.mp4"),
+                                  original_audio_duration, target_resolution, target_fps)
+    )
+    if not merged_video_path:
+        return None
+
+    # 3.2 Pick the music bed (kept in the journal so a resumed run mixes the same tracks)
+    music_tracks = journal.get("music_tracks") or journal.set("music_tracks", select_music_tracks(music_library, original_audio_duration))
+
+    # 3.3 Mix narration and music and mux them with the video, encoding the audio only once
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    final_video_path = journal.setdefault("final_video", os.path.join(FINISHED_VIDEOS_FOLDER, f"new_video_{timestamp}_{tag}.mp4"))
+    if not journal.stage("final_video", [merged_video_path, original_audio_file, music_tracks,
+                                         merged_audio_volume, original_audio_volume],
+                         lambda: mux_final_video(merged_video_path, original_audio_file, music_tracks,
+                                                 original_audio_duration, final_video_path,
+                                                 original_audio_volume, merged_audio_volume)):
+        return None
+
+    print(f"Final video path: {final_video_path}")
+    shutil.copyfile(original_audio_file, os.path.join(OUTPUT_FOLDER, f"original_audio_{tag}.mp3"))
+
+    # Move the generated audio to "Processed" folder (the text files were moved by the earlier stages)
+    shutil.move(original_audio_file, os.path.join(PROCESSED_FOLDER, os.path.basename(original_audio_file)))
+    journal.finish()
+
+    total_time = datetime.datetime.now() - job["start_time"]
+    print(f"Total runtime for {os.path.basename(job['text_file'])}: {total_time}")
+    return final_video_path
+
+def main():
+    target_resolution = (1920, 1080)
+    target_fps = 24
+    original_audio_volume = 4.0
+    merged_audio_volume = 0.10
+    custom_prompt_file = "prompt.txt"  # Path to your prompt file
+    gemini.configure(GEMINI_API_KEY)  # Once for the whole run
+
+    # Probe the music library once (in parallel) and conform any track not at 44.1 kHz into the
+    # mezzanine library, so picking and mixing the music needs no per-video ffprobe or transcode
+    music_library = mezzanine.music_library(AUDIO_INPUT_FOLDER)
+    if not music_library:
+        print(f"No usable music tracks found in {AUDIO_INPUT_FOLDER}")
+        return
+
+    # Get text files from input_text folder
+    text_files = [os.path.join(INPUT_TEXT_FOLDER, f) for f in os.listdir(INPUT_TEXT_FOLDER) if f.endswith(".txt")]
+
+    # Text -> narration -> render, with the stages working on different text files at the same time
+    stages = [
+        pipeline.Stage("gemini_text", generate_text_stage, TEXT_WORKERS, PIPELINE_QUEUE_SIZE),
+        pipeline.Stage("elevenlabs_audio", generate_audio_stage, TTS_WORKERS, PIPELINE_QUEUE_SIZE),
+        pipeline.Stage("render", lambda job: render_video(job, music_library, target_resolution, target_fps,
+                                                          original_audio_volume, merged_audio_volume),
+                       RENDER_WORKERS, PIPELINE_QUEUE_SIZE),
+    ]
+    jobs = (open_job(text_file, custom_prompt_file) for text_file in text_files)
+    finished, failures = pipeline.run_pipeline(jobs, stages)
+
+    for stage_name, job, error in failures:
+        print(f"{os.path.basename(job['text_file'])} failed at {stage_name}: {error}")
+    print(f"Finished {len(finished)} of {len(text_files)} videos")
+    print(tts_cache.report())
+    print(gemini.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -4,56 +4,48 @@ import random
 import shutil
 import json
 import datetime
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import catalog as media_catalog
 
 def get_file_duration(file_path):
     print(f"Getting duration for: {file_path}")
-    command = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', file_path]
     try:
-        output = subprocess.check_output(command).decode('utf-8').strip()
-        return float(output)
-    except subprocess.CalledProcessError as e:
+        return media_catalog.get_duration(file_path)
+    except (OSError, ValueError) as e:
         print(f"Error getting file duration: {e}")
         return 0.0
 
 def get_audio_stats(file_path):
-    command = ['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_name,sample_rate,channels,bit_rate,duration', '-of', 'json', file_path]
     try:
-        output = subprocess.check_output(command).decode('utf-8')
-        return output
-    except subprocess.CalledProcessError as e:
+        return media_catalog.get_streams_json(file_path)
+    except (OSError, ValueError) as e:
         print(f"Error getting audio stats: {e}")
         return "{}"
 
 def validate_audio_stream(file_path):
-    command = ['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_name,sample_rate,channels,bit_rate,duration', '-of', 'json', file_path]
     try:
-        output = subprocess.check_output(command).decode('utf-8')
-        audio_info = json.loads(output)
-
-        if 'streams' in audio_info and len(audio_info['streams']) > 0:
-            stream = audio_info['streams'][0]
-            codec = stream['codec_name']
-            sample_rate = int(stream['sample_rate'])
-            channels = stream['channels']
-            bit_rate = stream['bit_rate']
-            duration = stream['duration']
-
-            if codec not in ['aac', 'mp3', 'flac']:
-                print(f"Invalid codec: {codec}")
-                return False
-
-            if sample_rate != 44100:
-                print(f"Invalid sample rate: {sample_rate}")
-                return False
-
-            return True
-        else:
-            print("No audio streams found in the file.")
-            return False
-    except subprocess.CalledProcessError as e:
+        entry = media_catalog.probe(file_path)
+    except (OSError, ValueError) as e:
         print(f"Error validating audio stream: {e}")
         return False
 
+    codec = entry["audio_codec"]
+    sample_rate = entry["sample_rate"]
+    if codec is None:
+        print("No audio streams found in the file.")
+        return False
+
+    if codec not in ['aac', 'mp3', 'flac']:
+        print(f"Invalid codec: {codec}")
+        return False
+
+    if sample_rate != 44100:
+        print(f"Invalid sample rate: {sample_rate}")
+        return False
+
+    return True
+
 def convert_audio_sample_rate(input_file, output_file, target_sample_rate=44100):
     """Converts the sample rate of an audio file using FFmpeg only if necessary."""
     audio_info = get_audio_stats(input_file)  # Get audio stats first
@@ -4,6 +4,10 @@ import os
 import chardet
 import time
 from pydub import AudioSegment
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import tts_cache
+from media_common import http_client
 
 # Define constants for the script
 CHUNK_SIZE = 1024
@@ -59,29 +63,28 @@ def process_text_file(text_file):
         }
     }
 
-    # Make the POST request to the TTS API and stream the response
-    response = requests.post(tts_url, headers=headers, json=data, stream=True)
-
-    # Check if the request was successful
-    if response.ok:
-        # Create an output filename and path
-        output_filename = f"{os.path.splitext(text_file)[0]}.mp3"
-        output_path = os.path.join(OUTPUT_FOLDER, output_filename)
-
-        # Write the streamed response to the output file
-        with open(output_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                f.write(chunk)
-
+    # Create an output filename and path
+    output_filename = f"{os.path.splitext(text_file)[0]}.mp3"
+    output_path = os.path.join(OUTPUT_FOLDER, output_filename)
+
+    def synthesize(path):
+        # Make the POST request to the TTS API and stream the response to the output file.
+        # The shared client pools connections, paces requests and retries 429s and 5xx responses.
+        try:
+            http_client.default_client().download(tts_url, path, method="POST", headers=headers, json=data,
+                                                  chunk_size=CHUNK_SIZE)
+        except requests.HTTPError as e:
+            print(e.response.text)
+            return False
+        return True
+
+    # Text already spoken with this voice and these settings comes from the local TTS cache, unbilled
+    if tts_cache.fetch(output_path, voice_id, TEXT_TO_SPEAK, synthesize, data["model_id"], data["voice_settings"]):
         # Inform the user of success and move the text file (optional)
         print(f"Audio stream saved successfully to: {output_path}")
         processed_folder = "processed_text"
         os.makedirs(processed_folder, exist_ok=True)
         os.rename(text_path, os.path.join(processed_folder, text_file))
-    else:
-        print(response.text)
-
-    time.sleep(1)
 
 # Function to combine multiple audio files
 def combine_audio(OUTPUT_FOLDER, FINAL_FOLDER, filenames):
@@ -122,6 +125,7 @@ def main():
 
     # Combine the audio files
     combine_audio(OUTPUT_FOLDER, FINAL_FOLDER, filenames)
+    print(tts_cache.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -4,8 +4,11 @@ import time
 import chardet
 from pydub import AudioSegment
 import requests
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import tts_cache
+from media_common import http_client
+from media_common import gemini
 
 # --- Configuration ---
 
@@ -39,35 +42,20 @@ CHUNK_SIZE = 1024
 
 def configure_gemini():
     """Configures the Gemini API."""
-    genai.configure(api_key=GEMINI_API_KEY)
+    gemini.configure(GEMINI_API_KEY)
 
 def generate_gemini_text(filepath, custom_prompt_file):
     global audio_filename  # Declare that you're using the global variable
-    """Generates text content using Gemini."""
-    with open(filepath, "r", encoding='utf-8') as f:
-        file_content = f.read()
-    with open(custom_prompt_file, "r", encoding='utf-8') as f:
-        custom_prompt = f.read()
-
-    prompt = f"{file_content}\n\n{custom_prompt}"
-
-    model = genai.GenerativeModel(GEMINI_MODEL)
-    response = model.generate_content(
-        prompt,
-        safety_settings={
-            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-        }
-    )
+    """Generates text content using Gemini (cached by model, prompt, file content and safety settings)."""
+    custom_prompt = gemini.read_prompt(custom_prompt_file)
+    response_text = gemini.generate_file(filepath, custom_prompt, GEMINI_MODEL, gemini.block_none())
 
     output_filename = f"[Original]-{os.path.basename(filepath)}"
     audio_filename = output_filename
     output_filepath = os.path.join(GEMINI_TEXT_FOLDER, output_filename)
 
     with open(output_filepath, "w", encoding='utf-8') as f:
-        f.write(response.text)
+        f.write(response_text)
 
     os.remove(filepath)
 
@@ -130,16 +118,21 @@ def process_text_file(text_file):
         }
     }
 
-    response = requests.post(tts_url, headers=headers, json=data, stream=True)
-
-    if response.ok:
-        output_filename = f"{os.path.splitext(text_file)[0]}.mp3"
-        output_path = os.path.join(OUTPUT_AUDIO_FOLDER, output_filename)
-
-        with open(output_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                f.write(chunk)
-
+    output_filename = f"{os.path.splitext(text_file)[0]}.mp3"
+    output_path = os.path.join(OUTPUT_AUDIO_FOLDER, output_filename)
+
+    def synthesize(path):
+        # Pooled, rate-limited request; 429s and 5xx responses are retried with backoff
+        try:
+            http_client.default_client().download(tts_url, path, method="POST", headers=headers, json=data,
+                                                  chunk_size=CHUNK_SIZE)
+        except requests.HTTPError as e:
+            print(e.response.text)
+            return False
+        return True
+
+    # Text already spoken with this voice and these settings comes from the local TTS cache, unbilled
+    if tts_cache.fetch(output_path, voice_id, text_to_speak, synthesize, data["model_id"], data["voice_settings"]):
         print(f"Audio stream saved successfully to: {output_path}")
 
         os.remove(text_path)
@@ -147,11 +140,6 @@ def process_text_file(text_file):
         #os.makedirs(PROCESSED_TEXT_FOLDER, exist_ok=True)
         #os.rename(text_path, os.path.join(PROCESSED_TEXT_FOLDER, text_file))
 
-    else:
-        print(response.text)
-
-    time.sleep(1)
-
 def combine_audio(filenames):
     """Combines multiple audio files into a single file."""
     combined_audio = AudioSegment.empty()
@@ -225,6 +213,8 @@ def main():
             # 4. Combine audio files
             filenames = ["Zeno.mp3", "Stoic_Philosopher.mp3", "Zen_Monk.mp3"]
             combine_audio(filenames)
+            print(tts_cache.report())
+            print(gemini.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,46 +7,35 @@ import json
 import datetime
 import chardet
 import time
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import gemini
 
 # --- Configuration ---
 INPUT_FOLDER = "Input"
 OUTPUT_TEXT_FOLDER = "Output_Text"
 PROCESSED_FOLDER = "Processed"
 CUSTOM_PROMPT_FILE = "prompt.txt"
+GEMINI_API_KEY = "id_key"
+GEMINI_MODEL = "gemini-1.5-flash"
+
+# Input files sent to Gemini at once; responses already in the shared cache are not sent again
+BATCH_WORKERS = gemini.BATCH_WORKERS
 
 # --- Text Content Generation ---
 
 def generate_text_content(filepath, custom_prompt_file):
     """Generates text content using Gemini and saves it to a file."""
+    custom_prompt = gemini.read_prompt(custom_prompt_file)
+    save_text_content(filepath, gemini.generate_file(filepath, custom_prompt, GEMINI_MODEL, gemini.block_none()))
 
-    # Read custom prompt from file
-    with open(custom_prompt_file, "r", encoding='utf-8') as f:
-        custom_prompt = f.read()
-
-    # Gemini processing
-    genai.configure(api_key = "id_key")
-    model = genai.GenerativeModel('gemini-1.5-flash')
-
-    with open(filepath, "r", encoding='utf-8') as f:
-        file_content = f.read()
-    prompt = f"{file_content}\n\n{custom_prompt}"
-    response = model.generate_content(
-        prompt,
-        safety_settings={
-            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-        }
-    )
-
+def save_text_content(filepath, response_text):
+    """Saves the generated text and moves the input file to the "Processed" folder."""
     output_filename = f"[Original]-{os.path.basename(filepath)}"
     output_filepath = os.path.join(OUTPUT_TEXT_FOLDER, output_filename)
 
     with open(output_filepath, "w", encoding='utf-8') as f:
-        f.write(response.text)
+        f.write(response_text)
     print(f"Processed file: {os.path.basename(filepath)}")
 
     # Move processed file to "Processed" folder
@@ -61,12 +50,19 @@ def main():
     # Create output folders if they don't exist
     os.makedirs(OUTPUT_TEXT_FOLDER, exist_ok=True)
     os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+    gemini.configure(GEMINI_API_KEY)
 
-    # Process text files
-    for filename in os.listdir(INPUT_FOLDER):
-        if filename.endswith((".txt", ".md", ".html", ".json", ".csv")):
-            filepath = os.path.join(INPUT_FOLDER, filename)
-            generate_text_content(filepath, CUSTOM_PROMPT_FILE)
+    # Process text files, several requests in flight at a time
+    filepaths = [os.path.join(INPUT_FOLDER, filename) for filename in os.listdir(INPUT_FOLDER)
+                 if filename.endswith((".txt", ".md", ".html", ".json", ".csv"))]
+    custom_prompt = gemini.read_prompt(CUSTOM_PROMPT_FILE)
+    for filepath, response_text, error in gemini.generate_files(filepaths, custom_prompt, GEMINI_MODEL,
+                                                                gemini.block_none(), BATCH_WORKERS):
+        if error is None:
+            save_text_content(filepath, response_text)
+        else:
+            print(f"Failed to process {os.path.basename(filepath)}: {error}")
+    print(gemini.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,7 +1,15 @@
 import os
+import sys
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlsplit
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import downloader
+from media_common import store as media_store
+
+# Keep each unique file once in the content-addressed store (media_common.store) and hardlink
+# it into the output folders. Set to False to write plain files as before.
+USE_STORE = True
 
 def scrape_jpgs(base_url, output_folder):
     # Ensure the output directory exists
@@ -13,6 +21,7 @@ def scrape_jpgs(base_url, output_folder):
     soup = BeautifulSoup(response.content, 'html.parser')
 
     # Find all .jpg links ending with "-585x1024" or "-1024x585"
+    jobs = []
     for img_tag in soup.find_all('img'):
         img_url = img_tag.get('src')
         if img_url and (img_url.endswith("-585x1024.jpg") or img_url.endswith("-1024x585.jpg")):
@@ -21,14 +30,15 @@ def scrape_jpgs(base_url, output_folder):
             img_url_final = urljoin(base_url, img_url_base)
             filename = os.path.basename(urlsplit(img_url_base).path)
 
-            # Download the image
-            img_data = requests.get(img_url_final).content
-            output_path = os.path.join(output_folder, filename)
-
-            with open(output_path, 'wb') as f:
-                f.write(img_data)
+            jobs.append((img_url_final, os.path.join(output_folder, filename)))
 
-            print(f"Downloaded and saved {filename} to {output_folder}")
+    # Download the images in parallel
+    for img_url_final, output_path, downloaded, error in downloader.download_all(
+            jobs, store=media_store.default_store() if USE_STORE else None):
+        if error is not None:
+            print(f"Error downloading {img_url_final}: {error}")
+        elif downloaded:
+            print(f"Downloaded and saved {os.path.basename(output_path)} to {output_folder}")
 
 if __name__ == "__main__":
     # Set the URL of the page you want to scrape
@@ -3,6 +3,13 @@ import random
 import subprocess
 from datetime import datetime
 import logging
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from media_common import catalog as media_catalog
+from media_common import sampler as folder_sampler
+from media_common import mezzanine
+from media_common import render
+from media_common import workspace
 
 # Setup logging configuration
 logging.basicConfig(filename='video_processing.log', level=logging.DEBUG,
@@ -10,24 +17,6 @@ logging.basicConfig(filename='video_processing.log', level=logging.DEBUG,
                     
                    
 
-def insert_video_metadata(video_path, title, artist, genre, copyright, description):
-    """Inserts metadata into the video file using ffmpeg."""
-    command = [
-        "ffmpeg", "-i", video_path,
-        "-metadata", f"title={title}",
-        "-metadata", f"artist={artist}",
-        "-metadata", f"genre={genre}",
-        "-metadata", f"copyright={copyright}",
-        "-metadata", f"description={description}",
-        "-codec:v", "copy", "-codec:a", "copy",  # Copy video and audio streams without re-encoding
-        "-y", f"{os.path.splitext(video_path)[0]}_metadata.mp4"  # Output file with metadata
-    ]
-    subprocess.run(command, check=True)
-    logging.info(f"Metadata inserted into video: {video_path}")
-
-    # Replace the original video with the one containing metadata
-    os.replace(f"{os.path.splitext(video_path)[0]}_metadata.mp4", video_path)
-
 def try_remove_file(filepath):
     """Attempts to remove a file if it exists."""
     try:
@@ -51,45 +40,30 @@ QUALITY_SETTINGS = {
 }
 
 def get_video_info(video_path):
-    """Retrieve video width and height using ffprobe."""
-    info = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0",
-                           "-show_entries", "stream=width,height", "-of", "csv=s=x:p=0", video_path],
-                          capture_output=True, text=True).stdout.strip().split('x')
-    if len(info) != 2 or not info[0] or not info[1]:
-        raise ValueError(f"Failed to retrieve video dimensions for {video_path}")
-    return int(info[0]), int(info[1])
+    """Retrieve video width and height from the shared media catalog (probes only new or changed files)."""
+    return media_catalog.get_resolution(video_path)
 
 def get_video_duration(video_path):
-    """Retrieve video duration using ffprobe."""
-    duration = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0",
-                               "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", video_path],
-                              capture_output=True, text=True).stdout.strip()
-    if not duration:
-        raise ValueError(f"Failed to retrieve duration for {video_path}")
-    return float(duration)
-
-def trim_video_to_duration(input_video, output_video, duration):
-    """Trims the video to the specified duration."""
-    command = [
-        "ffmpeg", "-hwaccel", "cuda", "-i", input_video, 
-        "-t", str(duration), "-c:v", "copy", "-c:a", "copy", 
-        "-y", output_video
-    ]
-    subprocess.run(command, check=True)
-    logging.info(f"Trimmed video {input_video} to {duration} seconds, saved as {output_video}")
+    """Retrieve video duration from the shared media catalog (probes only new or changed files)."""
+    return media_catalog.get_duration(video_path)
+
+# Draw history shared with the other 2nd/3rd RUN copies, so reruns keep cycling through clips
+# none of them has shown yet. Set to None to start every run with a fresh shuffle.
+SAMPLER_HISTORY = folder_sampler.DEFAULT_HISTORY_PATH
+
+# Take background clips from the normalized mezzanine library (media_common.mezzanine), so they
+# always share codec, size and fps and concatenate with a plain stream copy.
+# Build it ahead of time with: python -m media_common.mezzanine horizontal "<bg folder>"
+# Off by default: clips not yet in the library are transcoded (libx264 CRF 18) during the merge.
+USE_MEZZANINE = False
 
 def select_random_video_without_reuse(folder, used_videos):
-    """Selects a random video from a folder, ensuring no duplicates."""
-    videos = [os.path.join(root, file)
-              for root, _, files in os.walk(folder)
-              for file in files if file.endswith(".mp4") and os.path.join(root, file) not in used_videos]
-    
-    if not videos:
-        raise FileNotFoundError(f"No more unused videos found in {folder}. All videos have been used.")
-    
-    selected_video = random.choice(videos)
-    used_videos.add(selected_video)
-    return selected_video
+    """Draws the next video from the folder's shuffle bag, skipping videos already used.
+
+    The folder is indexed once per run and refilled automatically when every video has been used.
+    """
+    sampler = folder_sampler.get_sampler(folder, (".mp4",), history_path=SAMPLER_HISTORY)
+    return sampler.draw(used_videos)
 
 def ensure_unique_bg_videos(duration_folder, used_videos, required_duration):
     """Select background videos without duplication to meet or exceed the required duration."""
@@ -112,11 +86,15 @@ def ensure_unique_bg_videos(duration_folder, used_videos, required_duration):
 
     return bg_videos
 
-def merge_videos(bg_paths, fg_path, output_video_path, zoom=1.0, x_offset=0, y_offset=0, quality="Default"):
+def merge_videos(bg_paths, fg_path, output_video_path, zoom=1.0, x_offset=0, y_offset=0, quality="Default", workdir="."):
     """Merges background and foreground videos using color keying, applying zoom and offsets, while retaining audio."""
     logging.info(f"Merging videos with foreground: {fg_path} and backgrounds: {bg_paths}")
     
     try:
+        # Backgrounds from the normalized mezzanine library always join with the stream copy below
+        if USE_MEZZANINE:
+            bg_paths = mezzanine.conform_all(bg_paths)
+
         fg_width, fg_height = get_video_info(fg_path)
         bg_width, bg_height = get_video_info(bg_paths[0])  # Assume all background videos have the same resolution
         
@@ -130,13 +108,14 @@ def merge_videos(bg_paths, fg_path, output_video_path, zoom=1.0, x_offset=0, y_o
 
         # Concatenate background videos if multiple
         if len(bg_paths) > 1:
-            with open("bg_concat_list.txt", "w") as f:
+            bg_list_path = os.path.join(workdir, "bg_concat_list.txt")
+            with open(bg_list_path, "w") as f:
                 for bg_path in bg_paths:
                     f.write(f"file '{bg_path}'\n")
             
-            bg_concat_path = "concatenated_bg.mp4"
+            bg_concat_path = os.path.join(workdir, "concatenated_bg.mp4")
             command = [
-                "ffmpeg", "-f", "concat", "-safe", "0", "-i", "bg_concat_list.txt",
+                "ffmpeg", "-f", "concat", "-safe", "0", "-i", bg_list_path,
                 "-c:v", "copy", "-y", bg_concat_path
             ]
             subprocess.run(command, check=True)
@@ -163,7 +142,7 @@ def merge_videos(bg_paths, fg_path, output_video_path, zoom=1.0, x_offset=0, y_o
     # Cleanup
     if len(bg_paths) > 1:
         os.remove(bg_concat_path)
-        os.remove("bg_concat_list.txt")
+        os.remove(bg_list_path)
 
 def select_random_audio(folder, used_audios):
     """Selects a random audio file from a folder."""
@@ -175,35 +154,8 @@ def select_random_audio(folder, used_audios):
     used_audios.add(selected_audio)
     return selected_audio
 
-def merge_audio_to_video(video_path, bg_music, bg_music_volume=0, final_audio_volume=0, used_audios=set()):
-    """Merges background music into a video and returns the output path."""
-    logging.info(f"Merging audio to video: {video_path} with background music: {bg_music}")
-    
-    video_duration = get_video_duration(video_path)
-
-    if os.path.isdir(bg_music):
-        bg_music_path = select_random_audio(bg_music, used_audios)
-    else:
-        bg_music_path = bg_music
-
-    # Create background music looped to video duration
-    looped_audio_path = "looped_audio.wav"
-    subprocess.run(["ffmpeg", "-stream_loop", "-1", "-i", bg_music_path, "-t", str(video_duration), "-y", looped_audio_path], check=True)
-
-    # Merge the video with the looped background music
-    output_video_path = f"{os.path.splitext(video_path)[0]}_with_audio.mp4"
-    command = [
-        "ffmpeg", "-hwaccel", "cuda", "-i", video_path, "-i", looped_audio_path,
-        "-filter_complex", f"[1:a]volume={bg_music_volume}dB[aud];[0:a][aud]amix=inputs=2:duration=first[a];"
-                           f"[a]volume={final_audio_volume}dB[out]",
-        "-map", "0:v", "-map", "[out]", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", "-shortest", "-y", output_video_path
-    ]
-    subprocess.run(command, check=True)
-    
-    # Cleanup intermediate files
-    os.remove(looped_audio_path)
-
-    return output_video_path
+# Seconds of crossfade at each seam where the background music loops (0 = plain gapless loop)
+MUSIC_LOOP_CROSSFADE = 0
 
 def create_final_video_sequence(bg_folder, fg_folder, title_folder, author_folder, stoistica_folder, book_folder, output_folder, duration, iterations, quality, bg_music, bg_music_volume, final_audio_volume, altbg_category=None):
     """Creates the final video sequence by combining title, background, and foreground videos with audio."""
@@ -248,6 +200,8 @@ def create_final_video_sequence(bg_folder, fg_folder, title_folder, author_folde
     used_audios = set()
 
     for i in range(iterations):
+        # Each iteration gets its own scratch folder so parallel runs never share temp files
+        job = workspace.JobWorkspace(f"iteration_{i+1}_")
         try:
             logging.info(f"Starting iteration {i+1} of {iterations}")
 
@@ -283,13 +237,14 @@ def create_final_video_sequence(bg_folder, fg_folder, title_folder, author_folde
                     total_duration += get_video_duration(fg_video_path)
 
             # Concatenate the video sequence into a single video file
-            with open("concat_list.txt", "w") as f:
+            concat_list_path = job.file("concat_list.txt")
+            with open(concat_list_path, "w") as f:
                 for video_path in video_sequence:
                     f.write(f"file '{video_path}'\n")
 
-            final_video_path = os.path.join(output_folder, f"final_video_{i+1}.mp4")
+            final_video_path = job.file(f"final_video_{i+1}.mp4")
             command = [
-                "ffmpeg", "-f", "concat", "-safe", "0", "-i", "concat_list.txt",
+                "ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_list_path,
                 "-c:v", "h264_nvenc", "-preset", "slow", "-y", final_video_path
             ]
             result = subprocess.run(command, capture_output=True, text=True)
@@ -297,15 +252,11 @@ def create_final_video_sequence(bg_folder, fg_folder, title_folder, author_folde
             logging.error(f"FFmpeg errors: {result.stderr}")
 
             # Merge background videos
-            final_output_path = os.path.join(output_folder, f"final_output_{i}.mp4")
-            merge_videos(bg_videos, final_video_path, final_output_path, quality=quality)
-
-            # Merge audio
-            output_video_with_audio = merge_audio_to_video(final_output_path, bg_music, bg_music_volume, final_audio_volume, used_audios)
+            final_output_path = job.file(f"final_output_{i}.mp4")
+            merge_videos(bg_videos, final_video_path, final_output_path, quality=quality, workdir=job.path)
 
-            # Ensure the final video duration does not exceed the set duration
-            trimmed_output_path = os.path.join(output_folder, f"final_video_trimmed_{i}.mp4")
-            trim_video_to_duration(output_video_with_audio, trimmed_output_path, duration)
+            # Pick the background music; the finalization below mixes it in
+            bg_music_path = select_random_audio(bg_music, used_audios) if os.path.isdir(bg_music) else bg_music
 
             # Add duration and altbg_category to the final file name
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -316,23 +267,23 @@ def create_final_video_sequence(bg_folder, fg_folder, title_folder, author_folde
                 output_folder, 
                 f"{duration_label}{altbg_label}Motivational_Quotes_Video_{timestamp}_{i}.mp4"
             )
-            os.rename(trimmed_output_path, final_name)
-
-            # Insert metadata
-            insert_video_metadata(
-                final_name,
-                title="Motivational Quotes Video for Work Out and Exercise",  # Replace with your desired title
-                artist="Stoistica",  # Replace with your artist/channel name
-                genre="Motivational",  # Replace with the appropriate genre
-                copyright="Stoistica 2024",  # Replace with your copyright information
-                description="Motivational Exercise Quotes Video for sleep, work out, inspiration - philosophy, stoicism, wisdom quote,"  # Replace with your video description
+
+            # Music mix, cut to the set duration, metadata and faststart in one remux; it is written
+            # under a temporary name and only renamed to final_name once complete
+            render.finalize_output(
+                final_output_path, final_name, duration, bg_music_path, bg_music_volume, final_audio_volume,
+                metadata=dict(
+                    title="Motivational Quotes Video for Work Out and Exercise",  # Replace with your desired title
+                    artist="Stoistica",  # Replace with your artist/channel name
+                    genre="Motivational",  # Replace with the appropriate genre
+                    copyright="Stoistica 2024",  # Replace with your copyright information
+                    description="Motivational Exercise Quotes Video for sleep, work out, inspiration - philosophy, stoicism, wisdom quote,"  # Replace with your video description
+                ),
+                music_crossfade=MUSIC_LOOP_CROSSFADE
             )
 
             # Cleanup
-            os.remove(final_video_path)
-            os.remove(final_output_path)
-            os.remove(output_video_with_audio)
-            os.remove("concat_list.txt")
+            job.cleanup()
 
             logging.info(f"Final video created: {final_name}")
             print(f"Final video created: {final_name}")
@@ -340,6 +291,7 @@ def create_final_video_sequence(bg_folder, fg_folder, title_folder, author_folde
         except Exception as e:
             logging.error(f"Error during iteration {i+1}: {e}")
             print(f"Error during iteration {i+1}: {e}")
+            job.keep()
 
 if __name__ == "__main__":
     bg_folder = r"I:\IntelDrive Dataset\Stoic+Samurai-Monk 10-11 Min Videos" ## "I:\IntelDrive Dataset\Stoic+Samurai-Monk 10-11 Min Videos" or "E:\Dataset\All Video BG\Watermarked\Horizontal"
@@ -3,6 +3,16 @@ import random
 import subprocess
 from datetime import datetime
 import logging
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import catalog as media_catalog
+from media_common import render
+from media_common import sampler as folder_sampler
+from media_common import planner as clip_planner
+from media_common import workspace
+from media_common import journal as render_journal
+from media_common import mezzanine
+from media_common import reservations as clip_reservations
 
 # Set the GPU ID to use
 gpu_id = 0  # Change this to select a different GPU (0, 1, etc.)
@@ -13,24 +23,6 @@ os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu_id)
 logging.basicConfig(filename='video_processing.log', level=logging.DEBUG,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-def insert_video_metadata(video_path, title, artist, genre, copyright, description):
-    """Inserts metadata into the video file using ffmpeg."""
-    command = [
-        "ffmpeg", "-i", video_path,
-        "-metadata", f"title={title}",
-        "-metadata", f"artist={artist}",
-        "-metadata", f"genre={genre}",
-        "-metadata", f"copyright={copyright}",
-        "-metadata", f"description={description}",
-        "-codec:v", "copy", "-codec:a", "copy",  # Copy video and audio streams without re-encoding
-        "-y", f"{os.path.splitext(video_path)[0]}_metadata.mp4"  # Output file with metadata
-    ]
-    subprocess.run(command, check=True)
-    logging.info(f"Metadata inserted into video: {video_path}")
-
-    # Replace the original video with the one containing metadata
-    os.replace(f"{os.path.splitext(video_path)[0]}_metadata.mp4", video_path)
-
 def try_remove_file(filepath):
     """Attempts to remove a file if it exists."""
     try:
@@ -45,6 +37,14 @@ def try_remove_file(filepath):
 # Attempt to remove the temporary final video file at the start
 try_remove_file(os.path.join("output", "final_video_1.mp4"))
 
+VIDEO_METADATA = {
+    "title": "Motivational Quotes Video for Work Out and Exercise",  # Replace with your desired title
+    "artist": "Stoistica",  # Replace with your artist/channel name
+    "genre": "Motivational",  # Replace with the appropriate genre
+    "copyright": "Stoistica 2024",  # Replace with your copyright information
+    "description": "Motivational Quotes Video for sleep, work out, inspiration - philosophy, stoicism, wisdom quote,"  # Replace with your video description
+}
+
 QUALITY_SETTINGS = {
     "Default": "2000k",
     "High": "4000k",
@@ -54,41 +54,49 @@ QUALITY_SETTINGS = {
 }
 
 def get_video_info(video_path):
-    """Retrieve video width and height using ffprobe."""
-    info = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0",
-                           "-show_entries", "stream=width,height", "-of", "csv=s=x:p=0", video_path],
-                          capture_output=True, text=True).stdout.strip().split('x')
-    return int(info[0]), int(info[1])
+    """Retrieve video width and height from the shared media catalog (probes only new or changed files)."""
+    return media_catalog.get_resolution(video_path)
 
 def get_video_duration(video_path):
-    """Retrieve video duration using ffprobe."""
-    duration = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0",
-                               "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", video_path],
-                              capture_output=True, text=True).stdout.strip()
-    return float(duration)
-
-def trim_video_to_duration(input_video, output_video, duration):
-    """Trims the video to the specified duration."""
-    command = [
-        "ffmpeg", "-hwaccel", "cuda", "-i", input_video, 
-        "-t", str(duration), "-c:v", "copy", "-c:a", "copy", 
-        "-y", output_video
-    ]
-    subprocess.run(command, check=True)
-    logging.info(f"Trimmed video {input_video} to {duration} seconds, saved as {output_video}")
+    """Retrieve video duration from the shared media catalog (probes only new or changed files)."""
+    return media_catalog.get_duration(video_path)
+
+# Draw history across runs: set to folder_sampler.DEFAULT_HISTORY_PATH to keep cycling through
+# clips earlier runs have not shown yet. None starts every run with a fresh shuffle.
+SAMPLER_HISTORY = None
+
+# Take background clips from the normalized mezzanine library (media_common.mezzanine), so they
+# always share codec, size and fps and concatenate with a plain stream copy.
+# Build it ahead of time with: python -m media_common.mezzanine vertical "<bg folder>"
+# Off by default: clips not yet in the library are transcoded (libx264 CRF 18) during the merge.
+USE_MEZZANINE = False
+
+# Encoder for the single_pass/segmented renders: "h264_nvenc" on the GPU boxes, "libx264" on CPU-only machines.
+RENDER_ENCODER = "h264_nvenc"
+# Number of parts the "segmented" render encodes side by side. None uses one per CPU core
+# (right for libx264); consumer NVENC cards only allow a few sessions at once, so keep it at 3-4 there.
+RENDER_SEGMENTS = 3
+# Read the foreground clips from the pre-keyed alpha cache (media_common.keyed) instead of
+# colorkeying them in every render. Clips missing from the cache are keyed into ProRes 4444
+# (about 1 GB per minute) during the render, so warm it first with:
+# python -m media_common.keyed "<fg folder>"
+USE_KEYED_CACHE = False
+# Iterations rendered side by side, each by its own copy of this script. The copies draw their clips
+# through a shared reservation file (media_common.reservations), so no two of them ever use the same
+# foreground or background clip. Every copy runs its own encodes: with NVENC keep
+# ITERATION_WORKERS x RENDER_SEGMENTS within the card's session limit.
+ITERATION_WORKERS = 1
 
 def select_random_video_without_reuse(folder, used_videos):
-    """Selects a random video from a folder, ensuring no duplicates."""
-    videos = [os.path.join(root, file)
-              for root, _, files in os.walk(folder)
-              for file in files if file.endswith(".mp4") and os.path.join(root, file) not in used_videos]
-    
-    if not videos:
-        raise FileNotFoundError(f"No more unused videos found in {folder}. All videos have been used.")
-    
-    selected_video = random.choice(videos)
-    used_videos.add(selected_video)
-    return selected_video
+    """Draws the next video from the folder's shuffle bag, skipping videos already used.
+
+    The folder is indexed once per run and refilled automatically when every video has been used.
+    """
+    return get_folder_sampler(folder).draw(used_videos)
+
+def get_folder_sampler(folder):
+    """Returns this run's shuffle bag for a folder."""
+    return folder_sampler.get_sampler(folder, (".mp4",), history_path=SAMPLER_HISTORY)
 
 def ensure_unique_bg_videos(duration_folder, used_videos, required_duration):
     """Select background videos without duplication to meet or exceed the required duration."""
@@ -118,11 +126,15 @@ def ensure_unique_bg_videos(duration_folder, used_videos, required_duration):
 
     return bg_videos
 
-def merge_videos(bg_paths, fg_path, output_video_path, zoom=1.0, x_offset=0, y_offset=0, quality="Default", use_color_keying=True):
+def merge_videos(bg_paths, fg_path, output_video_path, zoom=1.0, x_offset=0, y_offset=0, quality="Default", use_color_keying=True, workdir="."):
     """Merges background and foreground videos, optionally using color keying, applying zoom and offsets, while retaining audio."""
     logging.info(f"Merging videos with foreground: {fg_path} and backgrounds: {bg_paths}")
     
     try:
+        # Backgrounds from the normalized mezzanine library always join with the stream copy below
+        if USE_MEZZANINE:
+            bg_paths = mezzanine.conform_all(bg_paths)
+
         fg_width, fg_height = get_video_info(fg_path)
         bg_width, bg_height = get_video_info(bg_paths[0])  # Assume all background videos have the same resolution
         
@@ -136,13 +148,14 @@ def merge_videos(bg_paths, fg_path, output_video_path, zoom=1.0, x_offset=0, y_o
 
         # Concatenate background videos if multiple
         if len(bg_paths) > 1:
-            with open("bg_concat_list.txt", "w") as f:
+            bg_list_path = os.path.join(workdir, "bg_concat_list.txt")
+            with open(bg_list_path, "w") as f:
                 for bg_path in bg_paths:
                     f.write(f"file '{bg_path}'\n")
             
-            bg_concat_path = "concatenated_bg.mp4"
+            bg_concat_path = os.path.join(workdir, "concatenated_bg.mp4")
             command = [
-                "ffmpeg", "-f", "concat", "-safe", "0", "-i", "bg_concat_list.txt",
+                "ffmpeg", "-f", "concat", "-safe", "0", "-i", bg_list_path,
                 "-c:v", "copy", "-y", bg_concat_path
             ]
             subprocess.run(command, check=True)
@@ -155,16 +168,18 @@ def merge_videos(bg_paths, fg_path, output_video_path, zoom=1.0, x_offset=0, y_o
         else:
             filter_complex = f"[1:v]scale={scaled_fg_width}:{scaled_fg_height}[fg];[0:v][fg]overlay=x={x_center_offset}:y={y_center_offset}[video]"
 
+        # Encoded under a temporary name and renamed once complete, so a failed encode never
+        # leaves a truncated output_video_path for the journal to take as finished
+        temp_output = f"{os.path.splitext(output_video_path)[0]}.partial.mp4"
         command = [
             "ffmpeg", "-hwaccel", "cuda", "-i", bg_concat_path, "-i", fg_path,
             "-filter_complex", filter_complex,
             "-map", "[video]", "-map", "1:a?",  # Include the audio from the foreground video if it exists
             "-c:v", "h264_nvenc", "-preset", "slow", "-b:v", bitrate, "-c:a", "aac", "-b:a", "192k",
-            "-y", output_video_path
+            "-y", temp_output
         ]
-        result = subprocess.run(command, capture_output=True, text=True)
-        logging.info(f"FFmpeg output:\n{result.stdout}")
-        logging.error(f"FFmpeg errors:\n{result.stderr}")
+        render.run_ffmpeg(command)
+        os.replace(temp_output, output_video_path)
     except Exception as e:
         logging.error(f"Error during video merging: {e}")
         raise
@@ -172,7 +187,7 @@ def merge_videos(bg_paths, fg_path, output_video_path, zoom=1.0, x_offset=0, y_o
     # Cleanup
     if len(bg_paths) > 1:
         os.remove(bg_concat_path)
-        os.remove("bg_concat_list.txt")
+        os.remove(bg_list_path)
 
 def select_random_audio(folder, used_audios):
     """Selects a random audio file from a folder."""
@@ -184,43 +199,36 @@ def select_random_audio(folder, used_audios):
     used_audios.add(selected_audio)
     return selected_audio
 
-def merge_audio_to_video(video_path, bg_music, bg_music_volume=0, final_audio_volume=0, used_audios=set()):
-    """Merges background music into a video and returns the output path and first two words of the audio file name."""
-    logging.info(f"Merging audio to video: {video_path} with background music: {bg_music}")
-    
-    video_duration = get_video_duration(video_path)
-
-    if os.path.isdir(bg_music):
-        bg_music_path = select_random_audio(bg_music, used_audios)
-    else:
-        bg_music_path = bg_music
-
-    # Extract first two words from the audio file name
-    audio_file_name = os.path.basename(bg_music_path)
-    first_two_words = ' '.join(audio_file_name.split()[:2])
-
-    # Create background music looped to video duration
-    looped_audio_path = "looped_audio.wav"
-    subprocess.run(["ffmpeg", "-stream_loop", "-1", "-i", bg_music_path, "-t", str(video_duration), "-y", looped_audio_path], check=True)
+def concat_video_sequence(video_sequence, concat_list_path, output_path):
+    """Concatenates the foreground sequence into a single video file."""
+    with open(concat_list_path, "w") as f:
+        for video_path in video_sequence:
+            f.write(f"file '{video_path}'\n")
 
-    # Merge the video with the looped background music
-    output_video_path = f"{os.path.splitext(video_path)[0]}_with_audio.mp4"
+    # Encoded under a temporary name and renamed once complete (see merge_videos)
+    temp_output = f"{os.path.splitext(output_path)[0]}.partial.mp4"
     command = [
-        "ffmpeg", "-hwaccel", "cuda", "-i", video_path, "-i", looped_audio_path,
-        "-filter_complex", f"[1:a]volume={bg_music_volume}dB[aud];[0:a][aud]amix=inputs=2:duration=first[a];"
-                           f"[a]volume={final_audio_volume}dB[out]",
-        "-map", "0:v", "-map", "[out]", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", "-shortest", "-y", output_video_path
+        "ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_list_path,
+        "-c:v", "h264_nvenc", "-preset", "slow", "-y", temp_output
     ]
-    subprocess.run(command, check=True)
-    
-    # Cleanup intermediate files
-    os.remove(looped_audio_path)
+    render.run_ffmpeg(command)
+    os.replace(temp_output, output_path)
+    return output_path
+
+# Seconds of crossfade at each seam where the background music loops (0 = plain gapless loop)
+MUSIC_LOOP_CROSSFADE = 0
 
-    return output_video_path, first_two_words
+def create_final_video_sequence(bg_folder, fg_folder, title_folder, author_folder, stoistica_folder, book_folder, motivation_folder, output_folder, duration, iterations, quality, bg_music, bg_music_volume, final_audio_volume, altbg1_folder, altbg2_folder, altbg3_folder, altbg4_folder, altbg5_folder, altbg6_folder, render_mode="single_pass"):
+    """Creates the final video sequence with the new folder and alternating altbg logic.
 
+    render_mode "single_pass" compiles the whole timeline into one ffmpeg filter graph and
+    encodes the final file once; "segmented" plans the same timeline but encodes it in
+    RENDER_SEGMENTS parallel parts joined without re-encoding (for the multi-hour outputs);
+    "legacy" keeps the old merge/concat/remux chain.
 
-def create_final_video_sequence(bg_folder, fg_folder, title_folder, author_folder, stoistica_folder, book_folder, motivation_folder, output_folder, duration, iterations, quality, bg_music, bg_music_volume, final_audio_volume, altbg1_folder, altbg2_folder, altbg3_folder, altbg4_folder, altbg5_folder, altbg6_folder):
-    """Creates the final video sequence with the new folder and alternating altbg logic."""
+    With ITERATION_WORKERS > 1 the iterations are split between that many worker copies of the
+    script; iteration i still writes the file and journal it would in a sequential run.
+    """
     
     duration_folders = {
         59: "1 Minute",
@@ -258,117 +266,163 @@ def create_final_video_sequence(bg_folder, fg_folder, title_folder, author_folde
     used_videos = set()  # Track already used videos
     used_audios = set()  # Track already used audio files
 
-    for i in range(iterations):
+    if ITERATION_WORKERS > 1 and clip_reservations.worker_slot() is None:
+        # Start the worker copies, which share out the iterations between them, and wait for them
+        clip_reservations.run_workers(__file__, min(ITERATION_WORKERS, iterations))
+        return
+    # In a worker copy, clips are reserved batch-wide instead of in the sets above
+    reservations = clip_reservations.worker_reservations()
+
+    for i in clip_reservations.worker_iterations(iterations):
+        if reservations:
+            used_videos = used_audios = reservations.owner(f"iteration_{i+1}")
+        # The journal keeps this iteration's clips and finished stages, so rerunning the script
+        # after a crash resumes the same video from its last good file instead of starting over
+        journal = render_journal.open_journal(os.path.basename(__file__), os.path.abspath(output_folder), duration, render_mode, i + 1)
+        # Each iteration gets its own scratch folder so parallel runs never share temp files
+        job = workspace.JobWorkspace(f"iteration_{i+1}_", path=journal.get("workspace"))
+        journal.set("workspace", job.path)
         try:
             logging.info(f"Starting iteration {i+1} of {iterations}")
-            
-            # Select and merge background videos
-            bg_videos = []
-            total_bg_duration = 0
-
-            # Select from bg_folder first
-            selected_video = select_random_video_without_reuse(bg_folder, used_videos)
-            bg_videos.append(selected_video)
-            total_bg_duration += get_video_duration(selected_video)
-
-            # Now rotate between altbg1, altbg2, altbg3
-            altbg_folders = [altbg1_folder, altbg2_folder, altbg3_folder, altbg4_folder]
-            altbg_index = 0  # To track which altbg folder is currently in use
-
-            # Loop to add videos from alternating altbg folders
-            for _ in range(3):  # Control how many altbg videos you want to insert
-                selected_altbg = altbg_folders[altbg_index]
-                altbg_video = select_random_video_without_reuse(selected_altbg, used_videos)
-                bg_videos.append(altbg_video)
-                total_bg_duration += get_video_duration(altbg_video)
-                altbg_index = (altbg_index + 1) % len(altbg_folders)  # Rotate through altbg folders
-
-            # Check if total duration is met, continue selecting from bg_folder if needed
-            while total_bg_duration < duration:
-                next_bg_video = select_random_video_without_reuse(bg_folder, used_videos)
-                bg_videos.append(next_bg_video)
-                total_bg_duration += get_video_duration(next_bg_video)
-
-            # Select title video
-            title_video_path = select_random_video_without_reuse(title_folder, used_videos)
-            video_sequence = [title_video_path]  # Start with title video
-
-            # Build the video sequence in the new order: FG, FG, Stoistica, FG, FG, Author, Book, Motivation
-            folders_sequence = [fg_folder, fg_folder, stoistica_folder, fg_folder, fg_folder, author_folder, book_folder, motivation_folder, title_folder]
-            total_duration = get_video_duration(title_video_path)
-
-            # Add videos to the sequence until the total duration is met
-            while total_duration < duration:
-                for folder in folders_sequence:
-                    if total_duration >= duration:
-                        break
-                    fg_video_path = select_random_video_without_reuse(folder, used_videos)
-                    
-                    # Determine whether to use color keying based on the folder
-                    use_color_keying = (folder != title_folder)
 
-                    # Define a temporary output file path for the merged video
-                    final_output_path = os.path.join(output_folder, f"temp_output_{i}.mp4")
-
-                    # Merge videos with or without color keying
-                    merge_videos(bg_videos, fg_video_path, final_output_path, quality=quality, use_color_keying=use_color_keying)
-
-                    fg_duration = get_video_duration(fg_video_path)
-                    total_duration += fg_duration
+            plan = journal.get("plan")
+            if plan is None:
+                # Select and merge background videos
+                bg_videos = []
+                total_bg_duration = 0
+
+                # Select from bg_folder first
+                selected_video = select_random_video_without_reuse(bg_folder, used_videos)
+                bg_videos.append(selected_video)
+                total_bg_duration += get_video_duration(selected_video)
+
+                # Now rotate between altbg1, altbg2, altbg3
+                altbg_folders = [altbg1_folder, altbg2_folder, altbg3_folder, altbg4_folder]
+                altbg_index = 0  # To track which altbg folder is currently in use
+
+                # Loop to add videos from alternating altbg folders
+                for _ in range(3):  # Control how many altbg videos you want to insert
+                    selected_altbg = altbg_folders[altbg_index]
+                    altbg_video = select_random_video_without_reuse(selected_altbg, used_videos)
+                    bg_videos.append(altbg_video)
+                    total_bg_duration += get_video_duration(altbg_video)
+                    altbg_index = (altbg_index + 1) % len(altbg_folders)  # Rotate through altbg folders
+
+                # Check if total duration is met, continue selecting from bg_folder if needed
+                while total_bg_duration < duration:
+                    next_bg_video = select_random_video_without_reuse(bg_folder, used_videos)
+                    bg_videos.append(next_bg_video)
+                    total_bg_duration += get_video_duration(next_bg_video)
+
+                # Select title video
+                title_video_path = select_random_video_without_reuse(title_folder, used_videos)
+                video_sequence = [title_video_path]  # Start with title video
+
+                # Build the video sequence in the new order: FG, FG, Stoistica, FG, FG, Author, Book, Motivation
+                folders_sequence = [fg_folder, fg_folder, stoistica_folder, fg_folder, fg_folder, author_folder, book_folder, motivation_folder, title_folder]
+                total_duration = get_video_duration(title_video_path)
+                timeline = [{"path": title_video_path, "duration": total_duration, "keyed": False}]
+                cut_point = duration
+
+                if render_mode in ("single_pass", "segmented"):
+                    # Plan the clips from cached durations so the sequence lands on the target length
+                    # and the encode stops at the exact cut point instead of trimming afterwards
+                    cycle = [(folder, folder != title_folder) for folder in folders_sequence]
+                    timeline, cut_point = clip_planner.plan_sequence(cycle, duration, used_videos, get_folder_sampler, sequence=timeline)
+                    video_sequence = [clip["path"] for clip in timeline]
+                else:
+                    # Add videos to the sequence until the total duration is met
+                    while total_duration < duration:
+                        for folder in folders_sequence:
+                            if total_duration >= duration:
+                                break
+                            fg_video_path = select_random_video_without_reuse(folder, used_videos)
+                    
+                            # Determine whether to use color keying based on the folder
+                            use_color_keying = (folder != title_folder)
 
-                    logging.info(f"Added {fg_video_path} with duration {fg_duration}, total duration: {total_duration}")
+                            # Define a temporary output file path for the merged video
+                            final_output_path = job.file(f"temp_output_{i}.mp4")
 
-            # Concatenate the video sequence into a single video file
-            with open("concat_list.txt", "w") as f:
-                for video_path in video_sequence:
-                    f.write(f"file '{video_path}'\n")
+                            # Merge videos with or without color keying
+                            merge_videos(bg_videos, fg_video_path, final_output_path, quality=quality, use_color_keying=use_color_keying, workdir=job.path)
 
-            final_video_path = os.path.join(output_folder, f"final_video_{i+1}.mp4")
-            command = [
-                "ffmpeg", "-f", "concat", "-safe", "0", "-i", "concat_list.txt",
-                "-c:v", "h264_nvenc", "-preset", "slow", "-y", final_video_path
-            ]
-            result = subprocess.run(command, capture_output=True, text=True)
-            logging.info(f"FFmpeg output: {result.stdout}")
-            logging.error(f"FFmpeg errors: {result.stderr}")
+                            fg_duration = get_video_duration(fg_video_path)
+                            total_duration += fg_duration
 
-            # Merge background videos
-            final_output_path = os.path.join(output_folder, f"final_output_{i}.mp4")
-            merge_videos(bg_videos, final_video_path, final_output_path, quality=quality)
+                            logging.info(f"Added {fg_video_path} with duration {fg_duration}, total duration: {total_duration}")
 
-            # Merge audio
-            output_video_with_audio, first_two_words = merge_audio_to_video(final_output_path, bg_music, bg_music_volume, final_audio_volume, used_audios)
+                plan = journal.set("plan", {"bg_videos": bg_videos, "video_sequence": video_sequence,
+                                            "timeline": timeline, "cut_point": cut_point})
+            else:
+                logging.info(f"Resuming iteration {i+1} with the clips recorded in {journal.path}")
+                used_videos.update(plan["bg_videos"] + plan["video_sequence"])
+            bg_videos, video_sequence = plan["bg_videos"], plan["video_sequence"]
+            timeline, cut_point = plan["timeline"], plan["cut_point"]
 
-            # Ensure the final video duration does not exceed the set duration
-            trimmed_output_path = os.path.join(output_folder, f"final_video_trimmed_{i}.mp4")
-            trim_video_to_duration(output_video_with_audio, trimmed_output_path, duration)
+            bg_music_path = journal.get("bg_music_path")
+            if bg_music_path is None:
+                bg_music_path = select_random_audio(bg_music, used_audios) if os.path.isdir(bg_music) else bg_music
+                journal.set("bg_music_path", bg_music_path)
+            first_two_words = ' '.join(os.path.basename(bg_music_path).split()[:2])
 
             # Add duration, altbg_category, and first two words of audio file to the final file name
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             altbg_label = f"[{altbg_category}]" if altbg_category else ""
-            
-            # Construct the final name
-            final_name = os.path.join(
-                output_folder, 
+            final_name = journal.setdefault("final_name", os.path.join(
+                output_folder,
                 f"{duration_label}{altbg_label}[{first_two_words}]Motivational_Quotes_Video_{timestamp}_{i}.mp4"
+            ))
+
+            if render_mode in ("single_pass", "segmented"):
+                if USE_MEZZANINE:
+                    bg_videos = mezzanine.conform_all(bg_videos)
+
+                # Title, quote clips, backgrounds, keying, music bed, cut and metadata in one encode
+                render_options = dict(
+                    quality=quality, bg_music_path=bg_music_path, bg_music_volume=bg_music_volume,
+                    final_audio_volume=final_audio_volume, metadata=VIDEO_METADATA,
+                    music_crossfade=MUSIC_LOOP_CROSSFADE, encoder=RENDER_ENCODER, prekeyed=USE_KEYED_CACHE
+                )
+                if render_mode == "segmented":
+                    # Finished segments are journaled, so a crashed render only re-encodes the missing parts
+                    render.render_timeline_segmented(bg_videos, timeline, final_name, cut_point, job.path,
+                                                     segments=RENDER_SEGMENTS, journal=journal, **render_options)
+                else:
+                    journal.stage("render", [bg_videos, timeline, cut_point, render_options],
+                                  lambda: render.render_timeline(bg_videos, timeline, final_name, cut_point, job.path, **render_options))
+
+                logging.info(f"Final video created: {final_name}")
+                print(f"Final video created: {final_name}")
+                journal.finish()
+                job.cleanup()
+                continue
+
+            # Each stage below is journaled: after a crash, finished stages are skipped and
+            # the run picks up from the last file that was written completely
+            # Concatenate the video sequence into a single video file
+            final_video_path = journal.stage(
+                "concat", [video_sequence],
+                lambda: concat_video_sequence(video_sequence, job.file("concat_list.txt"), job.file(f"final_video_{i+1}.mp4"))
             )
-            os.rename(trimmed_output_path, final_name)
-
-            # Insert metadata
-            insert_video_metadata(
-                final_name,
-                title="Motivational Quotes Video for Work Out and Exercise",  # Replace with your desired title
-                artist="Stoistica",  # Replace with your artist/channel name
-                genre="Motivational",  # Replace with the appropriate genre
-                copyright="Stoistica 2024",  # Replace with your copyright information
-                description="Motivational Quotes Video for sleep, work out, inspiration - philosophy, stoicism, wisdom quote,"  # Replace with your video description
-            )
+
+            # Merge background videos
+            final_output_path = job.file(f"final_output_{i}.mp4")
+            journal.stage("merge_background", [bg_videos, final_video_path, quality],
+                          lambda: merge_videos(bg_videos, final_video_path, final_output_path, quality=quality, workdir=job.path),
+                          output=final_output_path)
+
+            # Music mix, cut to the set duration, metadata and faststart in one remux; it is written
+            # under a temporary name and only renamed to final_name once complete
+            journal.stage("finalize", [final_output_path, bg_music_path, bg_music_volume, final_audio_volume,
+                                       MUSIC_LOOP_CROSSFADE, duration, VIDEO_METADATA],
+                          lambda: render.finalize_output(final_output_path, final_name, duration, bg_music_path,
+                                                         bg_music_volume, final_audio_volume, VIDEO_METADATA,
+                                                         MUSIC_LOOP_CROSSFADE))
 
             # Cleanup
-            os.remove(final_video_path)
-            os.remove(final_output_path)
-            os.remove(output_video_with_audio)
-            os.remove("concat_list.txt")
+            journal.finish()
+            job.cleanup()
 
             logging.info(f"Final video created: {final_name}")
             print(f"Final video created: {final_name}")
@@ -376,6 +430,15 @@ def create_final_video_sequence(bg_folder, fg_folder, title_folder, author_folde
         except Exception as e:
             logging.error(f"Error during iteration {i+1}: {e}")
             print(f"Error during iteration {i+1}: {e}")
+            if journal.fail(e):
+                job.keep()
+            else:
+                # Failed too often with these clips: the next run plans the iteration from scratch
+                job.cleanup()
+        finally:
+            if reservations:
+                # Its clips stay reserved, but a folder that runs dry may now recycle them
+                reservations.release(f"iteration_{i+1}")
 
 
 def select_next_altbg_folder():
@@ -398,6 +461,7 @@ if __name__ == "__main__":
     duration = 30*60  # Options: duration in seconds (e.g., 59, 119, 599, 30 * 60, 3599, 23795 ,28799, 32948, 40270)
     iterations = 1  # Number of iterations to generate
     quality = "Extreme"  # Options: "Default", "High", "Higher", "Intense", "Extreme"
+    render_mode = "single_pass"  # Options: "single_pass" (one encode for the whole timeline), "segmented" (parallel parts, for multi-hour outputs), "legacy"
     bg_music_volume = 0  # Volume adjustment in decibels, 0 is default, negative values reduce volume
     final_audio_volume = 9  # in dB
     
@@ -421,5 +485,5 @@ if __name__ == "__main__":
         bg_folder, fg_folder, title_folder, author_folder, stoistica_folder,
         book_folder, motivation_folder, output_folder, duration, iterations, quality,
         bg_music, bg_music_volume, final_audio_volume,
-        altbg1_folder, altbg2_folder, altbg3_folder, altbg4_folder, altbg5_folder, altbg6_folder
+        altbg1_folder, altbg2_folder, altbg3_folder, altbg4_folder, altbg5_folder, altbg6_folder, render_mode
     )
\ No newline at end of file
@@ -1,30 +1,56 @@
 import replicate
 import time
 import os
-import requests
+import sys
 from PIL import Image
 from io import BytesIO
 import hashlib
 import datetime
 import re  # Import regex to clean filenames
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import http_client
+from media_common import store as media_store
 
 # Set your Replicate API token as an environment variable or directly here
 os.environ["REPLICATE_API_TOKEN"] = "id_key"
+# To run against a local stand-in for the Replicate API, set REPLICATE_BASE_URL
+# (e.g. http://localhost:8080); the replicate client reads it itself.
 
 # Set the output folder for images
 output_folder = "output_images_2ndrun"
 os.makedirs(output_folder, exist_ok=True)
 
+# First poll interval in seconds; it grows by half each poll, up to generate_image's wait_time
+POLL_INTERVAL = 1.0
+
+# Predictions running at once in batch mode (generate_batch)
+MAX_IN_FLIGHT = 4
+
+# Pillow's name for each output_format, to tell whether the returned bytes can be saved as they are
+PIL_FORMATS = {"jpg": "JPEG", "jpeg": "JPEG", "webp": "WEBP", "png": "PNG"}
+
+# Keep each unique file once in the content-addressed store (media_common.store) and hardlink
+# it into the output folders. Set to False to write plain files as before.
+USE_STORE = True
+
 # Function to clean the filename by removing or replacing illegal characters
 def clean_filename(filename):
     return re.sub(r'[<>:"/\\|?*]', '', filename)
 
-# Function to download the image and save it
-def save_image(url, output_folder, prompt, image_format, output_quality):
-    response = requests.get(url)
-    img = Image.open(BytesIO(response.content))
+# Function to download the image through the shared pooled client
+def fetch_image(url):
+    response = http_client.default_client().get(url)
+    response.raise_for_status()
+    return response.content
+
+# Function to save the downloaded image
+def save_image(image_content, output_folder, prompt, image_format, output_quality):
+    img = Image.open(BytesIO(image_content))  # Reads the header only; pixels are decoded on demand
     
-    # Generate file name based on the first 6 words of the prompt and a timestamp
+    # Generate file name based on the first 6 words of the prompt, a timestamp and the content hash
+    # (batch mode saves several images per second)
     first_words = '_'.join(prompt.split()[:6])
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
     
@@ -33,31 +59,33 @@ def save_image(url, output_folder, prompt, image_format, output_quality):
     
     # Set file extension based on the desired output format
     file_extension = image_format.lower()
-    file_name = f'{first_words}_{timestamp}.{file_extension}'
+    file_name = f'{first_words}_{timestamp}_{get_image_hash(image_content)[:8]}.{file_extension}'
     
     file_path = os.path.join(output_folder, file_name)
     
-    # Save with specified quality if not a PNG
-    if file_extension == 'png':
+    if img.format == PIL_FORMATS.get(file_extension):
+        # Already in the requested format (Replicate applied output_quality): write the bytes as they are
+        with open(file_path, 'wb') as f:
+            f.write(image_content)
+    elif file_extension == 'png':
         img.save(file_path)
     else:
+        # Save with specified quality if not a PNG
         img.save(file_path, quality=output_quality)
+
+    # A repeat of an image already saved becomes a link to the stored copy
+    if USE_STORE:
+        media_store.put_file(file_path)
     
     return file_path
 
 # Function to get the hash of the image content
-def get_image_hash(image_url):
-    response = requests.get(image_url)
-    return hashlib.md5(response.content).hexdigest()
-
-# Main program logic
-def generate_image(prompt, model_name="black-forest-labs/flux-1.1-pro", max_iterations=10, wait_time=15, seed=None, width=512, height=512, aspect_ratio="1:1", image_format="webp", output_quality=80, safety_tolerance=2, prompt_upsampling=True):
-    
-    previous_hash = None
-    same_image_count = 0
+def get_image_hash(image_content):
+    return hashlib.md5(image_content).hexdigest()
 
-    # Prepare the input for the API with new parameters
-    input_data = {
+# Prepare the input for the API with new parameters
+def build_input(prompt, seed=None, width=512, height=512, aspect_ratio="1:1", image_format="webp", output_quality=80, safety_tolerance=2, prompt_upsampling=True):
+    return {
         "prompt": prompt,
         "prompt_upsampling": prompt_upsampling,
         "seed": seed,
@@ -69,54 +97,98 @@ def generate_image(prompt, model_name="black-forest-labs/flux-1.1-pro", max_iter
         "safety_tolerance": safety_tolerance,
     }
 
+# Run one prediction to completion and download its image; returns the image bytes
+def run_prediction(model_name, input_data, wait_time=15):
+    client = http_client.default_client()
+
+    # Run the prediction (rate limited, with 429s and 5xx responses retried)
+    prediction = client.call(http_client.REPLICATE, replicate.predictions.create, model=model_name, input=input_data)
+    
+    # Poll for the image result, quickly at first and backing off to wait_time
+    poll_interval = min(POLL_INTERVAL, wait_time)
+    while prediction.status not in ["succeeded", "failed", "canceled"]:
+        print(f"Prediction {prediction.id} status: {prediction.status}. Waiting for completion...")
+        time.sleep(poll_interval)
+        poll_interval = min(poll_interval * 1.5, wait_time)
+        client.call(http_client.REPLICATE, prediction.reload)
+
+    if prediction.status != "succeeded":
+        raise RuntimeError(f"Prediction failed. Status: {prediction.status} {prediction.error or ''}")
+
+    # Debug output to inspect what the API returns
+    print(f"Prediction output: {prediction.output}")
+    image_url = prediction.output  # Removed [0] since output itself is the URL
+    if not isinstance(image_url, str) or not image_url.startswith('http'):
+        raise ValueError(f"Invalid image URL: {image_url}")
+
+    # Download the image once; hashing and saving both use these bytes
+    return fetch_image(image_url)
+
+# Main program logic
+def generate_image(prompt, model_name="black-forest-labs/flux-1.1-pro", max_iterations=10, wait_time=15, seed=None, width=512, height=512, aspect_ratio="1:1", image_format="webp", output_quality=80, safety_tolerance=2, prompt_upsampling=True):
+    
+    previous_hash = None
+    same_image_count = 0
+
+    input_data = build_input(prompt, seed, width, height, aspect_ratio, image_format, output_quality, safety_tolerance, prompt_upsampling)
+
     for i in range(max_iterations):
-        # Run the prediction
-        prediction = replicate.predictions.create(model=model_name, input=input_data)
-        
-        # Poll for the image result
-        while prediction.status not in ["succeeded", "failed"]:
-            print(f"Prediction status: {prediction.status}. Waiting for completion...")
-            time.sleep(wait_time)
-            prediction.reload()
-
-        if prediction.status == "succeeded":
-            # Debug output to inspect what the API returns
-            print(f"Prediction output: {prediction.output}")
-
-            # Try to get the image URL from the prediction output
-            try:
-                image_url = prediction.output  # Removed [0] since output itself is the URL
-                if not image_url.startswith('http'):
-                    raise ValueError(f"Invalid image URL: {image_url}")
-            except Exception as e:
-                print(f"Error fetching image URL: {e}")
-                break
-
-            # Get image hash to detect if the image is a duplicate
-            current_hash = get_image_hash(image_url)
-
-            # Compare hash to check if the image is the same as the last one
-            if current_hash == previous_hash:
-                same_image_count += 1
-                print(f"Same image detected {same_image_count} times in a row.")
-            else:
-                same_image_count = 0  # Reset the count if the image is different
-                previous_hash = current_hash
-
-            # Save the image
-            image_path = save_image(image_url, output_folder, prompt, image_format, output_quality)
-            print(f"Saved new image to {image_path}")
+        try:
+            image_content = run_prediction(model_name, input_data, wait_time)
+        except Exception as e:
+            print(f"Error generating image: {e}")
+            break
 
-            # Stop if the image is the same 3 times in a row
-            if same_image_count >= 3:
-                print("Image has not changed for 3 consecutive checks. Stopping.")
-                break
+        # Hash the image to detect if the image is a duplicate
+        current_hash = get_image_hash(image_content)
+
+        # Compare hash to check if the image is the same as the last one
+        if current_hash == previous_hash:
+            same_image_count += 1
+            print(f"Same image detected {same_image_count} times in a row.")
         else:
-            print(f"Prediction failed. Status: {prediction.status}")
+            same_image_count = 0  # Reset the count if the image is different
+            previous_hash = current_hash
+
+        # Save the image
+        image_path = save_image(image_content, output_folder, prompt, image_format, output_quality)
+        print(f"Saved new image to {image_path}")
+
+        # Stop if the image is the same 3 times in a row
+        if same_image_count >= 3:
+            print("Image has not changed for 3 consecutive checks. Stopping.")
             break
 
-        # Wait before checking the next prediction
-        time.sleep(wait_time)
+# Batch mode: every prompt x iteration is submitted at once, with at most max_in_flight
+# predictions running; images are saved as they finish and exact repeats are skipped
+def generate_batch(prompts, iterations=1, model_name="black-forest-labs/flux-1.1-pro", max_in_flight=MAX_IN_FLIGHT, wait_time=15, image_format="webp", output_quality=80, **settings):
+    seen_hashes = set()
+    saved = []
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as executor:
+        futures = {}
+        for prompt in prompts:
+            input_data = build_input(prompt, image_format=image_format, output_quality=output_quality, **settings)
+            for _ in range(iterations):
+                futures[executor.submit(run_prediction, model_name, input_data, wait_time)] = prompt
+
+        for future in as_completed(futures):
+            prompt = futures[future]
+            try:
+                image_content = future.result()
+            except Exception as e:
+                print(f"Error generating image for '{prompt[:40]}...': {e}")
+                continue
+
+            current_hash = get_image_hash(image_content)
+            if current_hash in seen_hashes:
+                print("Same image returned again. Skipping.")
+                continue
+            seen_hashes.add(current_hash)
+
+            image_path = save_image(image_content, output_folder, prompt, image_format, output_quality)
+            print(f"Saved new image to {image_path}")
+            saved.append(image_path)
+    return saved
 
 if __name__ == "__main__":
     # Example prompt with new adjustable parameters
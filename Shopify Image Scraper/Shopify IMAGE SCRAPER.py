@@ -3,16 +3,36 @@ from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver import Chrome
 import io
 import time
 import re
 import os
+import sys
+from urllib.parse import urlsplit
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import store as media_store
+from media_common import http_client
+from media_common import downloader
 
-# Initialize a Chrome WebDriver object
-service = Service(executable_path='G:\\ScrapeSCRAPE\\chromedriver_win32\\chromedriver.exe') 
-driver = webdriver.Chrome(service=service)
+# Keep each unique file once in the content-addressed store (media_common.store) and hardlink
+# it into the output folders. Set to False to write plain files as before.
+USE_STORE = True
+
+# Read products from the store's product JSON (/products/<handle>.json) and download the images
+# on a pool of workers. Chrome is only started for pages that have no product JSON.
+USE_PRODUCT_JSON = True
+DOWNLOAD_WORKERS = downloader.DOWNLOAD_WORKERS
+
+# The Chrome WebDriver object, started on first use by get_driver()
+driver = None
+
+def get_driver():
+    global driver
+    if driver is None:
+        service = Service(executable_path='G:\\ScrapeSCRAPE\\chromedriver_win32\\chromedriver.exe') 
+        driver = webdriver.Chrome(service=service)
+    return driver
 
 
 # Specify the parent folder where the image folders should be created
@@ -39,18 +59,76 @@ imgloop = 0
 images = []
 
 
-# Read URLs from a text file
-with open("URLS.txt", "r") as file:
-    url_list = file.readlines()
-url_list = [url.strip() for url in url_list]
+def product_json_url(url):
+    """The product JSON endpoint for a product page URL, or None if it is not a /products/ page."""
+    parts = urlsplit(url)
+    match = re.search(r'/products/([^/?#.]+)', parts.path)
+    if not match:
+        return None
+    return f"{parts.scheme}://{parts.netloc}/products/{match.group(1)}.json"
+
+def image_url(src):
+    """Absolute image URL (the product JSON may use protocol-relative // links)."""
+    return 'https:' + src if src.startswith('//') else src
+
+def product_images(product):
+    """Maps each color of a product to its image URLs, from the product JSON.
+
+    Images are matched to colors through their variant ids; images tied to no variant
+    (shared shots) belong to every color, as they do in the page's gallery.
+    """
+    option_names = [option.get('name', '').lower() for option in product.get('options', [])]
+    color_index = next((i for i, name in enumerate(option_names) if 'color' in name or 'colour' in name), None)
+
+    variant_colors = {}
+    for variant in product.get('variants', []):
+        color = variant.get(f'option{color_index + 1}') if color_index is not None else None
+        variant_colors[variant['id']] = color or 'Default'
+    colors = list(dict.fromkeys(variant_colors.values())) or ['Default']
+
+    images = {color: [] for color in colors}
+    for image in product.get('images', []):
+        src = image_url(image['src'])
+        if src.endswith('.svg'):
+            continue
+        image_colors = {variant_colors[v] for v in image.get('variant_ids', []) if v in variant_colors}
+        for color in colors:
+            if (not image_colors or color in image_colors) and src not in images[color]:
+                images[color].append(src)
+    return images
+
+def scrape_product_json(url, parent_folder):
+    """Fetches the product JSON and returns (url, path) download jobs, or None to fall back to Chrome."""
+    json_url = product_json_url(url)
+    if not json_url:
+        return None
+    try:
+        response = http_client.default_client().get(json_url, timeout=30)
+        if not response.ok:
+            return None
+        product = response.json().get('product') or {}
+    except (requests.RequestException, ValueError) as e:
+        print(f'No product JSON for {url}: {e}')
+        return None
+    if not product.get('title'):
+        return None
 
-for url in url_list:
-# Define the webpage to go to
-    # Proxy info
-    proxy = f"YOUR PROXY INFO HERE"
-    response = requests.get(url, proxies={'http': proxy, 'https': proxy})
-    print('Starting Proxy')
-    time.sleep(3)  # Adding a delay of 2 seconds
+    title_text = product['title'].strip()
+    file_text = title_text.replace(':', '').replace('3/4', '').replace('/', ' ')
+    folder_path = os.path.join(parent_folder, file_text)
+    print(title_text)
+
+    jobs = []
+    for color_text, urls in product_images(product).items():
+        for imgloop, link in enumerate(urls):
+            desc = 'Bylt '+ color_text.replace('/', ' ') + ' - ' + file_text + ' - ' + str(imgloop)
+            jobs.append((link, os.path.join(folder_path, desc + '.jpg')))
+    return jobs
+
+def scrape_with_browser(url):
+    """The Chrome path: loads the page and clicks through the color swatches."""
+    global title_text, color_text, loop, imgloop, file_text
+    driver = get_driver()
     # Open the website in the Chrome browser
     driver.get(url)
     print('Loading Page')
@@ -62,10 +140,7 @@ for url in url_list:
     time.sleep(2)  # Adding a delay of 2 seconds
            
     # ######******THIS IS THE SWATCH STRIPPER******######
-    # Step 1: Find div tags with class names containing "option option-color"
-    color_tags = driver.find_elements(By.CSS_SELECTOR, "div[class*='option option-color']")
-    
-    # Step 2: Find div tags with class names containing "swatch-Color"
+    # Find div tags with class names containing "swatch-Color"
     div_tags = driver.find_elements(By.CSS_SELECTOR, "div[data-v-1d7925be=''][class*='swatch-Color not-selected'], div[data-v-1d7925be=''][class*='swatch-Color selected'],div[data-v-5a7b6834=''][class*='swatch-Color not-selected'], div[data-v-5a7b6834=''][class*='swatch-Color selected']")
 
     h3_tags = driver.find_elements(By.CSS_SELECTOR, "h3[data-v-5b1108e4=''][class*='option-label']")
@@ -148,6 +223,9 @@ for url in url_list:
                 response.raise_for_status()
                 with open(desc + '.jpg', 'wb') as f:
                     f.write(response.content)
+                # The same product shot under another color/title is linked to one stored copy
+                if USE_STORE:
+                    media_store.put_file(os.path.abspath(desc + '.jpg'), url=link)
                 print('Downloaded:', desc)
 
             except Exception as e:
@@ -164,8 +242,6 @@ for url in url_list:
 
     # Step 3: Click on each div tag and copy the URL from the browser
     for div_tag in div_tags:
-                          
-        action = ActionChains(driver)
         #driver.execute_script("arguments[0].scrollIntoView();", div_tag)
         driver.execute_script("arguments[0].click();", div_tag)
         time.sleep(2)  # Adding a delay of 2 seconds
@@ -214,5 +290,33 @@ for url in url_list:
     loop += 1
 
 
-#imagedown(url, folder_name)               
-print(loop, ' Pages Downloaded Complete')
\ No newline at end of file
+# Run as a script; check_product_json.py imports the functions above against a saved fixture
+if __name__ == "__main__":
+    # Read URLs from a text file
+    with open("URLS.txt", "r") as file:
+        url_list = file.readlines()
+    url_list = [url.strip() for url in url_list]
+
+    # Absolute, because the Chrome path changes the working directory
+    parent_folder = os.path.abspath(parent_folder)
+    jobs = []
+    for url in url_list:
+        product_jobs = scrape_product_json(url, parent_folder) if USE_PRODUCT_JSON else None
+        if product_jobs is None:
+            scrape_with_browser(url)
+            continue
+        jobs.extend(product_jobs)
+        loop += 1
+
+    # Download every image found through the product JSON at once
+    for link, path, downloaded, error in downloader.download_all(
+            jobs, DOWNLOAD_WORKERS, store=media_store.default_store() if USE_STORE else None):
+        if error is not None:
+            error_message = "An error occurred while downloading the image: " + str(error) + "\n"
+            with open(os.path.join(parent_folder, "error_log.txt"), "a") as error_file:
+                error_file.write(error_message)
+        elif downloaded:
+            print('Downloaded:', os.path.splitext(os.path.basename(path))[0])
+
+    #imagedown(url, folder_name)               
+    print(loop, ' Pages Downloaded Complete')
\ No newline at end of file
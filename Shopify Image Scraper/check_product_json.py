@@ -0,0 +1,106 @@
+"""Runs the product JSON path of the Shopify scraper against the saved fixture in fixtures/.
+
+A local HTTP server stands in for the store and its CDN, so no Chrome and no network are
+needed. Run it from anywhere with: python check_product_json.py
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import importlib.util
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "fixtures")
+CDN_HOSTS = ("https://cdn.shopify.com", "//cdn.shopify.com")
+
+work_dir = tempfile.mkdtemp(prefix="shopify_check_")
+# Keep the check's downloads out of the real manifest
+os.environ["MEDIA_DOWNLOAD_MANIFEST"] = os.path.join(work_dir, "manifest.sqlite3")
+
+
+class FixtureStore(BaseHTTPRequestHandler):
+    """Serves /products/<handle>.json from fixtures/ (CDN links pointed here) and fake image bytes."""
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path.startswith("/products/") and path.endswith(".json"):
+            fixture = os.path.join(FIXTURES, os.path.basename(path))
+            if not os.path.exists(fixture):
+                self.send_error(404)
+                return
+            with open(fixture, "r", encoding="utf-8") as f:
+                body = f.read()
+            for host in CDN_HOSTS:
+                body = body.replace(host, self.server.base_url)
+            self.reply(body.encode("utf-8"), "application/json")
+        elif path.startswith("/s/files/"):
+            self.reply(f"image {os.path.basename(path)}".encode("utf-8"), "image/jpeg")
+        else:
+            self.send_error(404)
+
+    def reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def load_scraper():
+    spec = importlib.util.spec_from_file_location("shopify_image_scraper", os.path.join(HERE, "Shopify IMAGE SCRAPER.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    scraper = load_scraper()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureStore)
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        # Colors from the variants; the shared detail shot under both, the .svg chart under neither
+        with open(os.path.join(FIXTURES, "everyday-crew-tee.json"), "r", encoding="utf-8") as f:
+            images = scraper.product_images(json.load(f)["product"])
+        cdn = "https://cdn.shopify.com/s/files/1/0001/products/"
+        assert images == {
+            "Black": [cdn + "crew-black-front.jpg?v=1", cdn + "crew-fabric-detail.jpg?v=1"],
+            "Navy/White": [cdn + "crew-navy-front.jpg?v=1", cdn + "crew-fabric-detail.jpg?v=1"],
+        }, images
+
+        parent_folder = os.path.join(work_dir, "out")
+        jobs = scraper.scrape_product_json(f"{server.base_url}/products/everyday-crew-tee?variant=1", parent_folder)
+        folder = os.path.join(parent_folder, "Everyday Crew Tee")
+        expected = {
+            os.path.join(folder, "Bylt Black - Everyday Crew Tee - 0.jpg"): "crew-black-front.jpg",
+            os.path.join(folder, "Bylt Black - Everyday Crew Tee - 1.jpg"): "crew-fabric-detail.jpg",
+            os.path.join(folder, "Bylt Navy White - Everyday Crew Tee - 0.jpg"): "crew-navy-front.jpg",
+            os.path.join(folder, "Bylt Navy White - Everyday Crew Tee - 1.jpg"): "crew-fabric-detail.jpg",
+        }
+        assert sorted(path for _, path in jobs) == sorted(expected), jobs
+        assert scraper.scrape_product_json(f"{server.base_url}/collections/all", parent_folder) is None
+        assert scraper.scrape_product_json(f"{server.base_url}/products/missing", parent_folder) is None
+
+        # Every file lands, the shared shot in both colors; a second pass downloads nothing
+        results = list(scraper.downloader.download_all(jobs, 4))
+        assert all(error is None and downloaded for _, _, downloaded, error in results), results
+        for path, image in expected.items():
+            with open(path, "rb") as f:
+                assert f.read() == f"image {image}".encode("utf-8"), path
+        results = list(scraper.downloader.download_all(jobs, 4))
+        assert not any(downloaded for _, _, downloaded, _ in results), results
+        print(f"OK: {len(expected)} images from the product JSON fixture, none downloaded twice")
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
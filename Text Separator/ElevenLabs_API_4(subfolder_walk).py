@@ -3,6 +3,10 @@ import json
 import os
 import chardet
 import time
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import tts_cache
+from media_common import http_client
 
 # Define constants for the script
 CHUNK_SIZE = 4096
@@ -43,31 +47,27 @@ def process_text_file(text_path, audio_path):
         }
     }
 
-    # Make the POST request to the TTS API with headers and data, enabling streaming response
-    try:
-        response = requests.post(tts_url, headers=headers, json=data, stream=True)
-    except Exception as e:
-        print(f"Error making API request for {text_path}: {e}")
-        return False
-
-    # Check if the request was successful
-    if response.ok:
+    def synthesize(path):
+        # Stream the TTS response to the file through the shared client, which pools connections,
+        # paces requests and retries 429s and 5xx responses with backoff
         try:
-            # Open the output file in write-binary mode
-            with open(audio_path, "wb") as f:
-                # Read the response in chunks and write to the file
-                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                    f.write(chunk)
-            # Inform the user of success
-            print(f"Audio stream saved successfully to: {audio_path}")
+            http_client.default_client().download(tts_url, path, method="POST", headers=headers, json=data,
+                                                  chunk_size=CHUNK_SIZE)
             return True
+        except requests.HTTPError as e:
+            # Print the error message if the request was not successful
+            print(e.response.text)
+            return False
         except Exception as e:
-            print(f"Error saving audio for {text_path}: {e}")
+            print(f"Error making API request for {text_path}: {e}")
             return False
-    else:
-        # Print the error message if the request was not successful
-        print(response.text)
+
+    # Text already spoken with this voice and these settings comes from the local TTS cache, unbilled
+    if not tts_cache.fetch(audio_path, VOICE_ID, TEXT_TO_SPEAK, synthesize, data["model_id"], data["voice_settings"]):
         return False
+    # Inform the user of success
+    print(f"Audio stream saved successfully to: {audio_path}")
+    return True
 
 # Main loop to process text files in the folder
 while True:
@@ -81,6 +81,7 @@ while True:
         continue
 
     # Iterate through each subfolder
+    processed = 0
     for subfolder in subfolders:
         text_folder = os.path.join(subfolder, "Text")
         audio_folder = os.path.join(subfolder, "Audio")
@@ -107,9 +108,13 @@ while True:
             if process_text_file(text_path, audio_path):
                 # If successful, remove the original text file
                 os.remove(text_path)
+                processed += 1
             else:
                 # If failed, move to next file
                 continue
 
-        # Wait for 1 second before processing the next subfolder
-        time.sleep(1)
\ No newline at end of file
+    # The shared HTTP client paces the API calls, so only an idle pass waits before rescanning
+    if processed:
+        print(tts_cache.report())
+    else:
+        time.sleep(5)
\ No newline at end of file
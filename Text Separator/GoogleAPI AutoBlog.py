@@ -1,11 +1,16 @@
 import os
-import time
-import google.generativeai as genai
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import gemini
 
 # Access your API key as an environment variable.
-genai.configure(api_key="id_key")
+gemini.configure("id_key")
 # Choose a model that's appropriate for your use case.
-model = genai.GenerativeModel('gemini-1.5-flash')
+model_name = 'gemini-1.5-flash'
+
+# Files sent to Gemini at once; the shared rate limiter paces them, and responses already
+# in the cache (same file, prompt and model) are not sent again
+batch_workers = gemini.BATCH_WORKERS
 
 # Folder paths
 input_folder = r"E:\Python_Practice\Text Separator\text"
@@ -35,30 +40,24 @@ if not os.path.exists(input_folder):
 if not os.path.exists(output_folder):
     os.makedirs(output_folder)
 
-# Iterate through all files in the input folder
-for filename in os.listdir(input_folder):
-    # Check if the file is a .txt file
-    if filename.endswith(".txt"):
-        # Construct the full file path
-        filepath = os.path.join(input_folder, filename)
-
-        # Open the file and read its contents
-        with open(filepath, "r", encoding='utf-8') as f:  # Use utf-8 encoding
-            file_content = f.read()
+# Collect the .txt files in the input folder
+filepaths = [os.path.join(input_folder, filename) for filename in os.listdir(input_folder) if filename.endswith(".txt")]
 
-        # Construct the prompt
-        prompt = f"{file_content}\n\n{custom_text}"
+# Generate responses from the API (the file content followed by the custom text), saving each as it arrives
+for filepath, response_text, error in gemini.generate_files(filepaths, custom_text, model_name, workers=batch_workers):
+    filename = os.path.basename(filepath)
+    if error is not None:
+        print(f"Failed to process {filename}: {error}")
+        continue
 
-        # Generate response from the API
-        response = model.generate_content(prompt)
+    # Construct the output file name
+    output_filename = f"[Complete]-{filename}"
+    output_filepath = os.path.join(output_folder, output_filename)
 
-        # Construct the output file name
-        output_filename = f"[Complete]-{filename}"
-        output_filepath = os.path.join(output_folder, output_filename)
+    # Save the response to the output file
+    with open(output_filepath, "w", encoding='utf-8') as f:  # Use utf-8 encoding
+        f.write(response_text)
 
-        # Save the response to the output file
-        with open(output_filepath, "w", encoding='utf-8') as f:  # Use utf-8 encoding
-            f.write(response.text)
+    print(f"Processed file: {filename}")
 
-        print(f"Processed file: {filename}")
-        time.sleep(15)
\ No newline at end of file
+print(gemini.report())
\ No newline at end of file
@@ -1,14 +1,24 @@
 import os
-import time
-import requests
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import downloader
+from media_common import store as media_store
+
+# Parallel downloads; each host is still paced by media_common.downloader.HOST_LIMITS
+DOWNLOAD_WORKERS = downloader.DOWNLOAD_WORKERS
+
+# Keep each unique file once in the content-addressed store (media_common.store) and hardlink
+# it into the output folders. Set to False to write plain files as before.
+USE_STORE = True
 
 def download_urls(folder_path, main_output_folder):
     """
-    Reads .txt files in a folder, downloads URLs with a 15-second delay,
+    Reads .txt files in a folder, downloads the URLs on a pool of workers,
     and saves the downloaded content to individual folders named after the files,
     within a main output folder.
-    Skips URLs that have already been downloaded. Saves files as .mp4.
+    Skips URLs that have already been downloaded and resumes interrupted ones. Saves files as .mp4.
     """
+    jobs = []
     for filename in os.listdir(folder_path):
         if filename.endswith(".txt"):
             filepath = os.path.join(folder_path, filename)
@@ -29,18 +39,14 @@ def download_urls(folder_path, main_output_folder):
                             print(f"Skipping {url} - already downloaded.")
                             continue
 
-                        try:
-                            response = requests.get(url, stream=True)
-                            response.raise_for_status()
-
-                            with open(output_filepath, 'wb') as output_file:
-                                for chunk in response.iter_content(chunk_size=1024 * 1024):
-                                    output_file.write(chunk)
+                        jobs.append((url, output_filepath))
 
-                            print(f"Downloaded {url} to {full_output_folder}")
-                            time.sleep(15)
-                        except requests.exceptions.RequestException as e:
-                            print(f"Error downloading {url}: {e}")
+    for url, output_filepath, downloaded, error in downloader.download_all(
+            jobs, DOWNLOAD_WORKERS, store=media_store.default_store() if USE_STORE else None):
+        if error is not None:
+            print(f"Error downloading {url}: {error}")
+        elif downloaded:
+            print(f"Downloaded {url} to {os.path.dirname(output_filepath)}")
 
 if __name__ == "__main__":
     folder_path = r"E:\Dataset\PEXELS\ZZLinks"  # Folder with .txt files
@@ -1,76 +1,107 @@
 import requests
 from bs4 import BeautifulSoup
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import time
 import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import collector
 
-def scrape_and_format_links(url, filename="links.txt", folder="output"):
+LINK_SELECTOR = "a[data-testid='next-link']"
+
+def scrape_and_format_links(url, filename="links.txt", folder="output", driver=None, num_links=100):
     """
-    Scrapes video links from a given URL, formats them, and saves them to a text file.
+    Scrapes video links from a given URL, formats them, and appends them to a text file.
+    Ensures that no duplicate video IDs are saved, including IDs collected by earlier runs
+    (the ID index in media_common.collector), and stops scrolling once only known IDs show up.
     """
+    if driver is None:
+        # Single URL: borrow a browser from a one-session pool
+        return collector.collect_terms(
+            [url], lambda term, session: scrape_and_format_links(term, filename, folder, session, num_links), workers=1)[url]
+
     # Create output folder if it doesn't exist
     os.makedirs(folder, exist_ok=True)
+    index = collector.default_index()
 
-    # Create a file to store the links
+    # Open the file that stores the links (new links are added to those of earlier runs)
     filepath = os.path.join(folder, filename)
-    with open(filepath, "w") as f:
-        # Initialize browser
-        driver = webdriver.Chrome()  # Assuming you have ChromeDriver installed
+    with open(filepath, "a") as f:
         driver.get(url)
 
         # Load the page fully
         wait = WebDriverWait(driver, 10)
         wait.until(EC.presence_of_element_located((By.ID, "main-content")))
 
+        # Keep track of processed video IDs
+        processed_ids = set()
+
         # Loop through the page and extract links
         links_found = 0
-        while links_found < 100:
+        stale_rounds = 0
+        while links_found < num_links and stale_rounds < collector.STALE_ROUNDS:
             try:
                 # Get the main content
                 main_content = driver.find_element(By.ID, "main-content")
 
                 # Find all links
-                links = main_content.find_elements(By.CSS_SELECTOR, "a[data-testid='next-link']")
+                links = main_content.find_elements(By.CSS_SELECTOR, LINK_SELECTOR)
 
+                new_ids = 0
                 for link in links:
                     href = link.get_attribute("href")
                     if href:
                         # Check if the href starts with the expected pattern
                         if href.startswith("https://www.pexels.com/video"): 
-                            # Print the original href
-                            print(f"Original href: {href}") 
-
                             # Extract the video ID 
-                            #split_id = href.split("/")[-2]
                             video_id = href.split("/")[-2].split("-")[-1]
 
+                            # Links already seen on this page are checked once
+                            if video_id in processed_ids:
+                                continue
+                            processed_ids.add(video_id)
+
                             # Construct the new link format
                             new_link = f"https://www.pexels.com/download/video/{video_id}"
 
+                            # Check if the video_id was collected before
+                            if not index.add("pexels", video_id, new_link, url):
+                                print(f"Skipping known video: {video_id}")
+                                continue
+
                             # Print the link
                             print(f"Extracted Link: {new_link}")
 
                             # Write the link to the file
                             f.write(new_link + "\n")
+                            f.flush()
                             links_found += 1
+                            new_ids += 1
 
-                            # Stop when 100 links are found
-                            if links_found >= 100:
+                            # Stop when enough links are found
+                            if links_found >= num_links:
                                 break
+
                         else:
                             print(f"Skipping link: {href} - Does not match expected pattern.")
 
-                # Scroll down to load more videos
+                # A scroll that brings only known IDs counts towards stopping
+                stale_rounds = 0 if new_ids else stale_rounds + 1
+
+                # Scroll down and wait until more videos are loaded
                 driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)  # Give time for the page to load more videos
+                if not collector.wait_for_change(driver, f"#main-content {LINK_SELECTOR}", len(links)):
+                    break  # Nothing more to load
             except Exception as e:
                 print(f"Error scraping links: {e}")
                 break
 
-        driver.quit()
+    print(f"Collected {links_found} new links into {filepath}")
+    return links_found
 
-# Example usage
-scrape_and_format_links(r"https://www.pexels.com/search/videos/skateboarding/", filename="pexels_videos.txt")
\ No newline at end of file
+# Example usage: {search URL: output file}, collected in parallel on a shared pool of browsers
+search_urls = {
+    r"https://www.pexels.com/search/videos/skateboarding/": "pexels_videos.txt",
+}
+collector.collect_terms(search_urls, lambda url, driver: scrape_and_format_links(url, search_urls[url], driver=driver))
\ No newline at end of file
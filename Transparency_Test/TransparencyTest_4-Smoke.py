@@ -1,6 +1,9 @@
 import os
 import subprocess
 import math
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import workspace
 
 def get_video_info(video_path):
     """
@@ -37,13 +40,14 @@ def get_video_info(video_path):
 
     return video_width, video_height, video_duration
 
-def loop_bg_video(bg_path, fg_duration):
+def loop_bg_video(bg_path, fg_duration, workdir="."):
     """
     Loops the background video until it matches or exceeds the duration of the foreground video.
 
     Args:
         bg_path: Path to the background video file.
         fg_duration: Duration of the foreground video.
+        workdir: Scratch folder for the intermediate files.
 
     Returns:
         looped_bg: Path to the looped background video.
@@ -51,10 +55,11 @@ def loop_bg_video(bg_path, fg_duration):
     bg_width, bg_height, bg_duration = get_video_info(bg_path)
     loop_count = math.ceil(fg_duration / bg_duration)
 
-    looped_bg = "looped_bg.mp4"
+    looped_bg = os.path.join(workdir, "looped_bg.mp4")
+    loop_list_path = os.path.join(workdir, "bg_loop_input.txt")
 
     # Use ffmpeg's concat demuxer to loop the background video
-    with open("bg_loop_input.txt", "w") as f:
+    with open(loop_list_path, "w") as f:
         for _ in range(loop_count):
             f.write(f"file '{os.path.abspath(bg_path)}'\n")
 
@@ -66,7 +71,7 @@ def loop_bg_video(bg_path, fg_duration):
             "-safe",
             "0",
             "-i",
-            "bg_loop_input.txt",
+            loop_list_path,
             "-c",
             "copy",
             "-y",
@@ -76,7 +81,7 @@ def loop_bg_video(bg_path, fg_duration):
     )
 
     # Trim the looped background to match the exact duration of the foreground video
-    trimmed_bg = "trimmed_bg.mp4"
+    trimmed_bg = os.path.join(workdir, "trimmed_bg.mp4")
     subprocess.run(
         [
             "ffmpeg",
@@ -94,7 +99,7 @@ def loop_bg_video(bg_path, fg_duration):
 
     # Clean up intermediate looped background
     os.remove(looped_bg)
-    os.remove("bg_loop_input.txt")
+    os.remove(loop_list_path)
 
     return trimmed_bg
 
@@ -116,7 +121,9 @@ def overlay_fg_on_bg(fg_path, bg_path, output_video_path, zoom=1.0, codec="h264"
     fg_width, fg_height, fg_duration = get_video_info(fg_path)
 
     # Loop the background video to match foreground duration
-    looped_bg = loop_bg_video(bg_path, fg_duration)
+    # Scratch files go in a per-call workspace so parallel workers don't overwrite each other
+    job = workspace.JobWorkspace("overlay_")
+    looped_bg = loop_bg_video(bg_path, fg_duration, job.path)
 
     # Scale the foreground video and add black transparency
     scaled_fg_width = int(fg_width * zoom)
@@ -159,8 +166,8 @@ def overlay_fg_on_bg(fg_path, bg_path, output_video_path, zoom=1.0, codec="h264"
 
     subprocess.run(command, check=True)
 
-    # Clean up intermediate looped background
-    os.remove(looped_bg)
+    # Clean up the intermediate looped background and its workspace
+    job.cleanup()
 
 def process_videos(fg_folder, bg_folder, output_folder, zoom=1.0, codec="h264", crf=23, bitrate="4M", speed="fast"):
     """
@@ -2,6 +2,14 @@ import os
 import subprocess
 import random
 import datetime
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import mezzanine
+
+# Stitch clips from the normalized mezzanine library (media_common.mezzanine): they share codec,
+# size, fps and audio format, so video and audio join in one stream copy instead of the
+# scale+concat re-encode below. The library is H.264 (libx264), so `codec` is not used then.
+USE_MEZZANINE = False
 
 def get_file_duration(file_path):
     """Gets the duration of a video file using ffprobe."""
@@ -145,12 +153,21 @@ def merge_videos(input_folder, output_folder, target_duration, target_resolution
     """Main function to handle the merging process."""
     video_files = select_videos(input_folder, target_duration)
 
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    merged_output_path = os.path.join(output_folder, f"merged_video_{timestamp}.mp4")
+
+    if USE_MEZZANINE:
+        target = mezzanine.profile(target_resolution[0], target_resolution[1], target_fps)
+        conformed_videos = mezzanine.conform_all(video_files, target)
+        list_path = os.path.join(output_folder, f"concat_list_{timestamp}.txt")
+        mezzanine.concat_copy(conformed_videos, merged_output_path, list_path, duration=target_duration)
+        print(f"Merged video saved to: {merged_output_path}")
+        return
+
     processed_videos = process_video_files(video_files, target_resolution, codec)
 
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     video_output_path = os.path.join(output_folder, f"processed_video_{timestamp}.mp4")
     audio_output_path = os.path.join(output_folder, f"processed_audio_{timestamp}.aac")
-    merged_output_path = os.path.join(output_folder, f"merged_video_{timestamp}.mp4")
 
     append_videos(processed_videos, target_resolution, target_fps, codec, video_output_path)
     append_audios(processed_videos, audio_output_path)
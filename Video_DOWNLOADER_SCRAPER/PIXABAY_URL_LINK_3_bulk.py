@@ -1,77 +1,94 @@
 import os
-import time
-from selenium import webdriver
+import sys
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import collector
 
-def scrape_video_links(search_term, output_folder="output", num_links=100):
+VIDEO_LINK_SELECTOR = 'a[href^="/videos/"]'
+
+def scrape_video_links(search_term, output_folder="output", num_links=100, driver=None):
     """
-    Scrapes video links for a given search term and saves them to a text file.
-    Cycles through pages until the desired number of links is reached.
+    Scrapes video links for a given search term and appends them to a text file.
+    Cycles through pages until the desired number of new links is reached, or until
+    pages only show videos collected before (the ID index in media_common.collector).
     Excludes links containing the word "search" and avoids duplicates.
     """
+    if driver is None:
+        # Single term: borrow a browser from a one-session pool
+        return collector.collect_terms(
+            [search_term], lambda term, session: scrape_video_links(term, output_folder, num_links, session), workers=1)[search_term]
+
     # Create output folder if it doesn't exist
     os.makedirs(output_folder, exist_ok=True)
+    index = collector.default_index()
     
     # Construct the URL and filename for the current search term
     url = f"https://pixabay.com/videos/search/{search_term}/?order=ec"
     filename = f"{search_term}.txt"
     
-    # Create a file to store the links
+    # The file that stores the links (new links are added to those of earlier runs)
     filepath = os.path.join(output_folder, filename)
     
-    # Initialize browser
-    driver = webdriver.Chrome()  # Assuming you have ChromeDriver installed
     links_found = 0
     page_num = 1
+    stale_rounds = 0
     unique_links = set()  # Use a set to keep track of unique links
     
-    try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            while links_found < num_links:
-                # Construct the URL for the current page
-                current_url = url + f"&pagi={page_num}"
+    with open(filepath, "a", encoding="utf-8") as f:
+        while links_found < num_links and stale_rounds < collector.STALE_ROUNDS:
+            # Construct the URL for the current page
+            current_url = url + f"&pagi={page_num}"
+            try:
+                driver.get(current_url)
+                # Wait until the page shows its video links (an empty page ends the search)
                 try:
-                    driver.get(current_url)
-                    # Load the page fully
-                    wait = WebDriverWait(driver, 10)
-                    wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-                    # Find all video links
-                    video_elements = driver.find_elements(By.CSS_SELECTOR, 'a[href^="/videos/"]')
-                    for element in video_elements:
-                        link = element.get_attribute("href")
-                        if link and "search" not in link:  # Exclude links with "search"
-                            # Construct the full URL
-                            full_link = "" + link
-                            # Check if the link is unique
-                            if full_link not in unique_links:
-                                # Write the link to the file immediately
-                                f.write(full_link + "\n")
-                                f.flush()  # Ensure the link is written to the file
-                                links_found += 1
-                                unique_links.add(full_link)  # Add to the set of unique links
-                                # Stop when desired number of links are found
-                                if links_found >= num_links:
-                                    break
-                    # Increment page number for the next iteration
-                    page_num += 1
-                    # Scroll down to load more videos (optional, might not be necessary)
-                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                    time.sleep(3)  # Give time for the page to load more videos
-                except Exception as e:
-                    print(f"Error scraping links on page {page_num}: {e}")
+                    WebDriverWait(driver, collector.CHANGE_TIMEOUT).until(
+                        EC.presence_of_element_located((By.CSS_SELECTOR, VIDEO_LINK_SELECTOR)))
+                except TimeoutException:
+                    print(f"No more videos on page {page_num}")
                     break
-    finally:
-        driver.quit()
+                # Find all video links
+                video_elements = driver.find_elements(By.CSS_SELECTOR, VIDEO_LINK_SELECTOR)
+                new_links = 0
+                for element in video_elements:
+                    link = element.get_attribute("href")
+                    if link and "search" not in link:  # Exclude links with "search"
+                        # Construct the full URL
+                        full_link = "" + link
+                        # Check if the link is unique
+                        if full_link in unique_links:
+                            continue
+                        unique_links.add(full_link)  # Add to the set of unique links
+                        # The video ID ends the last path segment, e.g. /videos/beach-sea-waves-12345/
+                        video_id = full_link.rstrip("/").split("/")[-1].split("-")[-1]
+                        if not index.add("pixabay", video_id, full_link, search_term):
+                            continue  # Collected for this term by an earlier run
+                        # Write the link to the file immediately
+                        f.write(full_link + "\n")
+                        f.flush()  # Ensure the link is written to the file
+                        links_found += 1
+                        new_links += 1
+                        # Stop when desired number of links are found
+                        if links_found >= num_links:
+                            break
+                # A page with only known videos counts towards stopping
+                stale_rounds = 0 if new_links else stale_rounds + 1
+                # Increment page number for the next iteration
+                page_num += 1
+            except Exception as e:
+                print(f"Error scraping links on page {page_num}: {e}")
+                break
 
-    print(f"Scraped {links_found} links for '{search_term}'")
+    print(f"Scraped {links_found} new links for '{search_term}'")
+    return links_found
 
 # Example usage
 output_folder = "pixabay_links"
 num_links_to_scrape = 100
 search_terms = ["beach", "hiking", "waterfall" ]  # Add your desired search terms here
 #"beach", "ocean", "sky", "stars", "time-lapse","hiking", "exercise", "nature", "buddha", "rock-climbing", "waterfall", "stream", "sunset", "forest", "animals", "rain", "autumn", "snow", "mountains", "road", "trees", "river", "lake", "rocks", "flowers", "boat", "sunrise"
-for term in search_terms:
-    scrape_video_links(term, output_folder, num_links_to_scrape)
\ No newline at end of file
+# The terms are collected in parallel on a shared pool of browsers (collector.BROWSER_SESSIONS)
+collector.collect_terms(search_terms, lambda term, driver: scrape_video_links(term, output_folder, num_links_to_scrape, driver))
\ No newline at end of file
@@ -1,6 +1,15 @@
 import os
-import requests
-import time
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import downloader
+from media_common import store as media_store
+
+# Parallel downloads; each host is still paced by media_common.downloader.HOST_LIMITS
+DOWNLOAD_WORKERS = downloader.DOWNLOAD_WORKERS
+
+# Keep each unique file once in the content-addressed store (media_common.store) and hardlink
+# it into the output folders. Set to False to write plain files as before.
+USE_STORE = True
 
 def download_videos_from_urls(export_folder, output_folder="videos"):
     """
@@ -9,6 +18,7 @@ def download_videos_from_urls(export_folder, output_folder="videos"):
     The filename of each downloaded video includes the name of the text file it was read from.
     """
     os.makedirs(output_folder, exist_ok=True)  # Create output folder if it doesn't exist
+    jobs = []
     
     for filename in os.listdir(export_folder):
         if filename.endswith(".txt"):
@@ -20,31 +30,26 @@ def download_videos_from_urls(export_folder, output_folder="videos"):
                     video_url = video_url.strip()
                     if not video_url:
                         continue
-                    try:
-                        # Download the video
-                        response = requests.get(video_url)
-                        response.raise_for_status()
-                        
-                        # Construct the filename
-                        original_video_filename = os.path.basename(video_url)
-                        extension = os.path.splitext(original_video_filename)[1]
-                        if not extension:
-                            extension = ".mp4"  # Default to .mp4 if no extension found
-                        
-                        new_video_filename = f"[{text_file_name}]{original_video_filename}"
-                        if extension.lower() == ".mp4":
-                            new_video_filename = new_video_filename.replace(extension, f"_file{extension}")
-                        
-                        # Save the video
-                        video_filepath = os.path.join(output_folder, new_video_filename)
-                        with open(video_filepath, "wb") as video_file:
-                            video_file.write(response.content)
-                        print(f"Downloaded: {new_video_filename}")
-                        
-                        # Wait if necessary to avoid server rate limits
-                        time.sleep(5)
-                    except Exception as e:
-                        print(f"Error downloading video from {video_url}: {e}")
+
+                    # Construct the filename
+                    original_video_filename = os.path.basename(video_url)
+                    extension = os.path.splitext(original_video_filename)[1]
+                    if not extension:
+                        extension = ".mp4"  # Default to .mp4 if no extension found
+                    
+                    new_video_filename = f"[{text_file_name}]{original_video_filename}"
+                    if extension.lower() == ".mp4":
+                        new_video_filename = new_video_filename.replace(extension, f"_file{extension}")
+                    
+                    jobs.append((video_url, os.path.join(output_folder, new_video_filename)))
+
+    # Download the videos, streamed to disk and paced per host instead of sleeping after each one
+    for video_url, video_filepath, downloaded, error in downloader.download_all(
+            jobs, DOWNLOAD_WORKERS, store=media_store.default_store() if USE_STORE else None):
+        if error is not None:
+            print(f"Error downloading video from {video_url}: {error}")
+        elif downloaded:
+            print(f"Downloaded: {os.path.basename(video_filepath)}")
 
 # Example usage
 export_folder = r"E:\Python_Practice\Video_DOWNLOADER_SCRAPER\video_urls\Need Scraping"  # Folder containing collected URLs
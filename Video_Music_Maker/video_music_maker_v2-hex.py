@@ -4,6 +4,13 @@ import subprocess
 from datetime import datetime
 import logging
 import re  # Import re module
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import catalog as media_catalog
+from media_common import sampler as folder_sampler
+from media_common import workspace
+from media_common import keyed as keyed_cache
+from media_common import audio as media_audio
 
 # Setup logging configuration
 logging.basicConfig(filename='video_processing.log', level=logging.DEBUG,
@@ -56,32 +63,12 @@ def sanitize_filename(filename):
     return ''.join(c for c in filename if c not in invalid_chars)
 
 def get_video_info(video_path):
-    """Retrieve video width and height using ffprobe."""
-    info = subprocess.run(
-        [
-            "ffprobe", "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=width,height",
-            "-of", "csv=s=x:p=0", video_path
-        ],
-        capture_output=True,
-        text=True
-    ).stdout.strip().split('x')
-    return int(info[0]), int(info[1])
+    """Retrieve video width and height from the shared media catalog (probes only new or changed files)."""
+    return media_catalog.get_resolution(video_path)
 
 def get_video_duration(video_path):
-    """Retrieve video duration using ffprobe."""
-    duration = subprocess.run(
-        [
-            "ffprobe", "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            video_path
-        ],
-        capture_output=True,
-        text=True
-    ).stdout.strip()
-    return float(duration)
+    """Retrieve video duration from the shared media catalog (probes only new or changed files)."""
+    return media_catalog.get_duration(video_path)
 
 def trim_video_to_duration(input_video, output_video, duration):
     """Trims the video to the specified duration."""
@@ -93,18 +80,22 @@ def trim_video_to_duration(input_video, output_video, duration):
     subprocess.run(command, check=True)
     logging.info(f"Trimmed video {input_video} to {duration} seconds, saved as {output_video}")
 
-def select_random_video_without_reuse(folder, used_videos):
-    """Selects a random video from a folder, ensuring no duplicates."""
-    videos = [os.path.join(root, file)
-              for root, _, files in os.walk(folder)
-              for file in files if file.endswith((".mp4", ".avi", ".mov", ".mkv")) and os.path.join(root, file) not in used_videos]
+# Draw history across runs: set to folder_sampler.DEFAULT_HISTORY_PATH to keep cycling through
+# clips earlier runs have not shown yet. None starts every run with a fresh shuffle.
+SAMPLER_HISTORY = None
 
-    if not videos:
-        raise FileNotFoundError(f"No more unused videos found in {folder}. All videos have been used.")
+# Bake crop, colorkey and alpha into a cached alpha asset once per clip (media_common.keyed)
+# instead of applying them in every merge. The first merge of each clip writes its ProRes 4444
+# asset (about 1 GB per minute) to KEYED_CACHE_DIR. False keys on the fly, as before.
+USE_KEYED_CACHE = False
+
+def select_random_video_without_reuse(folder, used_videos):
+    """Draws the next video from the folder's shuffle bag, skipping videos already used.
 
-    selected_video = random.choice(videos)
-    used_videos.add(selected_video)
-    return selected_video
+    The folder is indexed once per run and refilled automatically when every video has been used.
+    """
+    sampler = folder_sampler.get_sampler(folder, (".mp4", ".avi", ".mov", ".mkv"), history_path=SAMPLER_HISTORY)
+    return sampler.draw(used_videos)
 
 def ensure_unique_bg_videos(altbg_folders, used_bg_videos, required_duration):
     """Select background videos without duplication to meet or exceed the required duration."""
@@ -188,7 +179,13 @@ def merge_videos(bg_concat_path, fg_path, output_video_path, crop_top=0, crop_bo
             alpha_filter = f"format=rgba,colorchannelmixer=aa={alpha},"
         
         # Build the full filter chain
-        fg_filter = f"{crop_filter}{transparency_filter}{alpha_filter}scale={scaled_fg_width}:{scaled_fg_height}[fg];"
+        key_chain = f"{crop_filter}{transparency_filter}{alpha_filter}".rstrip(",")
+        if USE_KEYED_CACHE and key_chain:
+            # The cached asset already carries the crop and transparency in its alpha channel
+            fg_path = keyed_cache.keyed_asset(fg_path, key_chain)
+            fg_filter = f"scale={scaled_fg_width}:{scaled_fg_height}[fg];"
+        else:
+            fg_filter = f"{crop_filter}{transparency_filter}{alpha_filter}scale={scaled_fg_width}:{scaled_fg_height}[fg];"
         overlay_filter = f"[0:v][fg]overlay=x={x_offset}:y={y_offset}[video]"
         
         filter_complex = f"[1:v]{fg_filter}{overlay_filter}"
@@ -225,6 +222,9 @@ def select_random_audio(folder, used_audios):
     used_audios.add(selected_audio)
     return selected_audio
 
+# Seconds of crossfade at each seam where the background music loops (0 = plain gapless loop)
+MUSIC_LOOP_CROSSFADE = 0
+
 def merge_audio_to_video(video_path, bg_music=None, bg_music_volume=0, final_audio_volume=0, used_audios=set()):
     """Merges background music into a video if bg_music is provided."""
     logging.info(f"Merging audio to video: {video_path} with background music: {bg_music}")
@@ -260,23 +260,19 @@ def merge_audio_to_video(video_path, bg_music=None, bg_music_volume=0, final_aud
         audio_file_name = os.path.basename(bg_music_path)
         first_two_words = ' '.join(audio_file_name.split()[:2])
 
-        # Create background music looped to video duration
-        looped_audio_path = "looped_audio.wav"
-        subprocess.run(["ffmpeg", "-stream_loop", "-1", "-i", bg_music_path, "-t", str(video_duration), "-y", looped_audio_path], check=True)
+        # Loop the background music inside the mix graph so no looped copy is written to disk
+        bed_inputs, bed_graph = media_audio.music_bed(bg_music_path, 1, video_duration, bg_music_volume, MUSIC_LOOP_CROSSFADE)
 
-        # Merge the video with the looped background music
+        # Mix the looped music straight into the output
         output_video_path = f"{os.path.splitext(video_path)[0]}_with_audio.mp4"
         command = [
-            "ffmpeg", "-hwaccel", "cuda", "-i", video_path, "-i", looped_audio_path,
-            "-filter_complex", f"[1:a]volume={bg_music_volume}dB[aud];[0:a][aud]amix=inputs=2:duration=first[a];"
+            "ffmpeg", "-hwaccel", "cuda", "-i", video_path, *bed_inputs,
+            "-filter_complex", f"{bed_graph};[0:a][aud]amix=inputs=2:duration=first[a];"
                                f"[a]volume={final_audio_volume}dB[out]",
             "-map", "0:v", "-map", "[out]", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", "-shortest", "-y", output_video_path
         ]
         subprocess.run(command, check=True)
 
-        # Cleanup intermediate files
-        os.remove(looped_audio_path)
-
         return output_video_path, first_two_words
 
 def create_final_video_sequence(fg_folder, altbg_folders, output_folder, iterations, quality, bg_music=None, bg_music_volume=0, final_audio_volume=0, crop_top=0, crop_bottom=0, transparency_color='none', alpha=1.0, position='center'):
@@ -295,6 +291,8 @@ def create_final_video_sequence(fg_folder, altbg_folders, output_folder, iterati
         raise FileNotFoundError(f"No videos found in fg_folder: {fg_folder}")
 
     for i in range(iterations):
+        # Each iteration gets its own scratch folder so parallel runs never share temp files
+        job = workspace.JobWorkspace(f"iteration_{i+1}_")
         try:
             logging.info(f"Starting iteration {i+1} of {iterations}")
 
@@ -315,23 +313,24 @@ def create_final_video_sequence(fg_folder, altbg_folders, output_folder, iterati
             bg_videos = ensure_unique_bg_videos(altbg_folders, used_bg_videos, fg_duration)
 
             # Concatenate bg videos
-            with open("bg_concat_list.txt", "w") as f:
+            bg_list_path = job.file("bg_concat_list.txt")
+            with open(bg_list_path, "w") as f:
                 for bg_path in bg_videos:
                     f.write(f"file '{bg_path}'\n")
 
-            bg_concat_path = "concatenated_bg.mp4"
+            bg_concat_path = job.file("concatenated_bg.mp4")
             command = [
-                "ffmpeg", "-hwaccel", "cuda", "-f", "concat", "-safe", "0", "-i", "bg_concat_list.txt",
+                "ffmpeg", "-hwaccel", "cuda", "-f", "concat", "-safe", "0", "-i", bg_list_path,
                 "-c:v", "copy", "-y", bg_concat_path
             ]
             subprocess.run(command, check=True)
 
             # Trim bg video to match fg duration
-            trimmed_bg_path = "trimmed_bg.mp4"
+            trimmed_bg_path = job.file("trimmed_bg.mp4")
             trim_video_to_duration(bg_concat_path, trimmed_bg_path, fg_duration)
 
             # Overlay fg video onto bg video
-            final_output_path = os.path.join(output_folder, f"final_output_{i+1}.mp4")
+            final_output_path = job.file(f"final_output_{i+1}.mp4")
             merge_videos(trimmed_bg_path, fg_video, final_output_path, crop_top, crop_bottom, transparency_color, alpha, quality=quality, position=position)
 
             # Merge audio if bg_music is provided
@@ -350,7 +349,7 @@ def create_final_video_sequence(fg_folder, altbg_folders, output_folder, iterati
                 output_folder,
                 f"Stoic Radio_Music_Video_{fg_name_part}_{timestamp}_{i+1}.mp4"
             )
-            os.rename(output_video_with_audio, final_name)
+            workspace.move_into_place(output_video_with_audio, final_name)
 
             # Insert metadata
             insert_video_metadata(
@@ -363,10 +362,7 @@ def create_final_video_sequence(fg_folder, altbg_folders, output_folder, iterati
             )
 
             # Cleanup
-            try_remove_file(bg_concat_path)
-            try_remove_file(trimmed_bg_path)
-            try_remove_file(final_output_path)
-            try_remove_file("bg_concat_list.txt")
+            job.cleanup()
 
             logging.info(f"Final video created: {final_name}")
             print(f"Final video created: {final_name}")
@@ -374,6 +370,7 @@ def create_final_video_sequence(fg_folder, altbg_folders, output_folder, iterati
         except Exception as e:
             logging.error(f"Error during iteration {i+1}: {e}")
             print(f"Error during iteration {i+1}: {e}")
+            job.keep()
             
 if __name__ == "__main__": 
     
@@ -1,5 +1,8 @@
 import os
 import subprocess
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import segments
 
 # Define the input and output folders
 input_folder = r"E:\Dataset\All Video BG\Watermarked\Vertical\All Artwork"
@@ -8,11 +11,26 @@ output_folder = r"output3"
 # Define the chunk duration in seconds (10 minutes = 600 seconds)
 chunk_duration = 5.1  # Set to 604 for 10 minutes in seconds
 
+# How to split: "exact" decodes and encodes the file once, forcing keyframes at every chunk
+# boundary (chunks of exactly chunk_duration); "copy" stream-copies without any encode, each chunk
+# starting at the first keyframe after its boundary; "per_chunk" is the old one ffmpeg run per chunk.
+SPLIT_MODE = "exact"
+
 # Function to split video dynamically
 def split_video_dynamic_trimming(input_file, output_folder, chunk_duration, gpu_id=0):
     # Set the CUDA_VISIBLE_DEVICES environment variable to select the GPU
     os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu_id)
 
+    if SPLIT_MODE != "per_chunk":
+        # One ffmpeg run reads the input once and writes every chunk
+        try:
+            chunks = segments.split_video(input_file, output_folder, chunk_duration, SPLIT_MODE)
+        except subprocess.CalledProcessError as e:
+            print(f"Error splitting {input_file}: {e}")
+            return
+        print(f"Video '{os.path.basename(input_file)}' has been split into {len(chunks)} chunks.")
+        return
+
     # Get the video duration using ffprobe
     cmd = f'ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 "{input_file}"'
     try:
@@ -1,5 +1,8 @@
 import os
 import subprocess
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import segments
 import gc
 import psutil
 import time
@@ -14,11 +17,42 @@ video_files = os.listdir(input_folder)
 # Define the chunk duration in seconds
 chunk_duration = 605  # Minutes X Seconds
 
+# How to split: "exact" decodes and encodes the file once, forcing keyframes at every chunk
+# boundary (chunks of exactly chunk_duration); "copy" stream-copies without any encode, each chunk
+# starting at the first keyframe after its boundary; "per_chunk" is the old one ffmpeg run per chunk.
+# As with "per_chunk", a trailing chunk shorter than chunk_duration is not kept.
+SPLIT_MODE = "exact"
+
 # Function to split video using ffmpeg with GPU acceleration and GPU selection
 def split_video_with_ffmpeg(input_file, output_folder, chunk_duration, gpu_id=0):
     # Set the CUDA_VISIBLE_DEVICES environment variable
     os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu_id)
 
+    if SPLIT_MODE != "per_chunk":
+        start_time_iteration = time.time()  # For logging time taken per video
+
+        # One ffmpeg run reads the input once and writes every chunk
+        try:
+            chunks = segments.split_video(input_file, output_folder, chunk_duration, SPLIT_MODE)
+        except subprocess.CalledProcessError as e:
+            print(f"Error splitting video {input_file}: {e}")
+            return
+
+        # split_video writes the remainder as a shorter last part; this script only keeps full chunks
+        if chunks:
+            last_path, last_start, last_end = chunks[-1]
+            if last_end - last_start < chunk_duration - segments.BOUNDARY_DELTA:
+                os.remove(last_path)
+                chunks.pop()
+
+        end_time_iteration = time.time()
+        print(f"{len(chunks)} chunks processed in {end_time_iteration - start_time_iteration} seconds.")
+
+        # Explicitly clear memory and reset garbage collection
+        gc.collect()
+        free_resources()
+        return
+
     # Get the video duration using ffprobe
     cmd = f'ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 "{input_file}"'
     video_duration = float(subprocess.check_output(cmd, shell=True).strip())
@@ -1,5 +1,8 @@
 import os
 import subprocess
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import segments
 
 # Set the input and output directories
 input_folder = r'input'
@@ -14,6 +17,13 @@ crf_value = 23  # Constant Rate Factor for quality control
 bitrate = '6M'  # Bitrate for the output video
 gpu_id = '0'  # Set GPU ID for hardware acceleration (if needed)
 
+# Smart cut: only the frames between each cut and its nearest keyframe are re-encoded (matching the
+# source's encoder settings), the rest is stream-copied and the audio is trimmed to the sample.
+# The source codec is kept; sources it cannot cut, or a failed ffmpeg run, fall back to the full
+# re-encode below. Only IDR frames are cut at, so open-GOP sources (no clean keyframes) end up
+# re-encoded whole in their own codec.
+SMART_CUT = True
+
 # Loop through all .mp4 files in the input folder
 for filename in os.listdir(input_folder):
     if filename.endswith('.mp4'):
@@ -22,6 +32,14 @@ for filename in os.listdir(input_folder):
         
         # Set the start time (skip the first part in seconds)
         start_time = 14400
+
+        if SMART_CUT:
+            try:
+                segments.smart_trim(input_path, output_path, start=start_time)
+                print(f"Processed {filename} and saved to {output_path} (smart cut)")
+                continue
+            except (ValueError, subprocess.CalledProcessError) as e:  # SmartCutUnsupported, nothing left to keep, or ffmpeg failed
+                print(f"Smart cut not possible for {filename} ({e}); re-encoding the whole file")
         
         # Base ffmpeg command
         command = [
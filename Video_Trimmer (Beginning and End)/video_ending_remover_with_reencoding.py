@@ -1,5 +1,8 @@
 import os
 import subprocess
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from media_common import segments
 import ffmpeg
 
 # Set the input and output directories
@@ -10,6 +13,13 @@ output_folder = 'output'
 bitrate = '6M'  # Target bitrate (example: '1M' for 1 Mbps)
 crf = 18        # Constant Rate Factor (lower value = better quality, higher = worse)
 
+# Smart cut: only the frames between each cut and its nearest keyframe are re-encoded (matching the
+# source's encoder settings), the rest is stream-copied and the audio is trimmed to the sample.
+# The source codec is kept; sources it cannot cut, or a failed ffmpeg run, fall back to the full
+# re-encode below. Only IDR frames are cut at, so open-GOP sources (no clean keyframes) end up
+# re-encoded whole in their own codec.
+SMART_CUT = True
+
 # Create the output folder if it doesn't exist
 os.makedirs(output_folder, exist_ok=True)
 
@@ -26,6 +36,14 @@ for filename in os.listdir(input_folder):
         # Calculate the duration to keep (total duration - 2 minutes)
         end_time = max(0, duration - 120)  # Keep all but the last 2 minutes (120 seconds)
 
+        if SMART_CUT:
+            try:
+                segments.smart_trim(input_path, output_path, end=end_time)
+                print(f"Processed {filename} and saved to {output_path} (smart cut)")
+                continue
+            except (ValueError, subprocess.CalledProcessError) as e:  # SmartCutUnsupported, nothing left to keep, or ffmpeg failed
+                print(f"Smart cut not possible for {filename} ({e}); re-encoding the whole file")
+
         # Construct the ffmpeg command with AV1-NVENC encoding
         command = [
             'ffmpeg',
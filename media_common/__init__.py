@@ -0,0 +1,5 @@
+"""Shared helpers used by the video combiners, makers and download tools.
+
+The scripts in this repo are run directly from their own folders, so each one
+adds the repo root to sys.path before importing from here.
+"""
@@ -0,0 +1,53 @@
+import math
+import logging
+
+from media_common import catalog
+
+# Crossfaded loops open the music file once per repeat; past this many repeats the bed
+# falls back to a plain -stream_loop input.
+MAX_CROSSFADE_REPEATS = 32
+
+
+def music_bed(music_path, input_index, duration, volume=0, crossfade=0, label="aud"):
+    """Builds a music bed looped to `duration` inside the filter graph.
+
+    Returns (input_args, graph) to splice into an ffmpeg command: input_args go after the
+    inputs already on the command line (the first of them becomes `input_index`), and graph
+    ends in [label] at the requested volume. Nothing is rendered to disk beforehand.
+    With crossfade > 0 each loop seam is blended with acrossfade over that many seconds.
+    """
+    if crossfade > 0:
+        track_duration = catalog.get_duration(music_path)
+        if track_duration > crossfade * 2:
+            # n copies joined by n-1 crossfades: n * track - (n - 1) * crossfade >= duration
+            repeats = max(1, math.ceil((duration - crossfade) / (track_duration - crossfade)))
+            if repeats <= MAX_CROSSFADE_REPEATS:
+                return crossfaded_bed(music_path, input_index, repeats, volume, crossfade, label)
+            logging.info(f"{repeats} crossfaded repeats of {music_path} needed; using a plain loop instead.")
+        else:
+            logging.info(f"{music_path} is too short for a {crossfade}s crossfade; using a plain loop instead.")
+
+    input_args = ["-stream_loop", "-1", "-i", music_path]
+    return input_args, f"[{input_index}:a]volume={volume}dB[{label}]"
+
+
+def crossfaded_bed(music_path, input_index, repeats, volume=0, crossfade=0, label="aud"):
+    """Chains `repeats` copies of the track with acrossfade at every seam."""
+    input_args = []
+    for _ in range(repeats):
+        input_args += ["-i", music_path]
+
+    if repeats == 1:
+        return input_args, f"[{input_index}:a]volume={volume}dB[{label}]"
+
+    parts = []
+    previous = f"{input_index}:a"
+    for k in range(1, repeats):
+        current = f"seam{k}" if k < repeats - 1 else None
+        step = f"[{previous}][{input_index + k}:a]acrossfade=d={crossfade}:c1=tri:c2=tri"
+        if current:
+            parts.append(f"{step}[{current}]")
+            previous = current
+        else:
+            parts.append(f"{step},volume={volume}dB[{label}]")
+    return input_args, ";".join(parts)
@@ -0,0 +1,209 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from media_common import store as media_store
+
+# The catalog lives outside the repo so every script (and every GPU variant)
+# shares the same probe results. Override with MEDIA_CATALOG_PATH if needed.
+CATALOG_PATH = os.environ.get(
+    "MEDIA_CATALOG_PATH",
+    os.path.join(os.path.expanduser("~"), ".media_catalog.sqlite3")
+)
+
+PROBE_WORKERS = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    fps REAL,
+    video_codec TEXT,
+    pix_fmt TEXT,
+    audio_codec TEXT,
+    sample_rate INTEGER,
+    channels INTEGER,
+    channel_layout TEXT,
+    probe_json TEXT
+)
+"""
+
+FIELDS = ("duration", "width", "height", "fps", "video_codec", "pix_fmt",
+          "audio_codec", "sample_rate", "channels", "channel_layout", "probe_json")
+
+
+def run_ffprobe(path):
+    """Runs a single ffprobe over the file and returns the parsed JSON."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0 or not result.stdout.strip():
+        raise ValueError(f"ffprobe failed for {path}: {result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+
+def parse_frame_rate(rate):
+    """Converts an ffprobe rational such as '30000/1001' into a float."""
+    if not rate or rate == "0/0":
+        return None
+    if "/" in rate:
+        num, den = rate.split("/")
+        return float(num) / float(den) if float(den) else None
+    return float(rate)
+
+
+def summarize_probe(probe):
+    """Flattens ffprobe JSON into the columns stored in the catalog."""
+    streams = probe.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+
+    duration = probe.get("format", {}).get("duration") or video.get("duration") or audio.get("duration")
+    return {
+        "duration": float(duration) if duration else None,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": parse_frame_rate(video.get("avg_frame_rate") or video.get("r_frame_rate")),
+        "video_codec": video.get("codec_name"),
+        "pix_fmt": video.get("pix_fmt"),
+        "audio_codec": audio.get("codec_name"),
+        "sample_rate": int(audio["sample_rate"]) if audio.get("sample_rate") else None,
+        "channels": audio.get("channels"),
+        "channel_layout": audio.get("channel_layout"),
+        "probe_json": json.dumps(probe),
+    }
+
+
+class MediaCatalog:
+    """On-disk cache of ffprobe results keyed by path, size and mtime."""
+
+    def __init__(self, db_path=CATALOG_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.memory = {}  # path -> (size, mtime_ns, entry) for this process
+        self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(SCHEMA)
+            self.conn.commit()
+
+    def lookup(self, path, size, mtime_ns):
+        """Returns the stored entry if it is still fresh, otherwise None."""
+        cached = self.memory.get(path)
+        if cached and cached[0] == size and cached[1] == mtime_ns:
+            return cached[2]
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM media WHERE path = ?", (path,)).fetchone()
+        if row is None or row["size"] != size or row["mtime_ns"] != mtime_ns:
+            return None
+        entry = {field: row[field] for field in FIELDS}
+        self.memory[path] = (size, mtime_ns, entry)
+        return entry
+
+    def store(self, path, size, mtime_ns, entry):
+        """Writes a freshly probed entry to the catalog."""
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO media (path, size, mtime_ns, {', '.join(FIELDS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in FIELDS)})",
+                (path, size, mtime_ns, *(entry[field] for field in FIELDS))
+            )
+            self.conn.commit()
+        self.memory[path] = (size, mtime_ns, entry)
+
+    def get(self, path):
+        """Returns the catalog entry for a file, probing it only if new or stale."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.lookup(path, stat.st_size, stat.st_mtime_ns)
+        if entry is None:
+            blob = media_store.canonical(path)
+            if blob != path:
+                # A copy of a stored asset: reuse (or make) the one probe of the blob
+                entry = self.get(blob)
+            else:
+                logging.debug(f"Probing {path}")
+                entry = summarize_probe(run_ffprobe(path))
+            self.store(path, stat.st_size, stat.st_mtime_ns, entry)
+        return entry
+
+    def prefetch(self, paths, max_workers=PROBE_WORKERS):
+        """Probes any new or stale files in parallel so later lookups are cache hits."""
+        def probe_one(path):
+            try:
+                self.get(path)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not probe {path}: {e}")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(probe_one, paths))
+
+    def prefetch_folder(self, folder, extensions=(".mp4", ".mov", ".mkv", ".avi", ".mp3", ".wav"), max_workers=PROBE_WORKERS):
+        """Walks a folder once and makes sure every matching file is catalogued."""
+        paths = [os.path.join(root, f)
+                 for root, _, files in os.walk(folder)
+                 for f in files if f.lower().endswith(extensions)]
+        self.prefetch(paths, max_workers=max_workers)
+        return paths
+
+
+_default_catalog = None
+
+
+def default_catalog():
+    """Returns the process-wide catalog, opening it on first use."""
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = MediaCatalog()
+    return _default_catalog
+
+
+def probe(path):
+    """Returns the full catalog entry for a file."""
+    return default_catalog().get(path)
+
+
+def get_duration(path):
+    """Returns the container duration in seconds."""
+    duration = probe(path)["duration"]
+    if duration is None:
+        raise ValueError(f"Failed to retrieve duration for {path}")
+    return duration
+
+
+def get_resolution(path):
+    """Returns (width, height) of the first video stream."""
+    entry = probe(path)
+    if not entry["width"] or not entry["height"]:
+        raise ValueError(f"Failed to retrieve video dimensions for {path}")
+    return entry["width"], entry["height"]
+
+
+def get_streams_json(path):
+    """Returns the cached ffprobe output in the same JSON shape as '-show_streams -of json'."""
+    return json.dumps({"streams": json.loads(probe(path)["probe_json"]).get("streams", [])})
+
+
+def prefetch_folder(folder, extensions=(".mp4", ".mov", ".mkv", ".avi", ".mp3", ".wav")):
+    """Catalogues every matching file under a folder using the default catalog."""
+    return default_catalog().prefetch_folder(folder, extensions)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Warm the catalog ahead of a render, e.g. python -m media_common.catalog "E:\Dataset"
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for folder in sys.argv[1:]:
+        catalogued = prefetch_folder(folder)
+        logging.info(f"Catalogued {len(catalogued)} files under {folder}")
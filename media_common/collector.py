@@ -0,0 +1,179 @@
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+# Every video ID the link collectors have written, per site and search term, so a rerun of a
+# term only collects new ones. Each term's file still gets every video found under it, even one
+# another term found first. Override with MEDIA_LINK_INDEX.
+LINK_INDEX_PATH = os.environ.get(
+    "MEDIA_LINK_INDEX",
+    os.path.join(os.path.expanduser("~"), ".media_link_index.sqlite3")
+)
+
+BROWSER_SESSIONS = 3  # Chrome sessions shared by the search terms (and terms collected at once)
+STALE_ROUNDS = 2  # Pages/scrolls in a row with only known IDs before a term stops paging
+CHANGE_TIMEOUT = 10  # Seconds to wait for a scroll or page to show more results
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ids (
+    source TEXT NOT NULL,
+    term TEXT NOT NULL,
+    id TEXT NOT NULL,
+    link TEXT,
+    first_seen REAL NOT NULL,
+    PRIMARY KEY (source, term, id)
+)
+"""
+
+
+class IdIndex:
+    """Persistent set of collected video IDs per source (pexels, pixabay) and search term."""
+
+    def __init__(self, path=LINK_INDEX_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(SCHEMA)
+            self.conn.commit()
+
+    def add(self, source, video_id, link=None, term=None):
+        """Records an ID; True if it is new for the term, False if an earlier run collected it for the term."""
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO ids (source, term, id, link, first_seen) VALUES (?, ?, ?, ?, ?)",
+                (source, term or "", str(video_id), link, time.time()))
+            self.conn.commit()
+            return cursor.rowcount == 1
+
+    def count(self, source):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM ids WHERE source = ?", (source,)).fetchone()[0]
+
+
+_default_index = None
+_index_lock = threading.Lock()
+
+
+def default_index():
+    """Returns the process-wide ID index, opening it on first use."""
+    global _default_index
+    with _index_lock:
+        if _default_index is None:
+            _default_index = IdIndex()
+        return _default_index
+
+
+class BrowserPool:
+    """A few Chrome sessions reused across search terms instead of one new browser per term.
+
+    Sessions are started on demand, up to `size`; one that breaks (a WebDriverException)
+    is quit and replaced by a fresh one on the next checkout. Idle sessions are checked
+    before reuse too, since the scrapers catch their own errors and a crashed Chrome can
+    come back to the pool without an exception reaching it.
+    """
+
+    def __init__(self, size=BROWSER_SESSIONS, factory=None):
+        self.factory = factory or webdriver.Chrome
+        self.slots = threading.BoundedSemaphore(max(1, size))
+        self.idle = queue.Queue()
+        self.drivers = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def session(self):
+        with self.slots:
+            driver = None
+            while driver is None:
+                try:
+                    driver = self.idle.get_nowait()
+                except queue.Empty:
+                    driver = self.factory()
+                    with self.lock:
+                        self.drivers.append(driver)
+                    break
+                if not alive(driver):
+                    logging.warning("Replacing a browser session that stopped responding")
+                    self.discard(driver)
+                    driver = None
+            try:
+                yield driver
+            except WebDriverException:
+                self.discard(driver)
+                raise
+            self.idle.put(driver)
+
+    def discard(self, driver):
+        with self.lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    def close(self):
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+
+
+def alive(driver):
+    """True if the browser still answers (a crashed Chrome or chromedriver raises on any command)."""
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+def wait_for_change(driver, css_selector, previous_count, timeout=CHANGE_TIMEOUT):
+    """Waits until more elements match than before (e.g. after a scroll); False if none appear in time."""
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.2).until(
+            lambda d: len(d.find_elements(By.CSS_SELECTOR, css_selector)) > previous_count)
+        return True
+    except TimeoutException:
+        return False
+
+
+def collect_terms(terms, collect, workers=BROWSER_SESSIONS, factory=None):
+    """Runs collect(term, driver) for every term, `workers` terms at a time on one browser pool.
+
+    Returns {term: result}; a term that fails is logged and maps to None.
+    """
+    terms = list(terms)
+    pool = BrowserPool(workers, factory)
+
+    def run(term):
+        with pool.session() as driver:
+            return collect(term, driver)
+
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(run, term): term for term in terms}
+            for future in as_completed(futures):
+                term = futures[future]
+                try:
+                    results[term] = future.result()
+                except Exception as e:
+                    logging.error(f"Collecting '{term}' failed: {e}")
+                    results[term] = None
+    finally:
+        pool.close()
+    return results
@@ -0,0 +1,193 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+
+from media_common import http_client
+from media_common import store as media_store
+
+# Finished downloads by URL and file, so a rerun over the same link lists skips what it already has.
+# Override with MEDIA_DOWNLOAD_MANIFEST.
+MANIFEST_PATH = os.environ.get(
+    "MEDIA_DOWNLOAD_MANIFEST",
+    os.path.join(os.path.expanduser("~"), ".media_downloads.sqlite3")
+)
+
+DOWNLOAD_WORKERS = 8
+HOST_CONNECTIONS = 4  # Transfers in flight per host, whatever the worker count
+CHUNK_SIZE = 1024 * 1024
+MAX_ATTEMPTS = 5  # Per file; an interrupted transfer resumes from its .part file
+
+# Politeness per host, (requests per second, burst), on top of http_client.ENDPOINT_LIMITS
+HOST_LIMITS = {
+    "videos.pexels.com": (1.0, 4),
+    "www.pexels.com": (1.0, 4),
+    "cdn.pixabay.com": (1.0, 4),
+}
+
+# One row per (url, path): the same image saved into several folders is complete in each of them.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    completed REAL NOT NULL,
+    PRIMARY KEY (url, path)
+)
+"""
+
+
+class IncompleteDownload(IOError):
+    """The server closed the transfer before the announced length arrived."""
+
+
+def content_length(response, offset):
+    """Full size of the resource from a 200 or 206 response, or None if the server does not say."""
+    content_range = response.headers.get("Content-Range", "")
+    if response.status_code == 206 and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    if length is None or not length.isdigit():
+        return None
+    return int(length) + (offset if response.status_code == 206 else 0)
+
+
+class DownloadManifest:
+    """SQLite record of completed downloads: URL, file and its length."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(SCHEMA)
+            self.conn.commit()
+
+    def completed(self, url, path):
+        """True if the URL was downloaded to `path` and the file still has the recorded length."""
+        with self.lock:
+            row = self.conn.execute("SELECT size FROM downloads WHERE url = ? AND path = ?",
+                                    (url, os.path.abspath(path))).fetchone()
+        return row is not None and os.path.exists(path) and os.path.getsize(path) == row[0]
+
+    def record(self, url, path):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO downloads (url, path, size, completed) VALUES (?, ?, ?, ?)",
+                              (url, os.path.abspath(path), os.path.getsize(path), time.time()))
+            self.conn.commit()
+
+
+class Downloader:
+    """Bounded worker pool that streams URLs to files, politely and resumably.
+
+    Each host gets a token bucket (HOST_LIMITS, via the shared http_client) and at most
+    HOST_CONNECTIONS transfers at once, instead of a blanket sleep after every file. Data is
+    written to `<path>.part` and renamed once complete; an interrupted transfer continues
+    from the .part file with an HTTP Range request, and completed URLs are skipped by the
+    manifest as long as the file keeps its length.
+
+    With a media store, the bytes are hashed as they arrive and the finished file goes into
+    the store, `path` becoming a hardlink to it; an asset already stored under another
+    name or folder is not kept twice.
+    """
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, client=None, manifest=None, host_connections=HOST_CONNECTIONS,
+                 store=None):
+        self.workers = max(1, workers)
+        self.client = client or http_client.HttpClient(limits=HOST_LIMITS, pool_size=max(self.workers, http_client.POOL_SIZE))
+        self.manifest = manifest or DownloadManifest()
+        self.store = store
+        self.host_connections = host_connections
+        self.host_slots = {}
+        self.lock = threading.Lock()
+
+    def host_slot(self, url):
+        host = urlsplit(url).hostname
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.host_connections)
+            return self.host_slots[host]
+
+    def transfer(self, url, part_path, headers=None):
+        """One attempt: appends to the .part file from where it stopped. Returns the SHA-256 of the whole file."""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request_headers = dict(headers or {})
+        if offset:
+            request_headers["Range"] = f"bytes={offset}-"
+
+        response = self.client.get(url, headers=request_headers, stream=True, timeout=60)
+        with response:
+            if response.status_code == 416:
+                # The .part file is no prefix of the current resource; start over
+                os.remove(part_path)
+                raise IncompleteDownload(f"Range not satisfiable for {url}, restarting")
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0  # Server ignored the Range header and sent the whole file
+            expected = content_length(response, offset)
+            writer = media_store.HashingWriter(None)
+            if offset:
+                writer.feed_file(part_path)  # The kept prefix, so the hash covers the whole file
+            with open(part_path, "ab" if offset else "wb") as f:
+                writer.file = f
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    writer.write(chunk)
+
+        size = os.path.getsize(part_path)
+        if expected is not None and size != expected:
+            raise IncompleteDownload(f"{url}: got {size} of {expected} bytes")
+        return writer.hexdigest()
+
+    def download(self, url, path, headers=None):
+        """Downloads one URL to `path`; returns True if it was fetched, False if it was already complete."""
+        if self.manifest.completed(url, path):
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        part_path = f"{path}.part"
+
+        with self.host_slot(url):
+            for attempt in range(MAX_ATTEMPTS):
+                try:
+                    digest = self.transfer(url, part_path, headers)
+                    break
+                except (IncompleteDownload, requests.ConnectionError, requests.Timeout,
+                        requests.exceptions.ChunkedEncodingError) as e:
+                    if attempt == MAX_ATTEMPTS - 1:
+                        raise
+                    delay = http_client.backoff_delay(attempt)
+                    logging.warning(f"Download of {url} interrupted ({e}); resuming in {delay:.1f}s")
+                    time.sleep(delay)
+
+        if self.store:
+            self.store.add(part_path, digest, os.path.splitext(path)[1])
+            self.store.link(digest, path, url)
+        else:
+            os.replace(part_path, path)
+        self.manifest.record(url, path)
+        return True
+
+    def download_all(self, jobs, headers=None):
+        """Downloads (url, path) pairs on the worker pool; yields (url, path, downloaded, error) as each ends.
+
+        `downloaded` is False for URLs the manifest already had. A failed download yields its
+        exception and leaves its .part file for the next run to resume.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.download, url, path, headers): (url, path) for url, path in jobs}
+            for future in as_completed(futures):
+                url, path = futures[future]
+                try:
+                    yield url, path, future.result(), None
+                except Exception as e:
+                    yield url, path, False, e
+
+
+def download_all(jobs, workers=DOWNLOAD_WORKERS, headers=None, store=None):
+    """Downloader.download_all with a fresh downloader of `workers` threads."""
+    return Downloader(workers, store=store).download_all(jobs, headers)
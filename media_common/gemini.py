@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from media_common import http_client
+
+# Gemini responses, keyed by everything that was sent. Shared by every script so a rerun of an
+# autoblog batch only pays for the inputs that changed. Override with MEDIA_GEMINI_CACHE.
+GEMINI_CACHE_PATH = os.environ.get(
+    "MEDIA_GEMINI_CACHE",
+    os.path.join(os.path.expanduser("~"), ".media_gemini_cache.sqlite3")
+)
+
+# Point the client at a local mock server (REST transport), e.g. http://localhost:8080
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT")
+
+# MEDIA_GEMINI_STUB=1 answers every prompt locally without the API (or the google package),
+# for exercising the scripts offline. Stub responses are never cached.
+GEMINI_STUB = os.environ.get("MEDIA_GEMINI_STUB") == "1"
+
+# Requests in flight at once in batch mode; http_client's Gemini token bucket still sets the pace
+BATCH_WORKERS = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+_configure_lock = threading.Lock()
+_configured_key = None
+_models = {}
+_prompts = {}
+
+
+def configure(api_key):
+    """Configures the Gemini client once per process (again only if the key changes)."""
+    global _configured_key
+    with _configure_lock:
+        if GEMINI_STUB or _configured_key == api_key:
+            return
+        import google.generativeai as genai
+
+        if GEMINI_API_ENDPOINT:
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+        else:
+            genai.configure(api_key=api_key)
+        _configured_key = api_key
+        _models.clear()
+
+
+def model(name):
+    """The GenerativeModel for `name`, built once and reused for every request."""
+    with _configure_lock:
+        if name not in _models:
+            import google.generativeai as genai
+
+            _models[name] = genai.GenerativeModel(name)
+        return _models[name]
+
+
+def block_none():
+    """Safety settings with every harm category unblocked, as the scripts send them.
+
+    Empty under the stub, which needs no google package.
+    """
+    if GEMINI_STUB:
+        return {}
+    from google.generativeai.types import HarmCategory, HarmBlockThreshold
+
+    return {
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    }
+
+
+def read_prompt(path):
+    """Reads a prompt template, re-reading it only when the file changes."""
+    stat = os.stat(path)
+    with _configure_lock:
+        cached = _prompts.get(path)
+        if cached and cached[0] == (stat.st_size, stat.st_mtime_ns):
+            return cached[1]
+    with open(path, "r", encoding='utf-8') as f:
+        template = f.read()
+    with _configure_lock:
+        _prompts[path] = ((stat.st_size, stat.st_mtime_ns), template)
+    return template
+
+
+def build_prompt(content, template):
+    """The scripts' prompt layout: the input file, a blank line, then the template."""
+    return f"{content}\n\n{template}"
+
+
+def cache_key(model_name, template, content, safety_settings=None):
+    """Hash of everything that changes the response."""
+    safety = sorted((str(category), str(threshold)) for category, threshold in (safety_settings or {}).items())
+    payload = json.dumps([model_name, template, content, safety], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def stub_response(model_name, prompt):
+    """Deterministic offline answer for MEDIA_GEMINI_STUB runs."""
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+    first_line = prompt.strip().splitlines()[0] if prompt.strip() else ""
+    return f"[{model_name} stub {digest}] {first_line}\n\n{prompt}"
+
+
+class ResponseCache:
+    """SQLite store of Gemini response text; hits and misses are counted per process for report()."""
+
+    def __init__(self, path=GEMINI_CACHE_PATH):
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(SCHEMA)
+            self.conn.commit()
+
+    def lookup(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def store(self, key, model_name, response):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, response, now, now)
+            )
+            self.conn.commit()
+
+    def report(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            stats = dict(self.stats)
+        return f"Gemini cache: {stats['hits']} hits, {stats['misses']} misses; {entries} responses stored"
+
+
+_default_cache = None
+_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """Returns the process-wide response cache, opening it on first use."""
+    global _default_cache
+    with _cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+
+def generate(content, template, model_name, safety_settings=None):
+    """Response text for one input, from the cache or from a (rate-limited, retried) API call.
+
+    configure() must have been called first, unless running against the stub.
+    """
+    prompt = build_prompt(content, template)
+    if GEMINI_STUB:
+        return stub_response(model_name, prompt)
+
+    cache = default_cache()
+    key = cache_key(model_name, template, content, safety_settings)
+    text = cache.lookup(key)
+    if text is not None:
+        logging.info(f"Gemini cache hit ({len(prompt)} prompt characters not sent)")
+        return text
+
+    kwargs = {"safety_settings": safety_settings} if safety_settings else {}
+    response = http_client.default_client().call(http_client.GEMINI, model(model_name).generate_content, prompt, **kwargs)
+    text = response.text  # Raises for a blocked or empty response, which is then not cached
+    cache.store(key, model_name, text)
+    return text
+
+
+def generate_file(filepath, template, model_name, safety_settings=None):
+    """generate() for the contents of a text file."""
+    with open(filepath, "r", encoding='utf-8') as f:
+        content = f.read()
+    return generate(content, template, model_name, safety_settings)
+
+
+def generate_files(filepaths, template, model_name, safety_settings=None, workers=BATCH_WORKERS):
+    """Batch mode: submits up to `workers` files at once and yields (path, text, error) as each finishes.
+
+    A failed file yields its exception as `error` (and None as text) without stopping the batch.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(generate_file, path, template, model_name, safety_settings): path
+                   for path in filepaths}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                logging.error(f"Gemini request for {futures[future]} failed: {e}")
+                yield futures[future], None, e
+
+
+def report():
+    return default_cache().report()
+
+
+if __name__ == "__main__":
+    # Show the cache's size, e.g. python -m media_common.gemini
+    print(report())
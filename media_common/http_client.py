@@ -0,0 +1,189 @@
+import os
+import time
+import random
+import logging
+import threading
+import email.utils
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth another try: rate limited or a transient server error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0  # Seconds before the first retry; doubles per attempt (with full jitter)
+BACKOFF_CAP = 60.0
+POOL_SIZE = 16
+
+# Endpoint keys for the SDK calls (Gemini, Replicate) that do not go through this client's session
+GEMINI = "generativelanguage.googleapis.com"
+REPLICATE = "api.replicate.com"
+
+# (requests per second, burst) per endpoint host, kept a little under each plan's quota.
+# Hosts not listed here get DEFAULT_LIMIT.
+ENDPOINT_LIMITS = {
+    "api.elevenlabs.io": (2.0, 3),
+    GEMINI: (0.25, 2),  # 15 requests a minute on the Gemini 1.5 Flash free tier
+    REPLICATE: (5.0, 10),
+}
+DEFAULT_LIMIT = (5.0, 5)
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, with bursts of up to `burst` calls."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a call is allowed."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter, so retrying workers spread out instead of stampeding."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_after(response):
+    """Seconds asked for by a Retry-After header (delta-seconds or HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def error_status(error):
+    """HTTP status carried by an SDK or requests exception, if any."""
+    response = getattr(error, "response", None)
+    if response is not None and hasattr(response, "status_code"):
+        return response.status_code
+    for attribute in ("status_code", "code", "status"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return int(value)
+    return None
+
+
+class HttpClient:
+    """One pooled session for the API integrations, with per-endpoint rate limits and retries.
+
+    Every request first takes a token from its host's bucket, so the scripts need no fixed
+    sleeps between calls. 429 and 5xx responses and dropped connections are retried with
+    jittered exponential backoff; a Retry-After header, when present, sets the wait instead.
+    """
+
+    def __init__(self, limits=None, pool_size=POOL_SIZE, max_retries=MAX_RETRIES):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.limits = dict(ENDPOINT_LIMITS, **(limits or {}))
+        self.max_retries = max_retries
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def throttle(self, key):
+        """Waits for the endpoint's rate limit."""
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(*self.limits.get(key, DEFAULT_LIMIT))
+            bucket = self.buckets[key]
+        bucket.acquire()
+
+    def request(self, method, url, **kwargs):
+        """session.request() with rate limiting and retries; returns the final response."""
+        key = urlsplit(url).hostname
+        for attempt in range(self.max_retries + 1):
+            self.throttle(key)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logging.warning(f"{method} {url} failed ({e}); retrying in {delay:.1f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                delay = retry_after(response)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                response.close()
+                logging.warning(f"{method} {url} returned {response.status_code}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def download(self, url, path, method="GET", chunk_size=1 << 16, **kwargs):
+        """Streams a response body to `path` (via a .partial file) and returns the path.
+
+        Raises requests.HTTPError for an error response; its body stays readable on e.response.
+        """
+        response = self.request(method, url, stream=True, **kwargs)
+        with response:
+            if not response.ok:
+                response.content  # Read the error body before the connection goes back to the pool
+                response.raise_for_status()
+            temp_path = f"{path}.partial"
+            with open(temp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+        os.replace(temp_path, path)
+        return path
+
+    def call(self, key, func, *args, **kwargs):
+        """Runs an SDK call under the endpoint's rate limit, retrying it like a request.
+
+        For the Gemini and Replicate clients, whose exceptions carry the HTTP status.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.throttle(key)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                transient = isinstance(e, (requests.ConnectionError, requests.Timeout))
+                if attempt == self.max_retries or not (transient or error_status(e) in RETRY_STATUSES):
+                    raise
+                delay = backoff_delay(attempt)
+                logging.warning(f"{getattr(func, '__name__', 'call')} on {key} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+
+_default_client = None
+_client_lock = threading.Lock()
+
+
+def default_client():
+    """Returns the process-wide client, so every integration shares one connection pool."""
+    global _default_client
+    with _client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+# Where the journals live. One small JSON file per job; it is deleted once the job finishes,
+# so anything left here belongs to a run that died and will be resumed by the next run.
+JOURNAL_DIR = os.environ.get(
+    "MEDIA_JOURNAL_DIR",
+    os.path.join(os.path.expanduser("~"), ".media_render_journal")
+)
+
+# Failed attempts after which a job's journal is dropped, so a job that fails every time
+# (a corrupt clip, a bad filter) is planned afresh instead of being resumed forever.
+MAX_FAILURES = 3
+
+
+def file_signature(path):
+    """(absolute path, size, mtime_ns) for an existing file, or None."""
+    if not isinstance(path, str) or not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def fingerprint(inputs):
+    """Hashes a stage's inputs; strings naming existing files are hashed by path, size and mtime."""
+    def normalize(value):
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in sorted(value.items())}
+        return file_signature(value) or value
+    encoded = json.dumps(normalize(inputs), sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def result_files(result):
+    """Every existing file named in a stage result."""
+    if isinstance(result, (list, tuple)):
+        return [path for value in result for path in result_files(value)]
+    return [result] if file_signature(result) else []
+
+
+class RenderJournal:
+    """Records the completed stages of one job so a crashed run resumes where it stopped.
+
+    Each stage is stored with a hash of its inputs, its result (usually the output path)
+    and the size/mtime of the files it produced. A stage is skipped on the next run only
+    when its inputs hash the same and its output files are still on disk, unchanged.
+    Plain values (the chosen clips, the output name, the workspace folder) can be kept
+    with get()/set() so the resumed run rebuilds the same video instead of a new random one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()  # Segments of a render record their stages from worker threads
+        self.state = {"values": {}, "stages": {}}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.state = json.load(f)
+                logging.info(f"Resuming from journal {path} ({len(self.state['stages'])} stages done)")
+            except (ValueError, KeyError) as e:
+                logging.warning(f"Ignoring unreadable journal {path}: {e}")
+
+    @property
+    def resumed(self):
+        return bool(self.state["values"] or self.state["stages"])
+
+    def save(self):
+        # Write then rename so a crash mid-write never leaves a truncated journal
+        with self.lock:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(temp_path, self.path)
+
+    def get(self, key, default=None):
+        return self.state["values"].get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self.state["values"][key] = value
+            self.save()
+        return value
+
+    def setdefault(self, key, value):
+        """Returns the stored value, storing `value` first if there is none."""
+        if key not in self.state["values"]:
+            self.set(key, value)
+        return self.state["values"][key]
+
+    def completed(self, name, inputs):
+        """Returns (True, result) if the stage already ran with these inputs and its outputs are intact."""
+        entry = self.state["stages"].get(name)
+        if not entry or entry["inputs"] != fingerprint(inputs):
+            return False, None
+        for path, signature in entry["files"].items():
+            if file_signature(path) != signature:
+                return False, None
+        return True, entry["result"]
+
+    def record(self, name, inputs, result):
+        entry = {
+            "inputs": fingerprint(inputs),
+            "result": result,
+            "files": {os.path.abspath(path): file_signature(path) for path in result_files(result)},
+        }
+        with self.lock:
+            self.state["stages"][name] = entry
+            self.save()
+
+    def stage(self, name, inputs, action, output=None):
+        """Runs action() unless the stage is already done; returns the stage result either way.
+
+        The result is what action() returns, or `output` for actions that return nothing.
+        A stage is only recorded once its result names at least one file that exists, so
+        steps that fail without raising are simply run again next time.
+        """
+        done, result = self.completed(name, inputs)
+        if done:
+            logging.info(f"Skipping stage '{name}', already completed: {result}")
+            return result
+        result = action()
+        if result is None:
+            result = output
+        if result_files(result):
+            self.record(name, inputs, result)
+        return result
+
+    def fail(self, error):
+        """Counts a failed attempt. Returns True if the job should be resumed next run.
+
+        After MAX_FAILURES attempts the journal is removed and False returned; the next
+        run then starts the job over with new choices.
+        """
+        with self.lock:
+            failures = self.state.get("failures", 0) + 1
+            self.state["failures"] = failures
+            self.state["last_error"] = str(error)
+            if failures >= MAX_FAILURES:
+                logging.error(f"Job failed {failures} times, dropping journal {self.path}; last error: {error}")
+                self.finish()
+                return False
+            self.save()
+            return True
+
+    def finish(self):
+        """Removes the journal once the job has produced its final output."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def open_journal(name, *key, journal_dir=None):
+    """Opens the journal for a job identified by a readable name plus any key values."""
+    journal_dir = journal_dir or JOURNAL_DIR
+    os.makedirs(journal_dir, exist_ok=True)
+    digest = hashlib.sha1(json.dumps([name, *key], default=str).encode("utf-8")).hexdigest()[:16]
+    safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+    return RenderJournal(os.path.join(journal_dir, f"{safe_name}-{digest}.json"))
@@ -0,0 +1,103 @@
+import os
+import hashlib
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+COLORKEY_FILTER = "colorkey=0x000000:0.1:0.1"
+
+# Where keyed foreground clips are kept. ProRes 4444 decodes quickly but is large
+# (roughly 1 GB per minute of 1080p), so point MEDIA_KEYED_CACHE at a roomy drive.
+KEYED_CACHE_DIR = os.environ.get(
+    "MEDIA_KEYED_CACHE",
+    os.path.join(os.path.expanduser("~"), ".media_keyed_cache")
+)
+KEY_WORKERS = 4
+
+# Alpha-carrying intermediate; audio is copied so the asset can stand in for the source clip
+ASSET_ARGS = ["-c:v", "prores_ks", "-profile:v", "4444", "-pix_fmt", "yuva444p10le", "-c:a", "copy"]
+ASSET_FORMAT = "yuva444p10le"
+
+_building = {}
+_building_lock = threading.Lock()
+
+
+def source_signature(path):
+    """Identifies a clip by absolute path, size and mtime, like the metadata catalog.
+
+    Editing or replacing the clip changes the signature, so a stale asset is never reused.
+    """
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def asset_path(path, key_filter=COLORKEY_FILTER, cache_dir=None):
+    """Cache location for a clip keyed with `key_filter` (None/'' keeps it opaque)."""
+    key_filter = key_filter or ""
+    key = hashlib.sha1(f"{source_signature(path)}|{key_filter}|{' '.join(ASSET_ARGS)}".encode("utf-8")).hexdigest()[:20]
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir or KEYED_CACHE_DIR, key[:2], f"{name}-{key}.mov")
+
+
+def build_asset(path, output_path, key_filter=COLORKEY_FILTER):
+    """Applies the key filter once and writes the result with an alpha channel."""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    video_filter = f"{key_filter},format={ASSET_FORMAT}" if key_filter else f"format={ASSET_FORMAT}"
+    temp_output = f"{os.path.splitext(output_path)[0]}.partial.mov"
+    command = [
+        "ffmpeg", "-loglevel", "error", "-i", path,
+        "-vf", video_filter, "-map", "0:v", "-map", "0:a?",
+        *ASSET_ARGS, "-y", temp_output
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        logging.error(f"FFmpeg errors:\n{result.stderr}")
+        raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+    os.replace(temp_output, output_path)
+    logging.info(f"Keyed {path} into {output_path}")
+    return output_path
+
+
+def keyed_asset(path, key_filter=COLORKEY_FILTER, cache_dir=None):
+    """Returns the cached alpha asset for a clip, keying it first if this is the first use.
+
+    The overlay that consumes the asset needs no key filter: its alpha channel already
+    carries the transparency.
+    """
+    output_path = asset_path(path, key_filter, cache_dir)
+    if os.path.exists(output_path):
+        return output_path
+
+    # Two threads asking for the same clip build it once
+    with _building_lock:
+        lock = _building.setdefault(output_path, threading.Lock())
+    with lock:
+        if not os.path.exists(output_path):
+            build_asset(path, output_path, key_filter)
+    return output_path
+
+
+def keyed_assets(items, max_workers=KEY_WORKERS, cache_dir=None):
+    """keyed_asset for a list of (path, key_filter) pairs, building missing assets in parallel."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda item: keyed_asset(item[0], item[1], cache_dir), items))
+
+
+def prebuild_folder(folder, key_filter=COLORKEY_FILTER, extensions=(".mp4", ".mov"), max_workers=KEY_WORKERS):
+    """Keys every clip under a folder ahead of the renders that will use them."""
+    paths = [os.path.join(root, f)
+             for root, _, files in os.walk(folder)
+             for f in files if f.lower().endswith(extensions)]
+    return keyed_assets([(path, key_filter) for path in paths], max_workers)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Key the foreground clips ahead of a render, e.g.
+    # python -m media_common.keyed "E:\Dataset\All Audio Quotes\Video Clips (Full Letters)\Vertical\2s Added"
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for folder in sys.argv[1:]:
+        assets = prebuild_folder(folder)
+        logging.info(f"{len(assets)} keyed assets ready for {folder}")
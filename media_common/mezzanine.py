@@ -0,0 +1,291 @@
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from media_common import catalog
+from media_common import store as media_store
+
+# Normalized copies of the source clips plus the manifest that says which profile each
+# one conforms to. Override with MEDIA_MEZZANINE_DIR to keep the library on another drive.
+MEZZANINE_DIR = os.environ.get(
+    "MEDIA_MEZZANINE_DIR",
+    os.path.join(os.path.expanduser("~"), ".media_mezzanine")
+)
+MANIFEST_NAME = "manifest.sqlite3"
+NORMALIZE_WORKERS = 2
+
+# Every asset of a profile shares these, so the concat demuxer can always join them with -c copy
+TIMESCALE = 90000
+SAMPLE_RATE = 44100
+CHANNELS = 2
+ENCODER_ARGS = ["-c:v", "libx264", "-preset", "medium", "-crf", "18", "-pix_fmt", "yuv420p"]
+AUDIO_ARGS = ["-c:a", "aac", "-b:a", "192k", "-ar", str(SAMPLE_RATE), "-ac", str(CHANNELS)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    source TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    output TEXT NOT NULL,
+    PRIMARY KEY (source, profile)
+)
+"""
+
+
+def profile(width, height, fps=30):
+    """A canonical profile; its name changes whenever any of the settings do."""
+    settings = [width, height, fps, TIMESCALE, SAMPLE_RATE, CHANNELS, ENCODER_ARGS, AUDIO_ARGS]
+    digest = hashlib.sha1(json.dumps(settings).encode("utf-8")).hexdigest()[:8]
+    return {"name": f"{width}x{height}@{fps}-{digest}", "width": width, "height": height, "fps": fps}
+
+
+VERTICAL = profile(1080, 1920)
+HORIZONTAL = profile(1920, 1080)
+PROFILES = {"vertical": VERTICAL, "horizontal": HORIZONTAL}
+
+# Music tracks only need the sample rate to match; any of these codecs is used as it is
+MUSIC_CODECS = ("aac", "mp3", "flac")
+MUSIC = {"name": f"music-{SAMPLE_RATE}-{hashlib.sha1(json.dumps(AUDIO_ARGS).encode('utf-8')).hexdigest()[:8]}",
+         "extension": ".m4a"}
+
+
+def profile_for(path):
+    """Picks the vertical or horizontal profile from the clip's own orientation."""
+    width, height = catalog.get_resolution(path)
+    return VERTICAL if height > width else HORIZONTAL
+
+
+def conforms(path, target):
+    """True when a file already matches the profile (codec, size, fps, pixel format, audio).
+
+    The timebase is not compared: the concat demuxer rescales timestamps while copying.
+    """
+    entry = catalog.probe(path)
+    return (entry["video_codec"] == "h264"
+            and (entry["width"], entry["height"]) == (target["width"], target["height"])
+            and entry["fps"] is not None and abs(entry["fps"] - target["fps"]) < 0.01
+            and entry["pix_fmt"] == "yuv420p"
+            and entry["audio_codec"] == "aac"
+            and entry["sample_rate"] == SAMPLE_RATE
+            and entry["channels"] == CHANNELS)
+
+
+class Manifest:
+    """Records, per source file and profile, the conforming asset to use in its place."""
+
+    def __init__(self, library_dir=MEZZANINE_DIR):
+        os.makedirs(library_dir, exist_ok=True)
+        self.library_dir = library_dir
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(library_dir, MANIFEST_NAME), timeout=60, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(SCHEMA)
+            self.conn.commit()
+
+    def lookup(self, source, target):
+        """Returns the recorded asset if the source is unchanged and the asset still exists."""
+        source = os.path.abspath(source)
+        stat = os.stat(source)
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime_ns, output FROM assets WHERE source = ? AND profile = ?",
+                                    (source, target["name"])).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns or not os.path.exists(row[2]):
+            return None
+        return row[2]
+
+    def record(self, source, target, output):
+        source = os.path.abspath(source)
+        stat = os.stat(source)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO assets (source, profile, size, mtime_ns, output) VALUES (?, ?, ?, ?, ?)",
+                              (source, target["name"], stat.st_size, stat.st_mtime_ns, output))
+            self.conn.commit()
+
+    def output_path(self, source, target):
+        key = hashlib.sha1(os.path.abspath(source).encode("utf-8")).hexdigest()[:12]
+        name = os.path.splitext(os.path.basename(source))[0]
+        return os.path.join(self.library_dir, target["name"], f"{name}-{key}{target.get('extension', '.mp4')}")
+
+
+def transcode(source, output_path, target):
+    """Transcodes one clip into the profile: letterboxed to size, fixed fps, closed GOPs, stereo 44.1 kHz AAC."""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    width, height, fps = target["width"], target["height"], target["fps"]
+    video_filter = (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                    f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps}")
+
+    inputs = ["-i", source]
+    audio_map = ["-map", "0:a:0"]
+    if catalog.probe(source)["audio_codec"] is None:
+        # Silent clips get a silent track so every asset has the same streams
+        inputs += ["-f", "lavfi", "-i", f"anullsrc=r={SAMPLE_RATE}:cl=stereo"]
+        audio_map = ["-map", "1:a", "-shortest"]
+
+    temp_output = f"{os.path.splitext(output_path)[0]}.partial.mp4"
+    command = [
+        "ffmpeg", "-loglevel", "error", *inputs,
+        "-map", "0:v:0", *audio_map, "-vf", video_filter,
+        *ENCODER_ARGS, "-g", str(fps * 2), "-sc_threshold", "0", "-flags", "+cgop",
+        *AUDIO_ARGS, "-video_track_timescale", str(TIMESCALE),
+        "-movflags", "+faststart", "-y", temp_output
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        logging.error(f"FFmpeg errors:\n{result.stderr}")
+        raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+    os.replace(temp_output, output_path)
+    return output_path
+
+
+_default_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def default_manifest():
+    """Returns the process-wide manifest, opening it on first use."""
+    global _default_manifest
+    with _manifest_lock:
+        if _default_manifest is None:
+            _default_manifest = Manifest()
+        return _default_manifest
+
+
+def conform(path, target=None):
+    """Returns a file conforming to the profile for `path`, normalizing it on first use.
+
+    Sources that already conform are recorded as their own asset and never copied.
+    Duplicates of a stored asset share one normalized copy.
+    """
+    path = media_store.canonical(path)
+    target = target or profile_for(path)
+    manifest = default_manifest()
+    asset = manifest.lookup(path, target)
+    if asset:
+        return asset
+
+    if conforms(path, target):
+        asset = os.path.abspath(path)
+    else:
+        logging.info(f"Normalizing {path} to {target['name']}")
+        asset = transcode(path, manifest.output_path(path, target), target)
+    manifest.record(path, target, asset)
+    return asset
+
+
+def conform_all(paths, target=None, max_workers=NORMALIZE_WORKERS):
+    """conform() for a list of clips. Without a profile, the first clip's orientation decides it."""
+    if not paths:
+        return []
+    target = target or profile_for(paths[0])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda path: conform(path, target), paths))
+
+
+def concat_copy(paths, output_path, list_path, duration=None, extra_args=()):
+    """Joins conformed assets with the concat demuxer and -c copy; no decoding involved."""
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    command = ["ffmpeg", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+               "-c", "copy", *(["-t", str(duration)] if duration else []), *extra_args, "-y", output_path]
+    subprocess.run(command, check=True)
+    os.remove(list_path)
+    return output_path
+
+
+def music_conforms(path):
+    """True when a track can go into the mix as it is: a known codec at the library sample rate."""
+    entry = catalog.probe(path)
+    return entry["audio_codec"] in MUSIC_CODECS and entry["sample_rate"] == SAMPLE_RATE
+
+
+def transcode_music(source, output_path):
+    """Transcodes one track to stereo 44.1 kHz AAC."""
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temp_output = f"{os.path.splitext(output_path)[0]}.partial{MUSIC['extension']}"
+    command = ["ffmpeg", "-loglevel", "error", "-i", source, "-map", "0:a:0", "-vn",
+               *AUDIO_ARGS, "-y", temp_output]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        logging.error(f"FFmpeg errors:\n{result.stderr}")
+        raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+    os.replace(temp_output, output_path)
+    return output_path
+
+
+def conform_music(path):
+    """Returns a 44.1 kHz version of a music track, transcoding it on first use only."""
+    path = media_store.canonical(path)
+    manifest = default_manifest()
+    asset = manifest.lookup(path, MUSIC)
+    if asset:
+        return asset
+
+    if music_conforms(path):
+        asset = os.path.abspath(path)
+    else:
+        logging.info(f"Conforming {path} to {MUSIC['name']}")
+        asset = transcode_music(path, manifest.output_path(path, MUSIC))
+    manifest.record(path, MUSIC, asset)
+    return asset
+
+
+def music_library(folder, extensions=(".mp3", ".wav", ".ogg"), max_workers=NORMALIZE_WORKERS):
+    """Every usable track under a folder as (conformed path, duration), ready to mix.
+
+    The folder is probed in parallel through the catalog and tracks not at 44.1 kHz are
+    transcoded once into the library, so a later run needs no subprocess at all. Files
+    without a readable audio stream are left out.
+    """
+    paths = [os.path.join(root, f)
+             for root, _, files in os.walk(folder)
+             for f in files if f.lower().endswith(extensions)]
+    catalog.default_catalog().prefetch(paths)
+
+    def prepare(path):
+        try:
+            if not catalog.probe(path)["audio_codec"]:
+                return None
+            asset = conform_music(path)
+            return asset, catalog.get_duration(asset)
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            logging.warning(f"Skipping music track {path}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [track for track in executor.map(prepare, paths) if track and track[1] > 0]
+
+
+def normalize_folder(folder, target, extensions=(".mp4", ".mov", ".mkv", ".avi"), max_workers=NORMALIZE_WORKERS):
+    """Normalizes every clip under a folder into the library."""
+    paths = [os.path.join(root, f)
+             for root, _, files in os.walk(folder)
+             for f in files if f.lower().endswith(extensions)]
+    catalog.default_catalog().prefetch(paths)
+    return conform_all(paths, target, max_workers)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Build the library ahead of the renders, e.g.
+    # python -m media_common.mezzanine vertical "E:\Dataset\All Video BG\Watermarked\Vertical"
+    # or the music library: python -m media_common.mezzanine music "E:\Dataset\PEXELS\ALL_AUDIO_converted_finished"
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if sys.argv[1] == "music":
+        for folder in sys.argv[2:]:
+            tracks = music_library(folder)
+            logging.info(f"{len(tracks)} tracks under {folder} are ready at {SAMPLE_RATE} Hz")
+        sys.exit()
+    target = PROFILES[sys.argv[1]]
+    for folder in sys.argv[2:]:
+        assets = normalize_folder(folder, target)
+        logging.info(f"{len(assets)} clips under {folder} conform to {target['name']}")
@@ -0,0 +1,76 @@
+import queue
+import logging
+import threading
+
+_DONE = object()
+
+
+class Stage:
+    """One step of a pipeline: action(item) run by `workers` threads.
+
+    Its input queue holds at most `queue_size` items, so a slow stage (the render)
+    holds back the stages before it instead of letting them run arbitrarily far ahead.
+    """
+
+    def __init__(self, name, action, workers=1, queue_size=2):
+        self.name = name
+        self.action = action
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+
+
+def run_pipeline(items, stages):
+    """Pushes every item through the stages in order, with the stages working side by side.
+
+    While item N is in the last stage, items N+1, N+2, ... are already being handled by the
+    earlier ones. Each stage passes what its action returns on to the next stage; an action
+    that raises or returns None drops the item (the error is logged). Returns the results of
+    the last stage, in completion order, and a list of (stage name, item, error) failures.
+    """
+    queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+    results, failures = [], []
+    lock = threading.Lock()
+    remaining = [stage.workers for stage in stages]
+
+    def work(index):
+        stage = stages[index]
+        while True:
+            item = queues[index].get()
+            if item is _DONE:
+                break
+            try:
+                result = stage.action(item)
+                error = None if result is not None else "no result"
+            except Exception as e:
+                result, error = None, e
+                logging.exception(f"Pipeline stage '{stage.name}' failed")
+            if error is not None:
+                with lock:
+                    failures.append((stage.name, item, error))
+            elif index + 1 < len(stages):
+                queues[index + 1].put(result)
+            else:
+                with lock:
+                    results.append(result)
+
+        # The last worker of a stage to finish tells every worker of the next stage to stop
+        with lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last and index + 1 < len(stages):
+            for _ in range(stages[index + 1].workers):
+                queues[index + 1].put(_DONE)
+
+    threads = [threading.Thread(target=work, args=(index,), name=f"{stage.name}-{n}", daemon=True)
+               for index, stage in enumerate(stages) for n in range(stage.workers)]
+    for thread in threads:
+        thread.start()
+
+    for item in items:
+        queues[0].put(item)
+    for _ in range(stages[0].workers):
+        queues[0].put(_DONE)
+
+    for thread in threads:
+        thread.join()
+    return results, failures
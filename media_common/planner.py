@@ -0,0 +1,93 @@
+import logging
+import itertools
+
+from media_common import catalog
+
+# How close the planned sequence must land to the target (seconds).
+DEFAULT_TOLERANCE = 0.5
+
+
+def clip_entry(path, keyed):
+    return {"path": path, "duration": catalog.get_duration(path), "keyed": keyed}
+
+
+def expected_duration(sampler, used, estimates, candidates):
+    """Average duration of the clips a folder is about to hand out (cached per plan)."""
+    if sampler.folder not in estimates:
+        upcoming = sampler.peek(candidates, used)
+        durations = [catalog.get_duration(path) for path in upcoming]
+        estimates[sampler.folder] = sum(durations) / len(durations) if durations else 0.0
+    return estimates[sampler.folder]
+
+
+def best_tail(pools, remaining, tolerance):
+    """Bounded subset-sum over the next slots: picks one clip per slot for a prefix of the slots.
+
+    Prefers the smallest overshoot of `remaining`; falls back to the largest undershoot
+    when no combination reaches it. Returns (picks, total) where picks is a list of (slot, path, duration).
+    """
+    best, best_key = [], None
+    for length in range(1, len(pools) + 1):
+        for combo in itertools.product(*pools[:length]):
+            paths = [path for path, _ in combo]
+            if len(set(paths)) != len(paths):
+                continue  # Two slots drawing from the same folder cannot share a clip
+            total = sum(duration for _, duration in combo)
+            over = total - remaining
+            # Overshoots rank before undershoots; within each, closer is better
+            key = (0, over) if over >= 0 else (1, -over)
+            if best_key is None or key < best_key:
+                best_key = key
+                best = [(slot, path, duration) for slot, (path, duration) in enumerate(combo)]
+                if 0 <= over <= tolerance:
+                    return best, total
+    return best, sum(duration for _, _, duration in best)
+
+
+def plan_sequence(cycle, target, used, get_sampler, sequence=None, tolerance=DEFAULT_TOLERANCE,
+                  tail_slots=3, candidates=12):
+    """Plans a clip sequence that follows `cycle` and lands on `target` seconds.
+
+    cycle is the repeating list of (folder, keyed) slots, e.g. FG, FG, Stoistica, ..., Motivation, title.
+    Clips are drawn in order until the remaining time fits in the next few slots; those slots are
+    then chosen together from each folder's upcoming clips so the sum lands within `tolerance`.
+    Returns (sequence, cut_point) where cut_point is the exact duration to encode.
+    """
+    sequence = list(sequence or [])
+    total = sum(clip["duration"] for clip in sequence)
+    estimates = {}
+    slot = 0
+
+    while target - total > tolerance:
+        remaining = target - total
+        upcoming = [cycle[(slot + k) % len(cycle)] for k in range(tail_slots)]
+        samplers = [get_sampler(folder) for folder, _ in upcoming]
+        horizon = sum(expected_duration(s, used, estimates, candidates) for s in samplers)
+
+        if remaining > horizon:
+            # Far from the target: plain in-order draw
+            folder, keyed = cycle[slot % len(cycle)]
+            clip = clip_entry(samplers[0].draw(used), keyed)
+            sequence.append(clip)
+            total += clip["duration"]
+            slot += 1
+            continue
+
+        pools = [[(path, catalog.get_duration(path)) for path in s.peek(candidates, used)] for s in samplers]
+        picks, tail_total = best_tail(pools, remaining, tolerance)
+        if not picks:
+            raise FileNotFoundError("No clips available to finish the planned sequence.")
+        taken = [(k, path, duration) for k, path, duration in picks if samplers[k].take(path, used)]
+        if len(taken) < len(picks):
+            # Another process reserved one of the picks after the peek: hand back the rest and plan again
+            for k, path, _ in taken:
+                samplers[k].put_back(path, used)
+            continue
+        for k, path, duration in taken:
+            sequence.append({"path": path, "duration": duration, "keyed": upcoming[k][1]})
+        total += tail_total
+        slot += len(picks)
+
+    cut_point = min(target, total)
+    logging.info(f"Planned {len(sequence)} clips totalling {total:.2f}s for a {target}s target (cut at {cut_point:.2f}s)")
+    return sequence, cut_point
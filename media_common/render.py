@@ -0,0 +1,324 @@
+import os
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from media_common import catalog
+from media_common import audio
+from media_common import keyed
+
+QUALITY_SETTINGS = {
+    "Default": "2000k",
+    "High": "4000k",
+    "Higher": "6000k",
+    "Intense": "8000k",
+    "Extreme": "10000k"
+}
+
+COLORKEY_FILTER = keyed.COLORKEY_FILTER
+
+# Encoders the timeline renders can use. h264_nvenc is what every combiner has always used;
+# libx264 is for CPU-only machines, where the segmented render spreads the work over the cores.
+ENCODERS = {
+    "h264_nvenc": ["-c:v", "h264_nvenc", "-preset", "slow"],
+    "libx264": ["-c:v", "libx264", "-preset", "medium", "-pix_fmt", "yuv420p"],
+}
+
+
+def write_concat_list(paths, list_path):
+    """Writes an ffmpeg concat demuxer list, escaping quotes in the paths."""
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+
+def video_encoder_args(quality="Default", encoder="h264_nvenc"):
+    """Encoder settings shared by every render so outputs stay interchangeable."""
+    bitrate = QUALITY_SETTINGS.get(quality, "2000k")
+    return [*ENCODERS[encoder], "-b:v", bitrate]
+
+
+def hwaccel_args(encoder="h264_nvenc"):
+    """Decodes on the GPU only when encoding there too."""
+    return ["-hwaccel", "cuda"] if encoder == "h264_nvenc" else []
+
+
+def run_ffmpeg(command):
+    """Runs ffmpeg, logging its errors and raising CalledProcessError on failure."""
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        logging.error(f"FFmpeg errors:\n{result.stderr}")
+        raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+    return result
+
+
+def metadata_args(metadata):
+    """Turns a dict of tags into -metadata arguments."""
+    args = []
+    for key, value in (metadata or {}).items():
+        args += ["-metadata", f"{key}={value}"]
+    return args
+
+
+def sequence_windows(sequence):
+    """Returns (start, end, keyed) windows for each clip in the foreground sequence."""
+    windows = []
+    position = 0.0
+    for clip in sequence:
+        clip_duration = clip.get("duration") or catalog.get_duration(clip["path"])
+        windows.append((position, position + clip_duration, clip.get("keyed", True)))
+        position += clip_duration
+    return windows
+
+
+def build_overlay_graph(sequence, fg_size, bg_size, zoom=1.0, x_offset=0, y_offset=0, key_filter=COLORKEY_FILTER):
+    """Builds the video half of the graph: background [0:v] with the foreground sequence [1:v] on top.
+
+    Clips flagged keyed=False (the title clips) are overlaid without color keying by
+    splitting the foreground and enabling each overlay only inside its own time windows.
+    """
+    scaled_w = int(fg_size[0] * zoom)
+    scaled_h = int(fg_size[1] * zoom)
+    x = (bg_size[0] - scaled_w) // 2 + x_offset
+    y = (bg_size[1] - scaled_h) // 2 + y_offset
+
+    windows = sequence_windows(sequence)
+    plain = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end, keyed in windows if not keyed)
+
+    parts = [f"[0:v]scale={bg_size[0]}:{bg_size[1]},setsar=1[bg]",
+             f"[1:v]scale={scaled_w}:{scaled_h},setsar=1[fgs]"]
+    if not key_filter:
+        parts.append(f"[bg][fgs]overlay=x={x}:y={y}[video]")
+    elif not plain:
+        parts.append(f"[fgs]{key_filter}[fgk]")
+        parts.append(f"[bg][fgk]overlay=x={x}:y={y}[video]")
+    else:
+        parts.append("[fgs]split=2[fgk_in][fgn]")
+        parts.append(f"[fgk_in]{key_filter}[fgk]")
+        parts.append(f"[bg][fgk]overlay=x={x}:y={y}:enable='not({plain})'[keyed]")
+        parts.append(f"[keyed][fgn]overlay=x={x}:y={y}:enable='{plain}'[video]")
+    return ";\n".join(parts)
+
+
+def build_music_graph(bed_graph, final_audio_volume=0, fg_input=1):
+    """Builds the audio half of the graph: foreground audio [fg_input:a] mixed with the music bed [aud]."""
+    if bed_graph is None:
+        return f"[{fg_input}:a]volume={final_audio_volume}dB[audio]"
+    return (f"{bed_graph};\n"
+            f"[{fg_input}:a][aud]amix=inputs=2:duration=first[mix];\n"
+            f"[mix]volume={final_audio_volume}dB[audio]")
+
+
+def prekey_sequence(sequence, key_filter=COLORKEY_FILTER):
+    """Swaps every clip for its cached alpha asset from media_common.keyed.
+
+    Keyed clips get the key baked in, the title clips become opaque assets of the same
+    format so the concat demuxer can still join them. The overlay then needs no key filter.
+    """
+    items = [(clip["path"], key_filter if clip.get("keyed", True) else None) for clip in sequence]
+    return [dict(clip, path=path) for clip, path in zip(sequence, keyed.keyed_assets(items))]
+
+
+def render_timeline(bg_paths, sequence, output_path, duration, workdir, quality="Default",
+                    bg_music_path=None, bg_music_volume=0, final_audio_volume=0, metadata=None,
+                    zoom=1.0, x_offset=0, y_offset=0, music_crossfade=0, encoder="h264_nvenc", prekeyed=False):
+    """Renders background, foreground sequence, music bed, cut and metadata with a single encode.
+
+    sequence is a list of {"path", "duration", "keyed"} dicts in playback order.
+    With prekeyed=True the clips are read from the keyed asset cache instead of being keyed here.
+    The file is written under a temporary name and renamed once ffmpeg succeeds.
+    """
+    key_filter = COLORKEY_FILTER
+    if prekeyed:
+        sequence, key_filter = prekey_sequence(sequence), None
+
+    bg_list = write_concat_list(bg_paths, os.path.join(workdir, "bg_concat_list.txt"))
+    fg_list = write_concat_list([clip["path"] for clip in sequence], os.path.join(workdir, "concat_list.txt"))
+
+    inputs = ["-f", "concat", "-safe", "0", "-i", bg_list,
+              "-f", "concat", "-safe", "0", "-i", fg_list]
+    bed_graph = None
+    if bg_music_path:
+        bed_inputs, bed_graph = audio.music_bed(bg_music_path, 2, duration, bg_music_volume, music_crossfade)
+        inputs += bed_inputs
+
+    graph = ";\n".join([
+        build_overlay_graph(sequence, catalog.get_resolution(sequence[0]["path"]),
+                            catalog.get_resolution(bg_paths[0]), zoom, x_offset, y_offset, key_filter),
+        build_music_graph(bed_graph, final_audio_volume),
+    ])
+    graph_path = os.path.join(workdir, "timeline_graph.txt")
+    with open(graph_path, "w", encoding="utf-8") as f:
+        f.write(graph)
+
+    temp_output = f"{os.path.splitext(output_path)[0]}.partial.mp4"
+    command = [
+        "ffmpeg", "-loglevel", "error", *hwaccel_args(encoder), *inputs,
+        "-filter_complex_script", graph_path,
+        "-map", "[video]", "-map", "[audio]",
+        *video_encoder_args(quality, encoder), "-c:a", "aac", "-b:a", "192k",
+        "-t", str(duration),
+        *metadata_args(metadata),
+        "-movflags", "+faststart",
+        "-y", temp_output
+    ]
+    logging.info(f"Single-pass render of {len(sequence)} clips over {len(bg_paths)} backgrounds into {output_path}")
+    run_ffmpeg(command)
+
+    os.replace(temp_output, output_path)
+    for scratch in (bg_list, fg_list, graph_path):
+        os.remove(scratch)
+    return output_path
+
+
+def finalize_output(video_path, output_path, duration, bg_music_path=None, bg_music_volume=0,
+                    final_audio_volume=0, metadata=None, music_crossfade=0):
+    """Music mix, cut to `duration`, metadata tags and +faststart for a rendered video in one remux.
+
+    The video stream is copied and only the audio is encoded, so the file is read and
+    written once. It is written under a temporary name and renamed to output_path (the
+    labelled final name) once ffmpeg succeeds.
+    """
+    inputs = ["-i", video_path]
+    bed_graph = None
+    if bg_music_path:
+        bed_inputs, bed_graph = audio.music_bed(bg_music_path, 1, duration, bg_music_volume, music_crossfade)
+        inputs += bed_inputs
+
+    temp_output = f"{os.path.splitext(output_path)[0]}.partial.mp4"
+    command = [
+        "ffmpeg", "-loglevel", "error", *inputs,
+        "-filter_complex", build_music_graph(bed_graph, final_audio_volume, fg_input=0),
+        "-map", "0:v", "-map", "[audio]", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k",
+        "-t", str(duration),
+        *metadata_args(metadata),
+        "-movflags", "+faststart",
+        "-y", temp_output
+    ]
+    logging.info(f"Finalizing {video_path} into {output_path}")
+    run_ffmpeg(command)
+
+    os.replace(temp_output, output_path)
+    return output_path
+
+def split_timeline(sequence, duration, segments, fps=None):
+    """Cuts the timeline at clip boundaries into about `segments` parts of similar length.
+
+    Returns a list of (start, length, clips) with start/length in seconds. Boundaries are
+    snapped to the frame grid when fps is known, and the last part ends exactly at `duration`.
+    """
+    windows = [(start, clip) for (start, _, _), clip in zip(sequence_windows(sequence), sequence) if start < duration]
+    target = duration / max(1, segments)
+
+    groups, current = [], []
+    for start, clip in windows:
+        if current and start >= target * (len(groups) + 1):
+            groups.append(current)
+            current = []
+        current.append((start, clip))
+    groups.append(current)
+
+    def snap(position):
+        return round(position * fps) / fps if fps else position
+
+    parts = []
+    for k, group in enumerate(groups):
+        start = snap(group[0][0])
+        end = snap(groups[k + 1][0][0]) if k + 1 < len(groups) else duration
+        parts.append((start, end - start, [clip for _, clip in group]))
+    return parts
+
+
+def render_timeline_segmented(bg_paths, sequence, output_path, duration, workdir, quality="Default",
+                              bg_music_path=None, bg_music_volume=0, final_audio_volume=0, metadata=None,
+                              zoom=1.0, x_offset=0, y_offset=0, music_crossfade=0, encoder="h264_nvenc",
+                              segments=None, journal=None, prekeyed=False):
+    """Same output as render_timeline, but the video is encoded in parallel segments.
+
+    The timeline is split at clip boundaries and every segment is encoded by its own ffmpeg
+    process with identical encoder settings and closed GOPs, so the parts can be joined
+    with the concat demuxer in copy mode. The audio (foreground mixed with the music bed) is
+    rendered once over the whole timeline, so the seams between segments never click.
+    segments defaults to one per CPU core; NVENC cards cap concurrent sessions, so keep it low there.
+    With a journal (media_common.journal), finished segments and audio are kept in workdir and
+    skipped when a crashed render is run again with the same timeline.
+    """
+    segments = segments or os.cpu_count() or 1
+    key_filter = COLORKEY_FILTER
+    if prekeyed:
+        sequence, key_filter = prekey_sequence(sequence), None
+    first_clip = catalog.probe(sequence[0]["path"])
+    parts = split_timeline(sequence, duration, segments, first_clip.get("fps"))
+    fg_size = (first_clip["width"], first_clip["height"])
+    bg_size = catalog.get_resolution(bg_paths[0])
+    threads = str(max(1, (os.cpu_count() or 1) // len(parts)))
+
+    bg_list = write_concat_list(bg_paths, os.path.join(workdir, "bg_concat_list.txt"))
+    fg_list = write_concat_list([clip["path"] for clip in sequence], os.path.join(workdir, "concat_list.txt"))
+    scratch = [bg_list, fg_list]
+
+    settings = [bg_paths, quality, encoder, zoom, x_offset, y_offset, key_filter]
+    jobs = []
+    for k, (start, length, clips) in enumerate(parts):
+        seg_fg_list = write_concat_list([clip["path"] for clip in clips], os.path.join(workdir, f"segment_{k}_list.txt"))
+        graph_path = os.path.join(workdir, f"segment_{k}_graph.txt")
+        with open(graph_path, "w", encoding="utf-8") as f:
+            f.write(build_overlay_graph(clips, fg_size, bg_size, zoom, x_offset, y_offset, key_filter))
+        segment_path = os.path.join(workdir, f"segment_{k}.mp4")
+        scratch += [seg_fg_list, graph_path, segment_path]
+        jobs.append((f"segment_{k}", [settings, start, length, [clip["path"] for clip in clips]], segment_path, [
+            "ffmpeg", "-loglevel", "error", *hwaccel_args(encoder),
+            "-ss", f"{start:.6f}", "-f", "concat", "-safe", "0", "-i", bg_list,
+            "-f", "concat", "-safe", "0", "-i", seg_fg_list,
+            "-filter_complex_script", graph_path, "-map", "[video]", "-an",
+            *video_encoder_args(quality, encoder), "-flags", "+cgop", "-threads", threads,
+            "-t", f"{length:.6f}", "-y", segment_path
+        ]))
+
+    # The audio runs as one more job next to the video segments, over the full timeline
+    audio_inputs = ["-f", "concat", "-safe", "0", "-i", fg_list]
+    bed_graph = None
+    if bg_music_path:
+        bed_inputs, bed_graph = audio.music_bed(bg_music_path, 1, duration, bg_music_volume, music_crossfade)
+        audio_inputs += bed_inputs
+    audio_path = os.path.join(workdir, "timeline_audio.m4a")
+    scratch.append(audio_path)
+    audio_settings = [[clip["path"] for clip in sequence], duration, bg_music_path,
+                      bg_music_volume, final_audio_volume, music_crossfade]
+    jobs.append(("audio", audio_settings, audio_path, [
+        "ffmpeg", "-loglevel", "error", *audio_inputs,
+        "-filter_complex", build_music_graph(bed_graph, final_audio_volume, fg_input=0),
+        "-map", "[audio]", "-c:a", "aac", "-b:a", "192k", "-t", str(duration), "-y", audio_path
+    ]))
+
+    def encode(job):
+        name, inputs, output, command = job
+        if journal is None:
+            run_ffmpeg(command)
+            return output
+        return journal.stage(name, inputs, lambda: run_ffmpeg(command) and output)
+
+    logging.info(f"Segmented render of {len(sequence)} clips in {len(parts)} parts into {output_path}")
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        # list() re-raises the first ffmpeg failure
+        list(executor.map(encode, jobs))
+
+    segment_list = write_concat_list([os.path.join(workdir, f"segment_{k}.mp4") for k in range(len(parts))],
+                                     os.path.join(workdir, "segments_list.txt"))
+    scratch.append(segment_list)
+    temp_output = f"{os.path.splitext(output_path)[0]}.partial.mp4"
+    run_ffmpeg([
+        "ffmpeg", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", segment_list, "-i", audio_path,
+        "-map", "0:v", "-map", "1:a", "-c", "copy", "-t", str(duration),
+        *metadata_args(metadata),
+        "-movflags", "+faststart",
+        "-y", temp_output
+    ])
+
+    os.replace(temp_output, output_path)
+    for path in scratch:
+        os.remove(path)
+    return output_path
@@ -0,0 +1,184 @@
+import os
+import sys
+import sqlite3
+import logging
+import threading
+import subprocess
+from datetime import datetime
+
+# Clip reservations shared by the worker processes of a batch. One SQLite file serves every
+# batch; override with MEDIA_RESERVATIONS to keep it elsewhere.
+RESERVATIONS_PATH = os.environ.get(
+    "MEDIA_RESERVATIONS",
+    os.path.join(os.path.expanduser("~"), ".media_reservations.sqlite3")
+)
+
+# Set by run_workers() for the processes it starts: "<worker index>/<worker count>/<batch>"
+WORKER_ENV = "MEDIA_ITERATION_WORKER"
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS reservations (
+        batch TEXT NOT NULL,
+        path TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        PRIMARY KEY (batch, path)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS owners (
+        batch TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        PRIMARY KEY (batch, owner)
+    )
+    """,
+]
+
+# Reservations a folder may recycle when it runs dry: the caller's own and those of finished iterations
+RELEASE_WHERE = ("batch = ? AND (owner = ? OR owner NOT IN "
+                 "(SELECT owner FROM owners WHERE batch = ?))")
+
+
+class ClipReservations:
+    """The clips reserved by the iterations of one batch, shared across processes.
+
+    Each iteration draws through its own owner() view; a clip reserved by any
+    iteration of the batch is skipped by every other one. Reservations outlive the
+    iteration that made them (the batch keeps the no-reuse rule of a sequential
+    run), but once an iteration has finished its clips may be recycled by a folder
+    that runs dry, while clips held by iterations still rendering never are.
+    """
+
+    def __init__(self, batch, path=None):
+        self.batch = batch
+        self.path = path or RESERVATIONS_PATH
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+            self.conn.commit()
+
+    def execute(self, sql, params=(), many=False):
+        with self.lock:
+            cursor = self.conn.executemany(sql, params) if many else self.conn.execute(sql, params)
+            rows = cursor.fetchall()
+            self.conn.commit()
+            return rows, cursor.rowcount
+
+    def owner(self, name):
+        """Registers a running iteration and returns the set-like view it draws through."""
+        name = str(name)
+        self.execute("INSERT OR IGNORE INTO owners (batch, owner) VALUES (?, ?)", (self.batch, name))
+        return ReservedClips(self, name)
+
+    def release(self, name):
+        """Marks an iteration finished; its clips stay reserved until a folder needs to recycle them."""
+        self.execute("DELETE FROM owners WHERE batch = ? AND owner = ?", (self.batch, str(name)))
+
+    def clear(self):
+        """Forgets the whole batch."""
+        self.execute("DELETE FROM reservations WHERE batch = ?", (self.batch,))
+        self.execute("DELETE FROM owners WHERE batch = ?", (self.batch,))
+
+
+class ReservedClips:
+    """Set-like view of a batch's reservations, usable wherever the samplers take `used`.
+
+    Membership covers every iteration of the batch. claim() reserves a clip atomically,
+    so two processes racing for the same clip cannot both get it.
+    """
+
+    def __init__(self, reservations, owner):
+        self.reservations = reservations
+        self.owner = owner
+
+    def __contains__(self, path):
+        rows, _ = self.reservations.execute("SELECT 1 FROM reservations WHERE batch = ? AND path = ?",
+                                            (self.reservations.batch, path))
+        return bool(rows)
+
+    def __iter__(self):
+        rows, _ = self.reservations.execute("SELECT path FROM reservations WHERE batch = ?", (self.reservations.batch,))
+        return iter([row[0] for row in rows])
+
+    def __len__(self):
+        rows, _ = self.reservations.execute("SELECT COUNT(*) FROM reservations WHERE batch = ?", (self.reservations.batch,))
+        return rows[0][0]
+
+    def claim(self, path):
+        """Reserves a clip for this owner; False if an iteration of the batch already holds it."""
+        _, inserted = self.reservations.execute(
+            "INSERT OR IGNORE INTO reservations (batch, path, owner) VALUES (?, ?, ?)",
+            (self.reservations.batch, path, self.owner))
+        return inserted == 1
+
+    def add(self, path):
+        self.claim(path)
+
+    def update(self, paths):
+        self.reservations.execute("INSERT OR IGNORE INTO reservations (batch, path, owner) VALUES (?, ?, ?)",
+                                  [(self.reservations.batch, path, self.owner) for path in paths], many=True)
+
+    def discard(self, path):
+        self.reservations.execute("DELETE FROM reservations WHERE batch = ? AND path = ? AND owner = ?",
+                                  (self.reservations.batch, path, self.owner))
+
+    def difference_update(self, paths):
+        """Recycles clips, skipping any still held by another running iteration."""
+        batch = self.reservations.batch
+        self.reservations.execute(f"DELETE FROM reservations WHERE path = ? AND {RELEASE_WHERE}",
+                                  [(path, batch, self.owner, batch) for path in paths], many=True)
+
+    def clear(self):
+        batch = self.reservations.batch
+        self.reservations.execute(f"DELETE FROM reservations WHERE {RELEASE_WHERE}", (batch, self.owner, batch))
+
+
+def worker_slot():
+    """(index, count, batch) when running as one of run_workers()' processes, else None."""
+    value = os.environ.get(WORKER_ENV)
+    if not value:
+        return None
+    index, count, batch = value.split("/", 2)
+    return int(index), int(count), batch
+
+
+def worker_iterations(iterations):
+    """The iteration numbers this process renders: all of them, or every count-th one in a worker.
+
+    Iteration numbers stay global, so output names and journals match a sequential run.
+    """
+    slot = worker_slot()
+    if slot is None:
+        return range(iterations)
+    index, count, _ = slot
+    return range(index, iterations, count)
+
+
+def worker_reservations():
+    """The batch's shared reservations in a worker process, None in a plain sequential run."""
+    slot = worker_slot()
+    return ClipReservations(slot[2]) if slot else None
+
+
+def run_workers(script_path, workers):
+    """Runs `workers` copies of a script side by side, each rendering its share of the iterations.
+
+    The copies are started with the same arguments and working directory, draw their clips
+    through one reservation batch, and are waited for. Returns the exit codes.
+    """
+    batch = f"{os.path.basename(script_path)}-{datetime.now().strftime('%Y%m%d_%H%M%S')}-{os.getpid()}"
+    processes = []
+    for index in range(workers):
+        env = dict(os.environ, **{WORKER_ENV: f"{index}/{workers}/{batch}"})
+        processes.append(subprocess.Popen([sys.executable, os.path.abspath(script_path), *sys.argv[1:]], env=env))
+        logging.info(f"Started iteration worker {index + 1} of {workers} (pid {processes[-1].pid})")
+
+    codes = [process.wait() for process in processes]
+    for index, code in enumerate(codes):
+        if code != 0:
+            logging.error(f"Iteration worker {index + 1} exited with code {code}")
+    ClipReservations(batch).clear()
+    return codes
@@ -0,0 +1,202 @@
+import os
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from media_common import store as media_store
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+# Draw history for scripts that opt in with history_path=DEFAULT_HISTORY_PATH (off by default,
+# every run then starts with a fresh shuffle), so the 2nd/3rd RUN copies keep cycling through
+# clips the others have not shown yet. Override with MEDIA_SAMPLER_HISTORY.
+DEFAULT_HISTORY_PATH = os.environ.get(
+    "MEDIA_SAMPLER_HISTORY",
+    os.path.join(os.path.expanduser("~"), ".media_sampler_history.sqlite3")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS draws (
+    folder TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (folder, path)
+)
+"""
+
+
+class DrawHistory:
+    """SQLite record of the clips drawn in each folder's current cycle, shared by every process."""
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(SCHEMA)
+            self.conn.commit()
+
+    def drawn(self, folder):
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT path FROM draws WHERE folder = ?", (folder,))}
+
+    def add(self, folder, path):
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO draws (folder, path) VALUES (?, ?)", (folder, path))
+            self.conn.commit()
+
+    def remove(self, folder, path):
+        with self.lock:
+            self.conn.execute("DELETE FROM draws WHERE folder = ? AND path = ?", (folder, path))
+            self.conn.commit()
+
+    def reset(self, folder):
+        """Starts a new cycle for the folder."""
+        with self.lock:
+            self.conn.execute("DELETE FROM draws WHERE folder = ?", (folder,))
+            self.conn.commit()
+
+
+class FolderSampler:
+    """Shuffle bag over the files in one folder tree.
+
+    The folder is walked once; every draw pops from a shuffled list, so picking a
+    clip costs O(1) instead of a fresh os.walk. When the bag runs dry it is refilled
+    and reshuffled, and the folder's clips become available again.
+    """
+
+    def __init__(self, folder, extensions=VIDEO_EXTENSIONS, history_path=None):
+        self.folder = folder
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.lock = threading.Lock()
+        # Copies of the same stored asset (media_common.store) count as one clip
+        self.files = media_store.unique([os.path.join(root, f)
+                                         for root, _, files in os.walk(folder)
+                                         for f in files if f.lower().endswith(self.extensions)])
+        self.history = get_history(history_path) if history_path else None
+        self.history_key = hashlib.sha1(f"{os.path.abspath(folder)}|{'|'.join(self.extensions)}".encode("utf-8")).hexdigest()[:16]
+        self.bag = []
+        self.fill(self.load_history())
+
+    def load_history(self):
+        """Returns the clips already drawn in the current cycle by earlier runs."""
+        return self.history.drawn(self.history_key) if self.history else set()
+
+    def fill(self, drawn=()):
+        """Refills the bag with every clip not yet drawn in this cycle, shuffled."""
+        drawn = set(drawn)
+        self.bag = [path for path in self.files if path not in drawn]
+        if not self.bag and self.files:
+            # Everything was shown by earlier runs: start a new cycle
+            self.bag = list(self.files)
+            self.reset_history()
+        random.shuffle(self.bag)
+
+    def reset_history(self):
+        if self.history:
+            self.history.reset(self.history_key)
+
+    def record(self, path):
+        if self.history:
+            self.history.add(self.history_key, path)
+
+    def draw(self, used=None):
+        """Returns the next clip, skipping anything in `used` and adding the pick to it.
+
+        Skipped clips stay out of the bag until the next refill, so the cost of
+        skipping is paid once per clip per cycle.
+        """
+        with self.lock:
+            if not self.files:
+                raise FileNotFoundError(f"No videos found in {self.folder}.")
+            refilled = False
+            while True:
+                while self.bag:
+                    path = self.bag.pop()
+                    if used is None or claim(used, path):
+                        self.record(path)
+                        return path
+                if refilled:
+                    raise FileNotFoundError(f"No more unused videos found in {self.folder}. All videos have been used.")
+                logging.info(f"All videos in {self.folder} have been used once. Reshuffling and starting a new loop.")
+                if used is not None:
+                    used.difference_update(self.files)
+                self.reset_history()
+                self.fill()
+                refilled = True
+
+    def peek(self, count, used=None):
+        """Returns up to `count` upcoming clips without drawing them (used by the clip planner)."""
+        with self.lock:
+            if not any(used is None or path not in used for path in self.bag):
+                if used is not None:
+                    used.difference_update(self.files)
+                self.reset_history()
+                self.fill()
+            upcoming = []
+            for path in reversed(self.bag):
+                if used is None or path not in used:
+                    upcoming.append(path)
+                    if len(upcoming) == count:
+                        break
+            return upcoming
+
+    def take(self, path, used=None):
+        """Draws a specific clip previously returned by peek().
+
+        Returns None if another process reserved the clip since the peek (shared `used` only).
+        """
+        with self.lock:
+            self.bag.remove(path)
+            if used is not None and not claim(used, path):
+                return None
+            self.record(path)
+            return path
+
+    def put_back(self, path, used=None):
+        """Undoes a take(): the clip is the next one out of the bag again and is no longer reserved."""
+        with self.lock:
+            self.bag.append(path)
+            if self.history:
+                self.history.remove(self.history_key, path)
+            if used is not None:
+                used.discard(path)
+
+
+def claim(used, path):
+    """Adds a clip to `used`, returning False if it was already there.
+
+    A plain set is checked in-process; shared reservation sets (media_common.reservations)
+    do the check and the insert atomically across processes.
+    """
+    if hasattr(used, "claim"):
+        return used.claim(path)
+    if path in used:
+        return False
+    used.add(path)
+    return True
+
+
+_samplers = {}
+_samplers_lock = threading.Lock()
+_histories = {}
+_histories_lock = threading.Lock()
+
+
+def get_history(path=DEFAULT_HISTORY_PATH):
+    """Returns the process-wide draw history stored at `path`, opening it on first use."""
+    path = os.path.abspath(path)
+    with _histories_lock:
+        if path not in _histories:
+            _histories[path] = DrawHistory(path)
+        return _histories[path]
+
+
+def get_sampler(folder, extensions=VIDEO_EXTENSIONS, history_path=None):
+    """Returns the process-wide sampler for a folder, indexing it on first use."""
+    key = (os.path.abspath(folder), tuple(extensions), history_path)
+    with _samplers_lock:
+        if key not in _samplers:
+            _samplers[key] = FolderSampler(folder, extensions, history_path)
+        return _samplers[key]
@@ -0,0 +1,299 @@
+import os
+import csv
+import json
+import shutil
+import logging
+import tempfile
+from fractions import Fraction
+
+from media_common import catalog
+from media_common import render
+
+# How split_video() cuts:
+#   "copy"  - stream copy, no decode at all; each chunk starts at the first keyframe at or after
+#             its boundary, so chunks are only as exact as the source's keyframe spacing.
+#   "exact" - one decode and one encode of the whole file, with keyframes forced at every
+#             boundary, so every chunk is exactly chunk_duration long (to the frame).
+SPLIT_MODES = ("copy", "exact")
+
+# Encoders for "exact" mode. Forced keyframes are made IDR frames so each chunk plays on its own.
+SEGMENT_ENCODERS = {
+    "h264_nvenc": ["-c:v", "h264_nvenc", "-forced-idr", "1"],
+    "libx264": ["-c:v", "libx264", "-preset", "medium", "-pix_fmt", "yuv420p"],
+}
+
+# Lets a forced keyframe land a hair before its boundary (timestamp rounding) and still start the chunk
+BOUNDARY_DELTA = 0.05
+
+# Smart cuts re-encode only the partial GOPs at the two cut points, on the CPU since they are short.
+# The source's profile, level, pixel format and colour tags are matched so the pieces join into
+# one stream; sources in other codecs raise SmartCutUnsupported.
+SMART_CUT_ENCODERS = {
+    "h264": ["-c:v", "libx264", "-preset", "medium"],
+    "hevc": ["-c:v", "libx265", "-preset", "medium"],
+}
+SMART_CUT_CRF = 18
+# The joined stream carries parameter sets from two encoders, so the MP4 sample entry must allow
+# them in-band (avc3/hev1) rather than promising a single set in the header (avc1/hvc1).
+SAMPLE_ENTRY_TAGS = {"h264": "avc3", "hevc": "hev1"}
+PROFILES = {
+    "Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high",
+    "High 10": "high10", "High 4:2:2": "high422", "Main 10": "main10",
+}
+COLOR_OPTIONS = {"color_primaries": "-color_primaries", "color_transfer": "-color_trc",
+                 "color_space": "-colorspace", "color_range": "-color_range"}
+# NAL unit types a stream copy can start at: H.264 IDR frames, HEVC IDR frames plus their RADL
+# leading pictures (kept so IDRs that have them can be told apart). Recovery-point I-frames
+# (x264 --open-gop) and HEVC CRA frames are flagged as keyframes too, but the frames around them
+# depend on the GOP before, so they are never cut at.
+CUT_POINT_UNITS = {"h264": "5", "hevc": "6-7|19-20"}
+KEYFRAME_WINDOW = 30  # Seconds of packets read after the start and before the end to find the cut keyframes
+TIME_EPSILON = 0.001
+
+
+def segment_pattern(input_file, output_folder, extension=".mp4"):
+    """The splitters' <name>_Part<n> file names as a segment muxer pattern."""
+    base = os.path.splitext(os.path.basename(input_file))[0].replace("%", "%%")
+    return os.path.join(output_folder, f"{base}_Part%d{extension}")
+
+
+def split_command(input_file, pattern, chunk_duration, mode="copy", encoder="h264_nvenc", list_path=None):
+    """ffmpeg command that reads the input once and writes every chunk through the segment muxer."""
+    if mode == "copy":
+        command = ["ffmpeg", "-y", "-i", input_file, "-c", "copy"]
+    elif mode == "exact":
+        hwaccel = render.hwaccel_args(encoder)
+        if hwaccel:
+            hwaccel += ["-hwaccel_output_format", "cuda"]  # Frames stay on the GPU between decoder and encoder
+        command = [
+            "ffmpeg", "-y", *hwaccel, "-i", input_file,
+            *SEGMENT_ENCODERS[encoder],
+            "-force_key_frames", f"expr:gte(t,n_forced*{chunk_duration})",
+            "-c:a", "copy",
+            "-segment_time_delta", str(BOUNDARY_DELTA),
+        ]
+    else:
+        raise ValueError(f"Unknown split mode '{mode}', expected one of {SPLIT_MODES}")
+
+    command += ["-f", "segment", "-segment_time", str(chunk_duration),
+                "-reset_timestamps", "1", "-segment_start_number", "1"]
+    if list_path:
+        command += ["-segment_list", list_path, "-segment_list_type", "csv"]
+    return command + [pattern]
+
+
+def read_segment_list(list_path, output_folder):
+    """(path, start, end) for each chunk written, from the muxer's CSV list."""
+    chunks = []
+    with open(list_path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) >= 3:
+                chunks.append((os.path.join(output_folder, row[0]), float(row[1]), float(row[2])))
+    return chunks
+
+
+def split_video(input_file, output_folder, chunk_duration, mode="copy", encoder="h264_nvenc"):
+    """Splits a video into chunk_duration pieces in a single ffmpeg run; returns [(path, start, end)].
+
+    Replaces one ffmpeg per chunk, each decoding from the start of the file up to its chunk,
+    with one pass over the input however many chunks there are. Chunks are named
+    <name>_Part1.mp4, <name>_Part2.mp4, ... like before; the last one holds the remainder.
+    Raises CalledProcessError if ffmpeg fails.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    pattern = segment_pattern(input_file, output_folder)
+    handle, list_path = tempfile.mkstemp(suffix=".csv", dir=output_folder)
+    os.close(handle)
+    try:
+        render.run_ffmpeg(split_command(input_file, pattern, chunk_duration, mode, encoder, list_path))
+        chunks = read_segment_list(list_path, output_folder)
+    finally:
+        os.remove(list_path)
+    logging.info(f"Split {os.path.basename(input_file)} into {len(chunks)} chunks ({mode})")
+    return chunks
+
+
+class SmartCutUnsupported(ValueError):
+    """The source cannot be smart-cut (no video stream, or a codec without a matching encoder)."""
+
+
+def cut_points(path, codec, start=0.0, duration=None):
+    """Presentation times the first video stream can be cut at, from the packets (nothing is decoded).
+
+    The video is stream copied through the filter_units bitstream filter, which keeps only the
+    CUT_POINT_UNITS packets. A kept packet is a cut point when every packet before it in decode
+    order is shown before it and every packet after it is shown after it, which rules out IDR
+    frames with leading pictures. Reads `duration` seconds from `start` (to the end for None).
+    """
+    command = ["ffmpeg", "-v", "error", "-copyts", "-ss", str(start)]
+    if duration is not None:
+        command += ["-t", str(duration)]
+    command += ["-i", path, "-map", "0:v:0", "-c", "copy",
+                "-bsf:v", f"filter_units=pass_types={CUT_POINT_UNITS[codec]}", "-f", "framecrc", "-"]
+    time_base, packets = None, []
+    for line in render.run_ffmpeg(command).stdout.splitlines():
+        if line.startswith("#tb 0:"):
+            time_base = Fraction(line.partition(":")[2].strip())
+        elif not line.startswith("#"):
+            fields = [field.strip() for field in line.split(",")]  # stream, dts, pts, duration, size, crc
+            if len(fields) >= 3 and fields[2].lstrip("-").isdigit():
+                packets.append(float(int(fields[2]) * time_base))
+
+    shown_after = [float("inf")] * (len(packets) + 1)  # Earliest pts among the packets after each one
+    for i in range(len(packets) - 1, -1, -1):
+        shown_after[i] = min(packets[i], shown_after[i + 1])
+    times = set()
+    shown_before = float("-inf")
+    for i, pts in enumerate(packets):
+        if shown_before < pts < shown_after[i + 1]:
+            times.add(pts)
+        shown_before = max(shown_before, pts)
+    return sorted(times)
+
+
+def cut_keyframes(path, codec, start, end):
+    """(first cut point at or after start, last cut point at or before end), either None if there is none.
+
+    Only KEYFRAME_WINDOW seconds around each cut are read, unless the GOPs are longer than that.
+    """
+    def nearest(times):
+        inside = [t for t in times if start - TIME_EPSILON <= t <= end + TIME_EPSILON]
+        return (inside[0], inside[-1]) if inside else (None, None)
+
+    end_window = max(0.0, end - KEYFRAME_WINDOW)
+    times = set(cut_points(path, codec, start, KEYFRAME_WINDOW))
+    times.update(cut_points(path, codec, end_window, end - end_window + BOUNDARY_DELTA))
+    first_key, last_key = nearest(sorted(times))
+    if first_key is None or first_key > start + KEYFRAME_WINDOW or last_key < end - KEYFRAME_WINDOW:
+        first_key, last_key = nearest(cut_points(path, codec, start, end - start + BOUNDARY_DELTA))
+    return first_key, last_key
+
+
+def snap_to_frame(time, fps):
+    """Rounds a cut time to the nearest frame boundary, so every piece holds whole frames."""
+    return round(time * fps) / fps if fps else time
+
+
+def plan_pieces(start, end, duration, first_key, last_key):
+    """Splits [start, end) into ("encode", start, end) ends and a ("copy", start, end) middle that runs keyframe to keyframe."""
+    if first_key is None or first_key >= end - TIME_EPSILON:
+        return [("encode", start, end)]  # The whole cut lies inside one GOP
+    pieces = []
+    if first_key - start > TIME_EPSILON:
+        pieces.append(("encode", start, first_key))
+    copy_end = duration if end >= duration - TIME_EPSILON else last_key
+    if copy_end - first_key > TIME_EPSILON:
+        pieces.append(("copy", first_key, copy_end))
+    if end - copy_end > TIME_EPSILON:
+        pieces.append(("encode", copy_end, end))
+    return pieces
+
+
+def matching_encoder_args(video, crf=SMART_CUT_CRF):
+    """Encoder settings for a piece that has to join the source's own video stream."""
+    codec = video.get("codec_name")
+    if codec not in SMART_CUT_ENCODERS:
+        raise SmartCutUnsupported(f"No smart-cut encoder for {codec} video")
+    args = [*SMART_CUT_ENCODERS[codec], "-crf", str(crf)]
+    if video.get("pix_fmt"):
+        args += ["-pix_fmt", video["pix_fmt"]]
+    if video.get("profile") in PROFILES:
+        args += ["-profile:v", PROFILES[video["profile"]]]
+    if codec == "h264" and (video.get("level") or 0) > 0:
+        args += ["-level", f"{video['level'] / 10:.1f}"]
+    for key, option in COLOR_OPTIONS.items():
+        if video.get(key) and video[key] != "unknown":
+            args += [option, video[key]]
+    return args
+
+
+def encode_piece(input_file, piece_path, start, end, encoder_args):
+    """Re-encodes [start, end) of the video stream; decoding starts at the keyframe before `start`."""
+    render.run_ffmpeg([
+        "ffmpeg", "-y", "-ss", str(start), "-i", input_file, "-t", str(end - start),
+        "-map", "0:v:0", *encoder_args, "-fps_mode", "passthrough", "-an", "-f", "mpegts", piece_path,
+    ])
+
+
+def copy_piece(input_file, piece_path, start, end, to_end):
+    """Stream-copies the video from keyframe `start` to keyframe `end` (or to the end of the file)."""
+    command = ["ffmpeg", "-y", "-ss", str(start), "-i", input_file, "-map", "0:v:0", "-c", "copy"]
+    if to_end:
+        render.run_ffmpeg(command + ["-f", "mpegts", piece_path])
+        return
+    # Cutting exactly on the keyframe at `end` needs the segment muxer; the second segment is dropped
+    pattern = piece_path.replace(".ts", "_%d.ts")
+    render.run_ffmpeg(command + [
+        "-f", "segment", "-segment_format", "mpegts", "-segment_times", str(end - start),
+        "-segment_time_delta", str(BOUNDARY_DELTA), "-reset_timestamps", "1", pattern,
+    ])
+    os.replace(pattern % 0, piece_path)
+
+
+def write_piece_list(pieces, list_path):
+    """Concat demuxer list of the pieces, with their exact durations so no gaps creep in at the joins."""
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path, duration in pieces:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\nduration {duration:.6f}\n")
+    return list_path
+
+
+def smart_trim(input_file, output_file, start=0.0, end=None, crf=SMART_CUT_CRF):
+    """Trims a video to [start, end) frame-accurately, re-encoding only the GOPs the cuts fall into.
+
+    Both cuts are rounded to the nearest frame. The video from the first cut point after `start`
+    to the last one before `end` is stream copied; only the frames between each cut and its
+    neighbouring cut point are encoded, with the source's encoder parameters. The pieces are
+    joined as MPEG-TS, which carries each piece's parameter sets in-band, and the audio is
+    decoded and trimmed to the sample, then encoded to AAC in the final mux, written next to
+    the work files and moved onto `output_file` only once complete. `end` None keeps everything after `start`.
+    Returns the pieces as (kind, start, end). Raises SmartCutUnsupported for sources it
+    cannot cut and CalledProcessError if ffmpeg fails.
+    """
+    entry = catalog.probe(input_file)
+    duration = entry["duration"]
+    start = snap_to_frame(start, entry["fps"])
+    end = duration if end is None else min(snap_to_frame(end, entry["fps"]), duration)
+    if end - start <= TIME_EPSILON:
+        raise ValueError(f"Nothing left of {input_file} between {start} and {end}")
+    streams = json.loads(entry["probe_json"]).get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if video is None:
+        raise SmartCutUnsupported(f"{input_file} has no video stream")
+    encoder_args = matching_encoder_args(video, crf)
+
+    plan = plan_pieces(start, end, duration, *cut_keyframes(input_file, video["codec_name"], start, end))
+    work_dir = tempfile.mkdtemp(prefix=".smartcut_", dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        pieces = []
+        for number, (kind, piece_start, piece_end) in enumerate(plan):
+            piece_path = os.path.join(work_dir, f"piece{number}.ts")
+            if kind == "copy":
+                copy_piece(input_file, piece_path, piece_start, piece_end, piece_end >= duration)
+            else:
+                encode_piece(input_file, piece_path, piece_start, piece_end, encoder_args)
+            pieces.append((piece_path, piece_end - piece_start))
+        list_path = write_piece_list(pieces, os.path.join(work_dir, "pieces.txt"))
+
+        audio_args = []
+        if audio:
+            audio_args = ["-c:a", "aac", "-b:a", audio.get("bit_rate") or "192k"]
+            if audio.get("sample_rate"):
+                audio_args += ["-ar", str(audio["sample_rate"])]
+        temp_output = os.path.join(work_dir, "output" + (os.path.splitext(output_file)[1] or ".mp4"))
+        render.run_ffmpeg([
+            "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+            "-ss", str(start), "-t", str(end - start), "-i", input_file,
+            "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy",
+            "-tag:v", SAMPLE_ENTRY_TAGS[video["codec_name"]], *audio_args,
+            "-movflags", "+faststart", temp_output,
+        ])
+        os.replace(temp_output, output_file)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    encoded = sum(piece_end - piece_start for kind, piece_start, piece_end in plan if kind == "encode")
+    logging.info(f"Smart-cut {os.path.basename(input_file)}: {encoded:.2f}s of {end - start:.2f}s re-encoded")
+    return plan
@@ -0,0 +1,246 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+
+# Content-addressed store: every unique asset is kept once as objects/<hash[:2]>/<hash><ext>,
+# and the category folders hold hardlinks to it. Hardlinks only work within one volume, so
+# point MEDIA_STORE_DIR at the dataset drive (e.g. E:\.media_store); across volumes the
+# folders get plain copies and only the probing/normalizing is deduplicated.
+STORE_DIR = os.environ.get(
+    "MEDIA_STORE_DIR",
+    os.path.join(os.path.expanduser("~"), ".media_store")
+)
+INDEX_NAME = "index.sqlite3"
+READ_CHUNK = 1024 * 1024
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS links (
+        path TEXT PRIMARY KEY,
+        hash TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        url TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS links_hash ON links (hash)",
+]
+
+
+class HashingWriter:
+    """Wraps a binary file, hashing the bytes as they are written (or as an existing prefix is fed in)."""
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def feed(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+
+    def feed_file(self, path):
+        """Hashes what is already in a file, e.g. the part of a download kept for resuming."""
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                self.feed(chunk)
+
+    def write(self, data):
+        self.feed(data)
+        return self.file.write(data)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def hash_file(path):
+    """(sha256, size) of a file, read in chunks."""
+    hasher = HashingWriter(None)
+    hasher.feed_file(path)
+    return hasher.hexdigest(), hasher.size
+
+
+def place(blob, dest):
+    """Makes `dest` the same file as `blob`: a hardlink, or a copy when the volumes differ."""
+    if os.path.exists(dest) and os.path.samefile(blob, dest):
+        return dest
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    temp_path = f"{dest}.link"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(blob, temp_path)
+    except OSError:
+        shutil.copyfile(blob, temp_path)
+    os.replace(temp_path, dest)
+    return dest
+
+
+class MediaStore:
+    """Blobs by SHA-256 plus an index of the folder paths that point at them.
+
+    A path stays mapped to its blob while it keeps the size and mtime it had when it was
+    linked; canonical() and unique() use that to treat duplicates under different names
+    and folders as one asset.
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        os.makedirs(os.path.join(store_dir, "objects"), exist_ok=True)
+        self.store_dir = store_dir
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(store_dir, INDEX_NAME), timeout=60, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+            self.conn.commit()
+
+    def blob_path(self, digest, extension=""):
+        return os.path.join(self.store_dir, "objects", digest[:2], f"{digest}{extension.lower()}")
+
+    def blob(self, digest):
+        """The stored blob for a hash, or None."""
+        with self.lock:
+            row = self.conn.execute("SELECT path FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        return row[0] if row and os.path.exists(row[0]) else None
+
+    def add(self, temp_path, digest, extension=""):
+        """Moves a finished file (hashed while it was written) into the store; a duplicate is just dropped."""
+        existing = self.blob(digest)
+        if existing:
+            os.remove(temp_path)
+            return existing
+        blob = self.blob_path(digest, extension)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        os.replace(temp_path, blob)
+        self.record_blob(digest, blob)
+        return blob
+
+    def record_blob(self, digest, blob):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO blobs (hash, path, size, created) VALUES (?, ?, ?, ?)",
+                              (digest, blob, os.path.getsize(blob), time.time()))
+            self.conn.commit()
+
+    def link(self, digest, dest, url=None):
+        """Places the blob at `dest` and records the mapping."""
+        place(self.blob(digest), dest)
+        stat = os.stat(dest)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO links (path, hash, size, mtime_ns, url) VALUES (?, ?, ?, ?, ?)",
+                              (os.path.abspath(dest), digest, stat.st_size, stat.st_mtime_ns, url))
+            self.conn.commit()
+        return dest
+
+    def put_file(self, path, url=None):
+        """Takes an existing file into the store; a duplicate of a stored asset becomes a link to it."""
+        digest, _ = hash_file(path)
+        if not self.blob(digest):
+            blob = self.blob_path(digest, os.path.splitext(path)[1])
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            place(path, blob)
+            self.record_blob(digest, blob)
+        self.link(digest, path, url)
+        return digest
+
+    def hash_of(self, path):
+        """Hash of a linked path, or None if it is unknown or changed since it was linked."""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            row = self.conn.execute("SELECT hash, size, mtime_ns FROM links WHERE path = ?", (path,)).fetchone()
+        if row is None or (row[1], row[2]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return row[0]
+
+    def canonical(self, path):
+        """The blob a path holds, so duplicates are probed and normalized as one file; else the path."""
+        digest = self.hash_of(path)
+        return (digest and self.blob(digest)) or path
+
+    def unique(self, paths):
+        """Drops paths holding the same asset as an earlier one in the list."""
+        seen, result = set(), []
+        for path in paths:
+            digest = self.hash_of(path)
+            if digest is not None:
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            result.append(path)
+        return result
+
+
+_default_store = None
+_store_lock = threading.Lock()
+
+
+def default_store():
+    """Returns the process-wide store, opening it on first use."""
+    global _default_store
+    with _store_lock:
+        if _default_store is None:
+            _default_store = MediaStore()
+        return _default_store
+
+
+def existing_store():
+    """The default store if one has been created, without creating it (for read-only lookups)."""
+    if _default_store is None and not os.path.exists(os.path.join(STORE_DIR, INDEX_NAME)):
+        return None
+    return default_store()
+
+
+def canonical(path):
+    store = existing_store()
+    return store.canonical(path) if store else path
+
+
+def unique(paths):
+    store = existing_store()
+    return store.unique(paths) if store else list(paths)
+
+
+def put_file(path, url=None):
+    return default_store().put_file(path, url)
+
+
+def dedupe_folder(folder):
+    """Takes every file under a folder into the store; returns (files, unique assets)."""
+    digests = set()
+    count = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                digests.add(put_file(path))
+                count += 1
+            except OSError as e:
+                logging.warning(f"Could not store {path}: {e}")
+    return count, len(digests)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Replace duplicate files under dataset folders with links to one stored copy, e.g.
+    # python -m media_common.store "E:\Dataset\PEXELS"
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for folder in sys.argv[1:]:
+        files, assets = dedupe_folder(folder)
+        logging.info(f"{folder}: {files} files, {assets} unique assets")
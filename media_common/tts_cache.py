@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import sqlite3
+import logging
+import threading
+import unicodedata
+
+from media_common import catalog
+
+# Synthesized speech, keyed by what was sent to the TTS API. Shared by every script so a rerun
+# of a failed batch, or the same quote in another batch, is not billed again.
+# Override with MEDIA_TTS_CACHE; MEDIA_TTS_CACHE_MAX_BYTES caps its size (least recently used go first).
+TTS_CACHE_DIR = os.environ.get(
+    "MEDIA_TTS_CACHE",
+    os.path.join(os.path.expanduser("~"), ".media_tts_cache")
+)
+MAX_CACHE_BYTES = int(os.environ.get("MEDIA_TTS_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+INDEX_NAME = "index.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS speech (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    voice_id TEXT,
+    model_id TEXT,
+    characters INTEGER,
+    duration REAL,
+    audio_codec TEXT,
+    sample_rate INTEGER,
+    channels INTEGER,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def normalize_text(text):
+    """Text as it is keyed: NFC, Unix line endings, no trailing spaces on lines or at the ends."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+
+def cache_key(voice_id, model_id, voice_settings, text):
+    """Hash of everything that changes the synthesized audio."""
+    payload = json.dumps([voice_id, model_id, voice_settings or {}, normalize_text(text)],
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Content-addressed store of synthesized MP3s with an SQLite index and LRU eviction.
+
+    Each entry keeps the probe results of its MP3 (duration, codec, sample rate), so a
+    cached file is known to be playable audio. Hits and misses are counted per process
+    for report().
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "characters_saved": 0, "evicted": 0}
+        self.conn = sqlite3.connect(os.path.join(cache_dir, INDEX_NAME), timeout=60, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(SCHEMA)
+            self.conn.commit()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.mp3")
+
+    def lookup(self, key):
+        """Returns the cached entry and marks it used, or None (dropping entries whose file is gone)."""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM speech WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row["path"]):
+                self.conn.execute("DELETE FROM speech WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE speech SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return dict(row)
+
+    def store(self, key, source_path, voice_id=None, model_id=None, characters=None):
+        """Copies a freshly synthesized MP3 into the cache; returns False if it does not probe as audio."""
+        try:
+            entry = catalog.probe(source_path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Not caching {source_path}: {e}")
+            return False
+        if entry["audio_codec"] is None or not entry["duration"]:
+            logging.warning(f"Not caching {source_path}: no audio stream")
+            return False
+
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.partial"
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, path)
+
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO speech (key, path, size, voice_id, model_id, characters, duration, "
+                "audio_codec, sample_rate, channels, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, path, os.path.getsize(path), voice_id, model_id, characters, entry["duration"],
+                 entry["audio_codec"], entry["sample_rate"], entry["channels"], now, now)
+            )
+            self.conn.commit()
+        self.evict()
+        return True
+
+    def evict(self):
+        """Drops least recently used entries until the cache fits in max_bytes."""
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM speech").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self.conn.execute("SELECT key, path, size FROM speech ORDER BY last_used").fetchall()
+            for row in rows:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(row["path"])
+                except FileNotFoundError:
+                    pass
+                self.conn.execute("DELETE FROM speech WHERE key = ?", (row["key"],))
+                total -= row["size"]
+                self.stats["evicted"] += 1
+            self.conn.commit()
+
+    def fetch(self, output_path, voice_id, text, synthesize, model_id=None, voice_settings=None):
+        """Writes the speech for this request to output_path, calling the API only on a miss.
+
+        synthesize(path) performs the request, writes the MP3 to `path` and returns a truthy
+        value on success. Returns output_path, or None if synthesize failed.
+        """
+        key = cache_key(voice_id, model_id, voice_settings, text)
+        entry = self.lookup(key)
+        if entry:
+            shutil.copyfile(entry["path"], output_path)
+            with self.lock:
+                self.stats["hits"] += 1
+                self.stats["characters_saved"] += len(text)
+            logging.info(f"TTS cache hit for {output_path} ({len(text)} characters not billed)")
+            return output_path
+
+        with self.lock:
+            self.stats["misses"] += 1
+        if not synthesize(output_path) or not os.path.exists(output_path):
+            return None
+        self.store(key, output_path, voice_id, model_id, len(text))
+        return output_path
+
+    def report(self):
+        """One-line summary of this run's hits and misses and of the cache's size."""
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM speech").fetchone()
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        rate = 100 * stats["hits"] / lookups if lookups else 0
+        return (f"TTS cache: {stats['hits']} hits, {stats['misses']} misses ({rate:.0f}% hit rate), "
+                f"{stats['characters_saved']} characters not billed, {stats['evicted']} evicted; "
+                f"{entries} entries, {size / 1024 ** 2:.1f} MB of {self.max_bytes / 1024 ** 2:.0f} MB")
+
+
+_default_cache = None
+_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """Returns the process-wide TTS cache, opening it on first use."""
+    global _default_cache
+    with _cache_lock:
+        if _default_cache is None:
+            _default_cache = TTSCache()
+        return _default_cache
+
+
+def fetch(output_path, voice_id, text, synthesize, model_id=None, voice_settings=None):
+    """TTSCache.fetch on the default cache."""
+    return default_cache().fetch(output_path, voice_id, text, synthesize, model_id, voice_settings)
+
+
+def report():
+    return default_cache().report()
+
+
+if __name__ == "__main__":
+    # Show the cache's size, e.g. python -m media_common.tts_cache
+    print(report())
@@ -0,0 +1,63 @@
+import os
+import shutil
+import logging
+import tempfile
+
+# Where job workspaces are created. Point MEDIA_SCRATCH_DIR at a tmpfs / RAM disk to keep
+# scratch I/O off the dataset drives; by default they go under ./scratch next to the outputs.
+SCRATCH_ROOT = os.environ.get("MEDIA_SCRATCH_DIR", os.path.join(os.getcwd(), "scratch"))
+
+
+class JobWorkspace:
+    """A unique scratch directory for one render iteration or task.
+
+    Every job gets its own folder, so several combiners (or the GPUID0 and GPUID1
+    copies, or several worker threads) can run side by side from the same folder
+    without overwriting each other's concat lists and intermediate files.
+    The folder is removed on success and kept on failure for inspection.
+
+    Usage:
+        with JobWorkspace("iteration_1_") as job:
+            list_path = job.file("concat_list.txt")
+    or, without re-indenting a long loop body, create it and call cleanup() on success.
+    Pass path= to reopen a workspace kept by a failed run (see media_common.journal).
+    """
+
+    def __init__(self, prefix="job_", root=None, path=None):
+        if path and os.path.isdir(path):
+            self.path = path
+            logging.info(f"Reusing scratch workspace {self.path}")
+            return
+        root = root or SCRATCH_ROOT
+        os.makedirs(root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=root)
+        logging.debug(f"Created scratch workspace {self.path}")
+
+    def file(self, name):
+        """Returns the path of a scratch file inside this workspace."""
+        return os.path.join(self.path, name)
+
+    def cleanup(self):
+        """Removes the workspace and everything in it."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        logging.debug(f"Removed scratch workspace {self.path}")
+
+    def keep(self):
+        """Leaves the workspace on disk after a failure and logs where it is."""
+        logging.warning(f"Keeping scratch workspace for inspection: {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.cleanup()
+        else:
+            self.keep()
+        return False
+
+
+def move_into_place(source, destination):
+    """Moves a finished file out of a workspace, even when the workspace is on another drive."""
+    shutil.move(source, destination)
+    return destination